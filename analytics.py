@@ -0,0 +1,129 @@
+from models import BreakSchedule, BudgetType, Ledger, UserData, BUDGET_TYPES, LEDGER_EPOCH, UNKNOWN_BUDGET_TYPE_CODE, fromCents
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Final, Optional
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MICROSECONDS_PER_DAY: Final[int] = 24 * 60 * 60 * 1_000_000
+EPOCH_WEEKDAY: Final[int] = LEDGER_EPOCH.weekday()
+BURN_RATE_DAYS: Final[int] = 30
+WEEKDAY_NAMES: Final[tuple[str, ...]] = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+@dataclass
+class SpendingStats:
+    spentLast7Days: float = 0.0
+    spentLast30Days: float = 0.0
+    dailyBurnRate: float = 0.0
+    spentByType: dict[Optional[BudgetType], float] = field(default_factory=dict)
+    averageByWeekday: list[float] = field(default_factory=lambda: [0.0] * 7)
+    projectedRunOut: Optional[date] = None
+
+# Both implementations aggregate straight over the ledger's columns, NumPy views the arrays without copying them.
+# The views are dropped before returning, an array cannot grow while a view of it is alive
+
+def sumSpentNumPy(ledger: Ledger, low: int, high: int) -> float:
+    amounts = numpy.frombuffer(ledger.amounts, dtype=numpy.int64)[low:high]
+    return fromCents(int(-amounts[amounts < 0].sum()))
+
+def sumSpentByTypeNumPy(ledger: Ledger, low: int, high: int) -> list[float]:
+    amounts = numpy.frombuffer(ledger.amounts, dtype=numpy.int64)[low:high]
+    codes = numpy.frombuffer(ledger.budgetTypeCodes, dtype=numpy.int8)[low:high]
+
+    # Unknown budget types are code -1, shifted to bucket 0
+    totals = numpy.bincount(codes.astype(numpy.int64) + 1, weights=numpy.where(amounts < 0, -amounts, 0), minlength=len(BUDGET_TYPES) + 1)
+    return [fromCents(int(total)) for total in totals]
+
+def sumSpentByWeekdayNumPy(ledger: Ledger, low: int, high: int) -> list[float]:
+    amounts = numpy.frombuffer(ledger.amounts, dtype=numpy.int64)[low:high]
+    timestamps = numpy.frombuffer(ledger.timestamps, dtype=numpy.int64)[low:high]
+
+    weekdays = (timestamps // MICROSECONDS_PER_DAY + EPOCH_WEEKDAY) % 7
+    totals = numpy.bincount(weekdays, weights=numpy.where(amounts < 0, -amounts, 0), minlength=7)
+    return [fromCents(int(total)) for total in totals]
+
+def sumSpentPython(ledger: Ledger, low: int, high: int) -> float:
+    return fromCents(-sum(amount for amount in ledger.amounts[low:high] if amount < 0))
+
+def sumSpentByTypePython(ledger: Ledger, low: int, high: int) -> list[float]:
+    totals: list[int] = [0] * (len(BUDGET_TYPES) + 1)
+
+    for amount, code in zip(ledger.amounts[low:high], ledger.budgetTypeCodes[low:high]):
+        if amount < 0: totals[code + 1] -= amount
+
+    return [fromCents(total) for total in totals]
+
+def sumSpentByWeekdayPython(ledger: Ledger, low: int, high: int) -> list[float]:
+    totals: list[int] = [0] * 7
+
+    for amount, timestamp in zip(ledger.amounts[low:high], ledger.timestamps[low:high]):
+        if amount < 0: totals[(timestamp // MICROSECONDS_PER_DAY + EPOCH_WEEKDAY) % 7] -= amount
+
+    return [fromCents(total) for total in totals]
+
+if numpy is not None:
+    sumSpent, sumSpentByType, sumSpentByWeekday = sumSpentNumPy, sumSpentByTypeNumPy, sumSpentByWeekdayNumPy
+else:
+    sumSpent, sumSpentByType, sumSpentByWeekday = sumSpentPython, sumSpentByTypePython, sumSpentByWeekdayPython
+
+def countWeekdays(firstDay: date, lastDay: date) -> list[int]:
+    # How many of each weekday fall in [firstDay, lastDay], without walking the days
+    totalDays: int = (lastDay - firstDay).days + 1
+    counts: list[int] = [totalDays // 7] * 7
+
+    for offset in range(totalDays % 7):
+        counts[(firstDay.weekday() + offset) % 7] += 1
+
+    return counts
+
+def projectRunOut(balance: float, dailyBurnRate: float, breaks: BreakSchedule, today: date) -> Optional[date]:
+    # Spending is assumed to pause over breaks, so each upcoming break pushes the run out date back by its length
+    if dailyBurnRate <= 0: return None
+    if balance <= 0: return today
+
+    spendingDaysLeft: int = math.ceil(balance / dailyBurnRate)
+    day: date = today
+
+    for breakStart, breakEnd in breaks.upcoming(today):
+        startDay: date = max(breakStart.date(), today)
+        spendingDaysBeforeBreak: int = (startDay - day).days
+
+        if spendingDaysLeft <= spendingDaysBeforeBreak: break
+
+        spendingDaysLeft -= spendingDaysBeforeBreak
+        day = breakEnd.date() + timedelta(days=1)
+
+    return day + timedelta(days=spendingDaysLeft - 1)
+
+def computeSpendingStats(data: UserData, today: date) -> SpendingStats:
+    ledger: Ledger = data.ledger
+    stats: SpendingStats = SpendingStats()
+    if not ledger: return stats
+
+    # Windows are whole days ending with today, so the numbers only change with a new transaction or a new day
+    end: int = ledger.indexRange(None, datetime.combine(today + timedelta(days=1), datetime.min.time()))[1]
+    last7: int = ledger.indexRange(datetime.combine(today - timedelta(days=6), datetime.min.time()))[0]
+    last30: int = ledger.indexRange(datetime.combine(today - timedelta(days=BURN_RATE_DAYS - 1), datetime.min.time()))[0]
+
+    stats.spentLast7Days = sumSpent(ledger, last7, end)
+    stats.spentLast30Days = sumSpent(ledger, last30, end)
+
+    byType: list[float] = sumSpentByType(ledger, last30, end)
+    stats.spentByType = {BUDGET_TYPES[code] if code != UNKNOWN_BUDGET_TYPE_CODE else None: byType[code + 1]
+                         for code in range(UNKNOWN_BUDGET_TYPE_CODE, len(BUDGET_TYPES)) if byType[code + 1] > 0}
+
+    firstDay: date = (LEDGER_EPOCH + timedelta(microseconds=ledger.timestamps[0])).date()
+    if firstDay <= today:
+        weekdayCounts: list[int] = countWeekdays(firstDay, today)
+        stats.averageByWeekday = [total / count if count else 0.0 for total, count in zip(sumSpentByWeekday(ledger, 0, end), weekdayCounts)]
+
+    # A short history is averaged over the days it covers rather than the full window
+    burnRateDays: int = max(1, min(BURN_RATE_DAYS, (today - firstDay).days + 1))
+    stats.dailyBurnRate = stats.spentLast30Days / burnRateDays
+    stats.projectedRunOut = projectRunOut(data.diningDollars + data.tigerBucks + data.USD, stats.dailyBurnRate, data.breaks, today)
+
+    return stats
@@ -1,86 +1,168 @@
-from dataclasses import dataclass, field
-from datetime import datetime
-from typing import Optional
+from models import BreakSchedule, BudgetType, DaySummary, GroupData, Ledger, MemberContribution, UserData, UserSummary, createBalances, toCents, fromCents, tokenize
+from storage import UserDataStore, JournalStore, LazyUserData, SQLiteStore
+from cache import RenderCache
+from datetime import datetime, date, timedelta
+from zoneinfo import ZoneInfo
+from typing import BinaryIO, Callable, Iterator, Optional
 from typing import Final
-from enum import Enum
-import discord
-import pickle
+import dataclasses
+import functools
+import heapq
+import importer
+import exporter
+import threading
+import metrics
 import atexit
+import time
 import os
 
 USER_DATA_SAVE_FILE: Final[str] = 'user_data.pkl'
+USER_DATA_JOURNAL_FILE: Final[str] = 'user_data.journal'
+USER_DATA_DATABASE_FILE: Final[str] = 'user_data.db'
+USER_DATA_STORAGE: Final[str] = os.getenv('USER_DATA_STORAGE', 'journal')
+USER_DATA_SHARED: Final[bool] = os.getenv('USER_DATA_SHARED', '0') == '1'
+USER_DATA_IDLE_SECONDS: Final[float] = float(os.getenv('USER_DATA_IDLE_SECONDS', '1800'))
+USER_DATA_EVICTION_INTERVAL: Final[float] = 60.0
+
+DISCORD_MESSAGE_LIMIT: Final[int] = 2000
+TRANSACTION_HISTORY_PAGE_LIMIT: Final[int] = DISCORD_MESSAGE_LIMIT - 100
+TRANSACTION_HISTORY_HEADER: Final[str] = '### Transaction History\n────────────────────────────────────\n'
+TRANSACTION_HISTORY_FOOTER: Final[str] = '────────────────────────────────────\n'
+TRANSACTION_HISTORY_LINE_BATCH: Final[int] = 32
+GROUP_NAME_LIMIT: Final[int] = 100
+GROUP_REPORT_MEMBER_LIMIT: Final[int] = 20
+GROUP_REPORT_TRANSACTION_LIMIT: Final[int] = 10
+GROUP_REPORT_TRANSACTION_CHARACTER_LIMIT: Final[int] = 800
+SEARCH_RESULTS_HEADER: Final[str] = '### Search Results\n────────────────────────────────────\n'
+
+userData: Optional[LazyUserData] = None
+store: Optional[UserDataStore] = None
+daysInBudgetCache: dict[str, tuple[date, UserData, int]] = {}
+userVersions: dict[str, int] = {}
+renderCache: RenderCache = RenderCache()
+mutationState: threading.local = threading.local()
+
+def recordMutation(*operations: tuple) -> None:
+    if store is None: return
+    store.record(*operations)
+
+def mutation(function: Optional[Callable] = None, *, checkBalances: bool = True) -> Callable:
+    # Mutations that set balances directly pass checkBalances=False, every other one must keep them in step with the ledger
+    if function is None: return functools.partial(mutation, checkBalances=checkBalances)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        depth: int = getattr(mutationState, 'depth', 0)
+        mutationState.depth = depth + 1
+
+        try:
+            # Nested mutations see the user part way through a change, only the outermost one is checked
+            check: bool = checkBalances and depth == 0
+            if store is None: return runCheckedMutation(function, check, *args, **kwargs)
+            with store.mutationLock(args[0]): return runCheckedMutation(function, check, *args, **kwargs)
+        finally:
+            mutationState.depth = depth
+            # Anything rendered for the user before this point is stale, even when the mutation failed part way
+            bumpUserVersion(args[0])
+
+    return wrapper
+
+def runCheckedMutation(function: Callable, check: bool, userID: str, *args, **kwargs):
+    # The gap between the balances and the ledger's running totals is O(1) to compute, so it is compared before and
+    # after each mutation instead of re-summing the ledger
+    offset: Optional[int] = userData[userID].getBalanceOffset() if check and userID in userData else None
+    result = function(userID, *args, **kwargs)
+
+    if offset is not None and userID in userData:
+        drift: int = userData[userID].getBalanceOffset() - offset
+
+        if drift != 0: metrics.recordBalanceDrift(userID, function.__name__, fromCents(drift))
+
+    return result
+
+def bumpUserVersion(userID: str) -> None:
+    userVersions[userID] = userVersions.get(userID, 0) + 1
+
+def getRenderedFragment(userID: str, key: tuple, render: Callable[[], str]) -> str:
+    return renderCache.getFragment(userID, userData[userID], userVersions.get(userID, 0), key, render)
+
+def createUserDataStore() -> UserDataStore:
+    if USER_DATA_SHARED and USER_DATA_STORAGE != 'sqlite': raise ValueError('USER_DATA_SHARED requires USER_DATA_STORAGE=sqlite')
+
+    if USER_DATA_STORAGE == 'sqlite': return SQLiteStore(USER_DATA_DATABASE_FILE, migrateFrom=JournalStore(USER_DATA_SAVE_FILE, USER_DATA_JOURNAL_FILE), shared=USER_DATA_SHARED)
+    elif USER_DATA_STORAGE == 'journal': return JournalStore(USER_DATA_SAVE_FILE, USER_DATA_JOURNAL_FILE)
+    else: raise ValueError(f'Unknown user data storage "{USER_DATA_STORAGE}", expected "journal" or "sqlite"')
+
+def loadUserData() -> LazyUserData:
+    return store.open()
+
+def evictIdleUsers() -> None:
+    for userID in userData.evictIdle(USER_DATA_IDLE_SECONDS):
+        invalidateDaysInUserBudget(userID)
+        renderCache.invalidate(userID)
+
+def evictIdleUsersLoop() -> None:
+    while True:
+        time.sleep(min(USER_DATA_EVICTION_INTERVAL, USER_DATA_IDLE_SECONDS))
+        evictIdleUsers()
+    
+def intialize() -> None:
+    global userData, store
 
-class BudgetType(Enum):
-    DINING_DOLLARS = 'diningDollars'
-    TIGER_BUCKS = 'tigerBucks'
-    USD = 'USD'
-
-    def getPrettyString(self) -> str:
-        if self == BudgetType.DINING_DOLLARS: return 'Dining Dollars'
-        elif self == BudgetType.TIGER_BUCKS: return 'Tiger Bucks'
-        elif self == BudgetType.USD: return 'USD'
-        else: return 'Unknown Budget Type'
-
-    def __str__(self) -> str:
-        return self.value
-
-    def __repr__(self) -> str:
-        return self.value
-
-@dataclass
-class UserData:
-    startingDiningDollars: float = 0.0
-    startingTigerBucks: float = 0.0
-    startingUSD: float = 0.0
-
-    diningDollars: float = 0.0
-    tigerBucks: float = 0.0
-    USD: float = 0.0
-
-    budgetDate: Optional[datetime] = None
-    dailyBudget: float = 0.0
-
-    ledger: list[tuple[float, str, datetime]] = field(default_factory=list)
-    breaks: list[tuple[datetime, datetime]] = field(default_factory=list)
+    with metrics.timeStartupPhase('load user data'):
+        store = createUserDataStore()
+        userData = loadUserData()
 
-userData: Optional[dict[str, UserData]] = None
+    metrics.registerGauge('budget_bot_users_loaded', lambda: len(userData))
+    metrics.registerGauge('budget_bot_ledger_entries', lambda: sum(len(data.ledger) for data in list(userData.values())))
+    metrics.registerGauge('budget_bot_render_cache_bytes', lambda: renderCache.size)
 
-def loadUserData() -> dict[str, UserData]:
-    if not os.path.exists(USER_DATA_SAVE_FILE): return {}
-    
-    with open(USER_DATA_SAVE_FILE, 'rb') as file:
-        userData = pickle.load(file)
-        return userData
-    
-def intialize() -> None:
-    global userData
-    userData = loadUserData()
+    # Idle users' full records are paged out, a zero or negative idle time keeps everyone resident
+    if USER_DATA_IDLE_SECONDS > 0:
+        threading.Thread(target=evictIdleUsersLoop, name='user-evictor', daemon=True).start()
     
 def saveUserData() -> None:
-    with open(USER_DATA_SAVE_FILE, 'wb') as file:
-        pickle.dump(userData, file)
+    # Nothing to save if the bot exits before the data finished loading
+    if store is None: return
+    store.close()
 
 def isBudgetSetup(userID: str) -> bool:
-    return userID in userData and userData[userID].budgetDate is not None
+    summary: Optional[UserSummary] = userData.getSummary(userID)
+    return summary is not None and summary.budgetDate is not None
+
+def invalidateDaysInUserBudget(userID: str) -> None:
+    daysInBudgetCache.pop(userID, None)
 
 def getDaysInUserBudget(userID: str) -> int:
-    if userID not in userData or userData[userID].budgetDate is None:
+    if not isBudgetSetup(userID):
         return 0
     
     data: UserData = userData[userID]
     
     today: datetime = datetime.now()
+
+    # Cached per user until the breaks or end date change (both invalidate it), the calendar day rolls over
+    # or the record is reloaded after another process changed it
+    cached: Optional[tuple[date, UserData, int]] = daysInBudgetCache.get(userID)
+    if cached is not None and cached[0] == today.date() and cached[1] is data:
+        return cached[2]
+
     daysInBudget: int = (data.budgetDate - today).days
 
-    for brk in data.breaks:
+    for brk in data.breaks.upcoming(today.date()):
         breakStart, breakEnd = brk
-        if breakStart.date() < today.date() and breakEnd.date() < today.date(): continue
-        elif breakStart.date() < today.date(): breakStart = today
+        if breakStart.date() < today.date(): breakStart = today
         
         breakLength: int = (breakEnd - breakStart).days + 1
         daysInBudget -= breakLength
 
+    daysInBudgetCache[userID] = (today.date(), data, daysInBudget)
+    return daysInBudget
+
 def getBreaksReport(userID: str) -> str:
+    return getRenderedFragment(userID, ('breaks',), lambda: renderBreaksReport(userID))
+
+def renderBreaksReport(userID: str) -> str:
     data: UserData = userData[userID]
     
     report: str = (
@@ -94,134 +176,218 @@ def getBreaksReport(userID: str) -> str:
     report += '────────────────────────────────────\n'
     return report
 
+@mutation
 def addBreak(userID: str, breakStartTime: datetime, breakEndTime: datetime) -> None:
     data: UserData = userData[userID]
 
-    data.breaks.append((breakStartTime, breakEndTime))
-
-    # TODO: Remove this code below, replace with code that iterates all breaks and resolves any overlap conflicts by merging the breaks
-    # for i, brk in enumerate(data.breaks):
-    #     exisitingBreakStart, existingEndBreak = brk
-    #     if exisitingBreakStart <= breakStartTime <= existingEndBreak or exisitingBreakStart <= breakEndTime <= existingEndBreak:
-    #         newBreakStart: datetime = min(exisitingBreakStart, breakStartTime)
-    #         newBreakEnd: datetime = max(existingEndBreak, breakEndTime)
-    #         data.breaks[i] = (newBreakStart, newBreakEnd)
-    #         userData[userID] = data
-    #         return
+    data.breaks.add(breakStartTime, breakEndTime)
+    invalidateDaysInUserBudget(userID)
+    recordMutation(('addBreak', userID, (breakStartTime, breakEndTime)))
 
-def removeBreak(userID: str, index: int) -> list[tuple[datetime, datetime]]:
+@mutation
+def removeBreak(userID: str, index: int) -> tuple[datetime, datetime]:
     data: UserData = userData[userID]
     
-    brks: list[tuple[datetime, datetime]] = data.breaks
-    return brks.pop(index)
+    brks: BreakSchedule = data.breaks
+    removedBreak: tuple[datetime, datetime] = brks.pop(index)
+
+    invalidateDaysInUserBudget(userID)
+    recordMutation(('removeBreak', userID, index))
+    return removedBreak
 
 def getUserNumBreaks(userID: str) -> int:
     data: UserData = userData[userID]
     return len(data.breaks)
 
-def getUserBalance(userID: str) -> float:
+def getUserBreaks(userID: str) -> list[tuple[datetime, datetime]]:
     data: UserData = userData[userID]
-    return data.diningDollars + data.tigerBucks + data.USD
+    return list(data.breaks)
 
+def getUserBalance(userID: str) -> float:
+    summary: UserSummary = userData.getSummary(userID)
+    return summary.diningDollars + summary.tigerBucks + summary.USD
+
+@mutation
 def addUserBalance(userID: str, amount: float, budgetType: BudgetType) -> None:
     data: UserData = userData[userID]
-    
-    if budgetType == BudgetType.DINING_DOLLARS: data.diningDollars += amount
-    elif budgetType == BudgetType.TIGER_BUCKS: data.tigerBucks += amount
-    elif budgetType == BudgetType.USD: data.USD += amount
+    data.changeBalance(budgetType, toCents(amount))
 
     userData[userID] = data
+    recordMutation(('set', userID, str(budgetType), data.getBalance(budgetType)))
 
+@mutation
 def subtractUserBalance(userID: str, amount: float, budgetType: BudgetType) -> None:
     data: UserData = userData[userID]
-    
-    if budgetType == BudgetType.DINING_DOLLARS: data.diningDollars -= amount
-    elif budgetType == BudgetType.TIGER_BUCKS: data.tigerBucks -= amount
-    elif budgetType == BudgetType.USD: data.USD -= amount
+    data.changeBalance(budgetType, -toCents(amount))
 
     userData[userID] = data
+    recordMutation(('set', userID, str(budgetType), data.getBalance(budgetType)))
 
-def spend(userID: str, amount: float, transactionDescription: str, budgetType: BudgetType) -> None:
+def applyTransaction(userID: str, amount: float, transactionDescription: str, budgetType: BudgetType) -> list[tuple]:
+    # The ledger row and the balance it moves are journaled together, so a record cut short can never keep one without the other
     data: UserData = userData[userID]
 
-    data.ledger.append((-amount, transactionDescription, datetime.now()))
+    transaction: tuple[float, str, datetime] = (amount, transactionDescription, datetime.now())
+    data.appendTransaction(transaction, budgetType)
+    data.changeBalance(budgetType, toCents(amount))
     userData[userID] = data
 
-    subtractUserBalance(userID, amount, budgetType)
+    return [('ledger', userID, transaction, budgetType), ('set', userID, str(budgetType), data.getBalance(budgetType))]
+
+@mutation
+def spend(userID: str, amount: float, transactionDescription: str, budgetType: BudgetType) -> None:
+    recordMutation(*applyTransaction(userID, -amount, transactionDescription, budgetType))
 
+@mutation
 def add(userID: str, amount: float, transactionDescription: str, budgetType: BudgetType) -> None:
+    recordMutation(*applyTransaction(userID, amount, transactionDescription, budgetType))
+
+@mutation(checkBalances=False)
+def setUserBalance(userID: str, amount: float, budgetType: BudgetType) -> None:
     data: UserData = userData[userID]
+    data.setBalance(budgetType, toCents(amount))
 
-    data.ledger.append((amount, transactionDescription, datetime.now()))
     userData[userID] = data
+    recordMutation(('set', userID, str(budgetType), data.getBalance(budgetType)))
 
-    addUserBalance(userID, amount, budgetType)
-
-def setUserBalance(userID: str, amount: float, budgetType: BudgetType) -> None:
+@mutation
+def importTransactions(userID: str, transactions: Ledger) -> int:
     data: UserData = userData[userID]
 
-    if budgetType == BudgetType.DINING_DOLLARS: data.diningDollars = amount
-    elif budgetType == BudgetType.TIGER_BUCKS: data.tigerBucks = amount
-    elif budgetType == BudgetType.USD: data.USD = amount
+    newTransactions: Ledger = importer.removeDuplicates(data.ledger, transactions)
+    if not newTransactions: return 0
 
-    userData[userID] = data
+    # One merge and one balance update per budget type for the whole file, journaled as a single record
+    data.mergeTransactions(newTransactions)
+    operations: list[tuple] = [('importLedger', userID, newTransactions)]
+
+    for budgetType, change in importer.getBalanceChanges(newTransactions).items():
+        data.changeBalance(budgetType, change)
+        operations.append(('set', userID, str(budgetType), data.getBalance(budgetType)))
+
+    # Merged rows shift the ledger indexes the cached lines are keyed by
+    renderCache.invalidate(userID)
+    recordMutation(*operations)
+    return len(newTransactions)
+
+def importTransactionFile(userID: str, path: str, fileName: str, mapping: importer.ColumnMapping) -> tuple[int, int]:
+    # Parsing runs before the user's mutation lock is taken, only the merge itself holds it
+    transactions: Ledger = importer.readImportFile(path, fileName, mapping)
+    imported: int = importTransactions(userID, transactions)
+    return imported, len(transactions) - imported
 
 def getUserBudgetSpread(userID: str) -> float:
     data: UserData = userData[userID]
     daysInBudget: int = getDaysInUserBudget(userID)
     return (getUserBalance(userID) / daysInBudget) if daysInBudget > 0 else 0.0
 
+@mutation(checkBalances=False)
 def setupBudget(userID: str, 
                 startingDiningDollars: float, 
                 startingTigerBucks: float, 
                 startingUSD: float, 
                 budgetDate: datetime) -> None:
-    
-    daysInBudget: int = getDaysInUserBudget(userID)
-    userBudgetSpread: float = (startingDiningDollars + startingTigerBucks + startingUSD) / daysInBudget if daysInBudget > 0 else 0.0
-
-    userData[userID] = UserData(startingDiningDollars=startingDiningDollars,
-                                startingTigerBucks=startingTigerBucks,
-                                startingUSD=startingUSD,
-                                diningDollars=startingDiningDollars,
-                                tigerBucks=startingTigerBucks,
-                                USD=startingUSD, 
+
+    # Digest settings belong to the user rather than the budget, so they survive setting the budget up again
+    previous: Optional[UserSummary] = userData.getSummary(userID)
+    digestSettings: dict = {'digestTime': previous.digestTime, 'digestTimeZone': previous.digestTimeZone, 'digestLastSent': previous.digestLastSent} if previous else {}
+
+    startingBalances: dict[BudgetType, float] = {BudgetType.DINING_DOLLARS: startingDiningDollars,
+                                                 BudgetType.TIGER_BUCKS: startingTigerBucks,
+                                                 BudgetType.USD: startingUSD}
+
+    userData[userID] = UserData(startingBalances=createBalances(startingBalances),
+                                balances=createBalances(startingBalances),
                                 budgetDate=budgetDate,
-                                dailyBudget=userBudgetSpread)
+                                **digestSettings)
+
+    spreadStartingBudget(userID)
+    recordMutation(('setup', userID, userData[userID]))
+
+def spreadStartingBudget(userID: str) -> None:
+    invalidateDaysInUserBudget(userID)
 
-def getUserDailyBudget(userID: str) -> float:
     data: UserData = userData[userID]
-    return data.dailyBudget
+    daysInBudget: int = getDaysInUserBudget(userID)
+    data.dailyBudget = fromCents(sum(data.startingBalances)) / daysInBudget if daysInBudget > 0 else 0.0
+
+def getUserDailyBudget(userID: str) -> float:
+    summary: UserSummary = userData.getSummary(userID)
+    return summary.dailyBudget
 
+@mutation
 def respreadUserBudget(userID: str) -> None:
     userBudgetSpread: float = getUserBudgetSpread(userID)
     data: UserData = userData[userID]
 
     data.dailyBudget = userBudgetSpread
-    
+    recordMutation(('set', userID, 'dailyBudget', userBudgetSpread))
 
+@mutation
 def setUserBudgetEndDate(userID: str, budgetEndDate: datetime) -> None:
     data: UserData = userData[userID]
     data.budgetDate = budgetEndDate
+    spreadStartingBudget(userID)
 
-    daysInBudget: int = getDaysInUserBudget(userID)
-    userBudgetSpread: float = (data.startingDiningDollars + data.startingTigerBucks + data.startingUSD) / daysInBudget if daysInBudget > 0 else 0.0
-
-    data.dailyBudget = userBudgetSpread
     userData[userID] = data
-
-def getUserBudgetReport(userID: str) -> str:
+    recordMutation(('set', userID, 'budgetDate', budgetEndDate), ('set', userID, 'dailyBudget', data.dailyBudget))
+
+def getUserBudgetReport(userID: str, transactionLimit: Optional[int] = None, transactionCharacterLimit: Optional[int] = None) -> str:
+    # "Today" is part of the report, so the cached copy only holds for the day it was rendered on
+    today: date = datetime.now().date()
+    return getRenderedFragment(userID, ('report', today, transactionLimit, transactionCharacterLimit),
+                               lambda: renderUserBudgetReport(userID, today, transactionLimit, transactionCharacterLimit))
+
+def formatReportTransactionLine(transaction: tuple[float, str, datetime]) -> str:
+    amount, description, date = transaction
+    sign: str = '-' if amount < 0 else '+'
+    return f'- **[{sign}] ${abs(amount):.2f}** on "*{description}*" at `{date.strftime('%I:%M %p')}`\n'
+
+def limitReportTransactions(transactions: list[str], transactionLimit: Optional[int], transactionCharacterLimit: Optional[int]) -> list[str]:
+    # Keeps the latest transactions that fit and sums up the rest in one line
+    shown: list[str] = []
+    characters: int = 0
+
+    for line in reversed(transactions):
+        if transactionLimit is not None and len(shown) >= transactionLimit: break
+        if transactionCharacterLimit is not None and characters + len(line) > transactionCharacterLimit: break
+        shown.append(line)
+        characters += len(line)
+
+    shown.reverse()
+    if len(shown) < len(transactions):
+        shown.insert(0, f'- *...and {len(transactions) - len(shown)} earlier*\n')
+
+    return shown
+
+def getLedgerDay(data: UserData, day: date) -> tuple[int, int, int]:
+    # The ledger range of a server-local day and the cents spent in it, straight from the daily rollup
+    summary: Optional[DaySummary] = data.getDailyRollup().getDay(day)
+    if summary is None: return 0, 0, 0
+    return summary.firstOffset, summary.firstOffset + summary.count, summary.spent
+
+def getZonedLedgerDay(data: UserData, day: date, timeZone: str) -> tuple[int, int, int]:
+    # Ledger timestamps are naive server-local times, so a day in another time zone is converted to that clock and can
+    # span parts of two rollup days, its range is bisected out of the ledger instead
+    zone: ZoneInfo = ZoneInfo(timeZone)
+    dayStart: datetime = datetime.combine(day, datetime.min.time(), zone).astimezone().replace(tzinfo=None)
+    dayEnd: datetime = datetime.combine(day + timedelta(days=1), datetime.min.time(), zone).astimezone().replace(tzinfo=None)
+
+    low, high = data.ledger.indexRange(dayStart, dayEnd)
+    return low, high, -sum(amount for amount in data.ledger.amounts[low:high] if amount < 0)
+
+def renderUserBudgetReport(userID: str, today: date, transactionLimit: Optional[int] = None, transactionCharacterLimit: Optional[int] = None,
+                           ledgerDay: Optional[tuple[int, int, int]] = None) -> str:
     data: UserData = userData[userID]
 
-    ledger: list[tuple[float, str, datetime]] = data.ledger
+    low, high, spent = ledgerDay if ledgerDay is not None else getLedgerDay(data, today)
 
-    transactions: list[tuple[float, str, datetime]] = []
-    for transaction in ledger:
-        amount, description, date = transaction
-        if date.date() == datetime.now().date():
-            transactions.append(transaction)
+    transactions: list[str] = []
+    if high > low:
+        transactions = renderCache.getLines(userID, data, 'report', low, high, lambda index: formatReportTransactionLine(data.ledger[index]))
+        transactions = limitReportTransactions(transactions, transactionLimit, transactionCharacterLimit)
 
-    moneySpentToday: float = sum([transaction[0] for transaction in transactions if transaction[0] < 0])
+    moneySpentToday: float = -fromCents(spent)
 
     report: str = (
         f'### Budget Report\n'
@@ -234,10 +400,7 @@ def getUserBudgetReport(userID: str) -> str:
         '────────────────────────────────────\n'
         f'**Transactions Today:** {'None' if not transactions else ''}\n')
     
-    for transaction in transactions:
-        amount, description, date = transaction
-        sign: str = '-' if amount < 0 else '+'
-        report += f'- **[{sign}] ${abs(amount):.2f}** on "*{description}*" at `{date.strftime('%I:%M %p')}`\n'
+    report += ''.join(transactions)
 
     def format_money(value: float) -> str:
         sign = '-' if value < 0 else ''
@@ -254,83 +417,323 @@ def getUserBudgetReport(userID: str) -> str:
 
     return report
 
+def getTransactionSearchRange(searchDateStart: Optional[datetime], searchDateEnd: Optional[datetime]) -> tuple[Optional[datetime], Optional[datetime]]:
+    if not (searchDateStart and searchDateEnd): return None, None
+
+    rangeStart: datetime = datetime.combine(searchDateStart.date(), datetime.min.time())
+    rangeEnd: datetime = datetime.combine(searchDateEnd.date(), datetime.min.time()) + timedelta(days=1)
+    return rangeStart, rangeEnd
+
+def formatTransactionHistoryLine(transaction: tuple[float, str, datetime]) -> str:
+    amount, description, searchDate = transaction
+    sign: str = '-' if amount < 0 else '+'
+    return f'- **[{sign}] ${abs(amount):.2f}** on "*{description}*" on `{searchDate.strftime('%A, %B %d, %Y at %I:%M %p')}`\n'
+
 def getUserTransactionHistory(userID: str, searchDateStart: datetime = None, searchDateEnd: datetime = None) -> str:
     data: UserData = userData[userID]
-    ledger: list[tuple[float, str, datetime]] = data.ledger
 
-    if not ledger:
+    if not data.ledger:
         return "No transactions found."
 
-    history: str = "### Transaction History\n────────────────────────────────────\n"
-    
-    transactionFound: bool = False
+    searchRange: tuple[Optional[datetime], Optional[datetime]] = getTransactionSearchRange(searchDateStart, searchDateEnd)
+    return getRenderedFragment(userID, ('history', *searchRange), lambda: renderUserTransactionHistory(userID, *searchRange))
 
-    for transaction in ledger:
-        if searchDateStart and searchDateEnd and not (transaction[2].date() >= searchDateStart.date() and transaction[2].date() <= searchDateEnd.date()):
-            continue
+def getTransactionHistoryLines(userID: str, low: int, high: int) -> list[str]:
+    data: UserData = userData[userID]
+    return renderCache.getLines(userID, data, 'history', low, high, lambda index: formatTransactionHistoryLine(data.ledger[index]))
 
-        transactionFound = True
+def iterTransactionHistoryLines(userID: str, low: int, high: int) -> Iterator[str]:
+    # Fetched a batch at a time so paging through a long history only formats the rows that get shown
+    for batchStart in range(low, high, TRANSACTION_HISTORY_LINE_BATCH):
+        yield from getTransactionHistoryLines(userID, batchStart, min(high, batchStart + TRANSACTION_HISTORY_LINE_BATCH))
 
-        amount, description, searchDate = transaction
-        sign: str = '-' if amount < 0 else '+'
-        history += f'- **[{sign}] ${abs(amount):.2f}** on "*{description}*" on `{searchDate.strftime('%A, %B %d, %Y at %I:%M %p')}`\n'
+def renderUserTransactionHistory(userID: str, rangeStart: Optional[datetime], rangeEnd: Optional[datetime]) -> str:
+    # Bisects the in-memory ledger rather than asking the store, so the rows line up with the cached formatted lines
+    low, high = userData[userID].ledger.indexRange(rangeStart, rangeEnd)
+    lines: list[str] = getTransactionHistoryLines(userID, low, high)
 
-    if not transactionFound:
-        history += "No transactions found for the specified date range.\n"
+    if not lines:
+        lines.append("No transactions found for the specified date range.\n")
 
-    history += '────────────────────────────────────\n'
-    
-    return history
-
-class BudgetTypeSelector(discord.ui.Select):
-    def __init__(self, userID: str, amount: float, description: str, spending: bool = True) -> None:
-        options: list = [
-            discord.SelectOption(label='Dining Dollars', value=str(BudgetType.DINING_DOLLARS)),
-            discord.SelectOption(label='Tiger Bucks', value=str(BudgetType.TIGER_BUCKS)),
-            discord.SelectOption(label='USD', value=str(BudgetType.USD))]
-        
-        super().__init__(placeholder='Select which type of money you spent...', options=options, min_values=1, max_values=1)
-
-        self.userID: str = userID
-        self.amount: float = amount
-        self.description: str = description
-        self.spending: bool = spending
-
-    async def callback(self, interaction: discord.Interaction) -> None:
-        budgetType: BudgetType = BudgetType(self.values[0])
-
-        if self.spending:
-            spend(self.userID, self.amount, self.description, budgetType)
-            await interaction.response.send_message(f'Spent **${self.amount:.2f}** on "*{self.description}*" using `{budgetType.getPrettyString()}`.', ephemeral=True)
-        else:
-            add(self.userID, self.amount, self.description, budgetType)
-            await interaction.response.send_message(f'Added **${self.amount:.2f}** to your `{budgetType.getPrettyString()}` budget for "*{self.description}*".', ephemeral=True)
-
-class BudgetTypeSelectorView(discord.ui.View):
-    def __init__(self, userID: str, amount: float, description: str, spending: bool = True) -> None:
-        super().__init__(timeout=60.0)
-        self.add_item(BudgetTypeSelector(userID, amount, description, spending))
-
-class BreakRemovalSelector(discord.ui.Select):
-    def __init__(self, userID: str) -> None:
-        options: list[tuple[datetime, datetime]] = []
-        for i, brk in enumerate(userData[userID].breaks):
-            breakStart, breakEnd = brk
-            options.append(discord.SelectOption(label=f'{breakStart.strftime('%B %d, %Y')} to {breakEnd.strftime('%B %d, %Y')}', value=i))
-        
-        super().__init__(placeholder='Select a break to remove...', options=options, min_values=1, max_values=1) # dont set max_value to more than 1, the backend's remove break uses .pop(index), popping one index shifts the rest
+    return TRANSACTION_HISTORY_HEADER + ''.join(lines) + TRANSACTION_HISTORY_FOOTER
+
+def iterUserTransactionHistoryPages(userID: str, searchDateStart: datetime = None, searchDateEnd: datetime = None, pageLimit: int = TRANSACTION_HISTORY_PAGE_LIMIT) -> Iterator[tuple[str, bool]]:
+    # Yields (page, hasMorePages) lazily, each page fits in one Discord message and only its own rows are formatted
+    data: UserData = userData[userID]
+
+    if not data.ledger:
+        yield "No transactions found.", False
+        return
+
+    searchRange: tuple[Optional[datetime], Optional[datetime]] = getTransactionSearchRange(searchDateStart, searchDateEnd)
+    low, high = data.ledger.indexRange(*searchRange)
+
+    if low == high:
+        yield TRANSACTION_HISTORY_HEADER + "No transactions found for the specified date range.\n" + TRANSACTION_HISTORY_FOOTER, False
+        return
+
+    while True:
+        lines: list[str] = []
+        pageLength: int = len(TRANSACTION_HISTORY_HEADER) + len(TRANSACTION_HISTORY_FOOTER)
+
+        for line in iterTransactionHistoryLines(userID, low, high):
+            if lines and pageLength + len(line) > pageLimit: break
+
+            lines.append(line)
+            pageLength += len(line)
+
+        low += len(lines)
+        if low >= high:
+            yield TRANSACTION_HISTORY_HEADER + ''.join(lines) + TRANSACTION_HISTORY_FOOTER, False
+            return
+
+        # The next page is remembered by its first row's time rather than its index, an import can merge rows in
+        # anywhere while this page is shown, so the bounds are resolved again against the ledger as it is then
+        nextDate: datetime = data.ledger.getTransaction(low)[2]
+        shownAtNextDate: int = low - data.ledger.indexRange(nextDate)[0]
+
+        yield TRANSACTION_HISTORY_HEADER + ''.join(lines) + TRANSACTION_HISTORY_FOOTER, True
+
+        data = userData[userID]
+        high = data.ledger.indexRange(*searchRange)[1]
+        low = min(high, data.ledger.indexRange(nextDate)[0] + shownAtNextDate)
+
+        if low >= high:
+            yield TRANSACTION_HISTORY_HEADER + "No more transactions in this range.\n" + TRANSACTION_HISTORY_FOOTER, False
+            return
+
+def searchUserTransactions(userID: str, query: str, minAmount: Optional[float] = None, maxAmount: Optional[float] = None,
+                           searchDateStart: datetime = None, searchDateEnd: datetime = None) -> str:
+    data: UserData = userData[userID]
+
+    terms: list[str] = tokenize(query)
+    if not terms: return 'Search for at least one word from a transaction description.'
+
+    # The date range narrows the rows by bisecting the ledger, the index only hands back rows from matching descriptions
+    low, high = data.ledger.indexRange(*getTransactionSearchRange(searchDateStart, searchDateEnd))
+    rows: list[int] = data.getSearchIndex().search(data.ledger, terms, low, high,
+                                                   toCents(minAmount) if minAmount is not None else None,
+                                                   toCents(maxAmount) if maxAmount is not None else None)
+
+    if not rows: return 'No transactions match your search.'
+
+    total: float = fromCents(sum(data.ledger.amounts[row] for row in rows))
+    report: str = SEARCH_RESULTS_HEADER + f'**{len(rows)}** transaction(s), **{"-" if total < 0 else "+"}${abs(total):.2f}** in total\n'
+    shown: int = 0
+
+    # Newest first, as many as fit in one message
+    for row in reversed(rows):
+        line: str = getTransactionHistoryLines(userID, row, row + 1)[0]
+        if len(report) + len(line) + len(TRANSACTION_HISTORY_FOOTER) > TRANSACTION_HISTORY_PAGE_LIMIT: break
+
+        report += line
+        shown += 1
+
+    if shown < len(rows): report += f'- *...and {len(rows) - shown} older*\n'
+    return report + TRANSACTION_HISTORY_FOOTER
+
+def getUserStatsReport(userID: str) -> str:
+    # Memoized with the other rendered reports, so it is only recomputed after the user's next change or on a new day
+    today: date = datetime.now().date()
+    return getRenderedFragment(userID, ('stats', today), lambda: renderUserStatsReport(userID, today))
+
+def renderUserStatsReport(userID: str, today: date) -> str:
+    # Imported on first use, it pulls in NumPy when that is installed
+    import analytics
+
+    data: UserData = userData[userID]
+    stats: analytics.SpendingStats = analytics.computeSpendingStats(data, today)
+
+    report: str = (
+        '### Spending Stats\n'
+        '────────────────────────────────────\n'
+        f'- **Spent Last 7 Days →** ${stats.spentLast7Days:.2f}\n'
+        f'- **Spent Last 30 Days →** ${stats.spentLast30Days:.2f}\n'
+        f'- **Average Daily Spend →** ${stats.dailyBurnRate:.2f}\n'
+        '────────────────────────────────────\n'
+        '**Last 30 Days By Budget:**\n')
+
+    for budgetType, spent in stats.spentByType.items():
+        report += f'- **{budgetType.getPrettyString() if budgetType is not None else "Unknown"} →** ${spent:.2f}\n'
+
+    if not stats.spentByType:
+        report += '- Nothing spent\n'
+
+    report += (
+        '────────────────────────────────────\n'
+        '**Average Spend By Weekday:**\n')
+
+    for weekdayName, average in zip(analytics.WEEKDAY_NAMES, stats.averageByWeekday):
+        report += f'- **{weekdayName} →** ${average:.2f}\n'
+
+    report += '────────────────────────────────────\n'
+
+    if stats.projectedRunOut is None:
+        report += '- **Projected Run Out →** Never at your current pace\n'
+    else:
+        daysAfterEnd: int = (stats.projectedRunOut - data.budgetDate.date()).days
+        outlook: str = f'{daysAfterEnd} day(s) after your budget ends' if daysAfterEnd >= 0 else f'{-daysAfterEnd} day(s) before your budget ends'
+        report += f'- **Projected Run Out →** {stats.projectedRunOut.strftime("%A, %B %d, %Y")} ({outlook})\n'
+
+    report += '────────────────────────────────────\n'
+    return report
+
+@mutation
+def setDigestSchedule(userID: str, digestTime: Optional[str], timeZone: str) -> None:
+    data: UserData = userData[userID]
+    data.digestTime = digestTime
+    data.digestTimeZone = timeZone
+    userData[userID] = data
+    recordMutation(('set', userID, 'digestTime', digestTime), ('set', userID, 'digestTimeZone', timeZone))
+
+def getDigestSummary(userID: str) -> Optional[UserSummary]:
+    return userData.getSummary(userID)
+
+def getDigestSubscriptions() -> dict[str, UserSummary]:
+    # Read from the summaries, so building the schedule never loads a full record
+    return {userID: summary for userID, summary in userData.getSummaries().items()
+            if summary.digestTime is not None and summary.budgetDate is not None}
+
+@mutation
+def claimDigest(userID: str, day: date) -> Optional[str]:
+    # The day is marked sent before the digest goes out, so a restart can miss one digest but never sends one twice
+    summary: Optional[UserSummary] = userData.getSummary(userID)
+    if summary is None or summary.digestTime is None or summary.budgetDate is None: return None
+
+    sentDay: datetime = datetime.combine(day, datetime.min.time())
+    if summary.digestLastSent is not None and summary.digestLastSent >= sentDay: return None
+
+    digest: str = renderDigest(userID, day)
+
+    data: UserData = userData[userID]
+    data.digestLastSent = sentDay
+    userData[userID] = data
+    recordMutation(('set', userID, 'digestLastSent', sentDay))
+
+    return digest
+
+def renderDigest(userID: str, day: date) -> str:
+    # The digest's day is a calendar day in the user's time zone
+    data: UserData = userData[userID]
+    ledgerDay: tuple[int, int, int] = getZonedLedgerDay(data, day, data.digestTimeZone)
+    report: str = getRenderedFragment(userID, ('digest', day), lambda: renderUserBudgetReport(userID, day, ledgerDay=ledgerDay))
+
+    moneySpentToday: float = fromCents(ledgerDay[2])
+
+    if moneySpentToday > data.dailyBudget:
+        report = f'**Heads up:** you spent ${moneySpentToday:.2f} today, ${moneySpentToday - data.dailyBudget:.2f} over your daily budget.\n\n' + report
+
+    return report
+
+def exportUserData(userID: str, exportFormat: str, searchDateStart: datetime = None, searchDateEnd: datetime = None) -> list[tuple[str, BinaryIO]]:
+    return exporter.exportUserData(userData[userID], exportFormat, f'budget-{userID}', *getTransactionSearchRange(searchDateStart, searchDateEnd))
+
+@mutation(checkBalances=False)
+def setupGroupBudget(groupID: str,
+                     name: str,
+                     ownerID: str,
+                     startingDiningDollars: float,
+                     startingTigerBucks: float,
+                     startingUSD: float,
+                     budgetDate: datetime) -> bool:
+    # Checked under the group's lock, so two people creating the same group at once cannot overwrite each other
+    if isBudgetSetup(groupID): return False
+
+    startingBalances: dict[BudgetType, float] = {BudgetType.DINING_DOLLARS: startingDiningDollars,
+                                                 BudgetType.TIGER_BUCKS: startingTigerBucks,
+                                                 BudgetType.USD: startingUSD}
+
+    userData[groupID] = GroupData(startingBalances=createBalances(startingBalances),
+                                  balances=createBalances(startingBalances),
+                                  budgetDate=budgetDate,
+                                  name=name,
+                                  members={ownerID: MemberContribution()},
+                                  ownerID=ownerID)
+
+    spreadStartingBudget(groupID)
+    recordMutation(('setup', groupID, userData[groupID]))
+    return True
+
+def isGroupMember(groupID: str, memberID: str) -> bool:
+    if not isBudgetSetup(groupID): return False
+
+    data: UserData = userData[groupID]
+    return isinstance(data, GroupData) and data.isMember(memberID)
+
+def isGroupOwner(groupID: str, memberID: str) -> bool:
+    if not isBudgetSetup(groupID): return False
+
+    data: UserData = userData[groupID]
+    return isinstance(data, GroupData) and data.ownerID == memberID
+
+@mutation
+def setGroupInvite(groupID: str, memberID: str, invited: bool) -> None:
+    data: GroupData = userData[groupID]
+
+    if invited: data.invites.add(memberID)
+    else: data.invites.discard(memberID)
+
+    recordMutation(('invite', groupID, memberID, invited))
+
+@mutation
+def joinGroup(groupID: str, memberID: str) -> bool:
+    # Checked under the group's lock, so an invite cannot be used twice or withdrawn part way through joining
+    data: GroupData = userData[groupID]
+    if not data.canJoin(memberID): return False
+
+    data.setMember(memberID, True)
+    recordMutation(('member', groupID, memberID, dataclasses.replace(data.members[memberID])))
+
+    if memberID in data.invites: setGroupInvite(groupID, memberID, False)
+    return True
+
+@mutation
+def setGroupMember(groupID: str, memberID: str, active: bool) -> None:
+    data: GroupData = userData[groupID]
+
+    data.setMember(memberID, active)
+    recordMutation(('member', groupID, memberID, dataclasses.replace(data.members[memberID])))
+
+@mutation
+def recordGroupTransaction(groupID: str, memberID: str, amount: float, transactionDescription: str, budgetType: BudgetType, spending: bool) -> None:
+    # Holds the group's lock like any other mutation, so members spending at the same moment are applied one after another
+    data: GroupData = userData[groupID]
+    if not data.isMember(memberID): raise ValueError(f'{memberID} is not a member of {data.name}')
+
+    operations: list[tuple] = applyTransaction(groupID, -amount if spending else amount, transactionDescription, budgetType)
+
+    # The member's totals are journaled whole rather than as a change, so replaying a record twice cannot count it twice
+    data.recordContribution(memberID, -toCents(amount) if spending else toCents(amount))
+    recordMutation(*operations, ('member', groupID, memberID, dataclasses.replace(data.members[memberID])))
+
+def getGroupBudgetReport(groupID: str) -> str:
+    data: GroupData = userData[groupID]
+    report: str = f'## {data.name}\n' + getUserBudgetReport(groupID, GROUP_REPORT_TRANSACTION_LIMIT, GROUP_REPORT_TRANSACTION_CHARACTER_LIMIT)
+
+    # The member list gets whatever room is left so the whole report still fits in one message
+    memberCharacterLimit: int = DISCORD_MESSAGE_LIMIT - len(report)
+    return report + getRenderedFragment(groupID, ('members', memberCharacterLimit), lambda: renderGroupMembers(groupID, memberCharacterLimit))
+
+def renderGroupMembers(groupID: str, characterLimit: int = DISCORD_MESSAGE_LIMIT) -> str:
+    # Member totals are kept up to date as transactions come in, so this is one line per member and never reads the ledger
+    data: GroupData = userData[groupID]
+
+    header: str = (
+        '### Members\n'
+        '────────────────────────────────────\n')
+    footer: str = '────────────────────────────────────\n'
+
+    # Only the biggest spenders are listed so the report still fits in one message for large groups
+    lines: list[str] = []
+    for memberID, member in heapq.nlargest(GROUP_REPORT_MEMBER_LIMIT, data.members.items(), key=lambda item: item[1].spent):
+        lines.append(f'- <@{memberID}>{"" if member.active else " (left)"} → -${fromCents(member.spent):.2f} / +${fromCents(member.added):.2f} ({member.count})\n')
 
-        self.userID: str = userID
+    def getMoreLine(shown: int) -> str:
+        return f'- *...and {len(data.members) - shown} more*\n' if shown < len(data.members) else ''
 
-    async def callback(self, interaction: discord.Interaction) -> None:
-        index: int = int(self.values[0])
-        removedBreak: tuple[datetime, datetime] = removeBreak(self.userID, index)
-        await interaction.response.send_message(f'Removed break from `{removedBreak[0].strftime('%A, %B %d, %Y')}` to `{removedBreak[1].strftime('%A, %B %d, %Y')}`.', ephemeral=True)
+    while lines and len(header) + sum(map(len, lines)) + len(getMoreLine(len(lines))) + len(footer) > characterLimit:
+        lines.pop()
 
-class BreakRemovalSelectorView(discord.ui.View):
-    def __init__(self, userID: str) -> None:
-        super().__init__(timeout=60.0)
-        self.add_item(BreakRemovalSelector(userID))
+    return header + ''.join(lines) + getMoreLine(len(lines)) + footer
 
-intialize()
 atexit.register(saveUserData)
\ No newline at end of file
@@ -0,0 +1,257 @@
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+from typing import Final
+import argparse
+import tempfile
+import resource
+import asyncio
+import random
+import json
+import time
+import sys
+import os
+
+DESCRIPTIONS: Final[tuple[str, ...]] = (
+    'Gracie\'s', 'Brick City Cafe', 'Global Village', 'Starbucks', 'Ritz Sports Zone', 'Crossroads',
+    'Corner Store', 'Midnight Oil', 'Bookstore', 'Laundry', 'Vending Machine', 'Wegmans', 'Uber')
+
+def percentile(sortedSamples: list[float], fraction: float) -> float:
+    if not sortedSamples: return 0.0
+
+    index: int = min(len(sortedSamples) - 1, int(round(fraction * (len(sortedSamples) - 1))))
+    return sortedSamples[index]
+
+def summarize(samples: list[float]) -> dict[str, Any]:
+    sortedSamples: list[float] = sorted(samples)
+    total: float = sum(sortedSamples)
+
+    return {
+        'samples': len(sortedSamples),
+        'meanMs': total / len(sortedSamples) * 1000 if sortedSamples else 0.0,
+        'p50Ms': percentile(sortedSamples, 0.50) * 1000,
+        'p90Ms': percentile(sortedSamples, 0.90) * 1000,
+        'p99Ms': percentile(sortedSamples, 0.99) * 1000,
+        'maxMs': sortedSamples[-1] * 1000 if sortedSamples else 0.0,
+        'throughputPerSecond': len(sortedSamples) / total if total > 0 else 0.0}
+
+def getPeakRSSBytes() -> int:
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    peak: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def timeCalls(function: Callable, argumentSets: list[tuple]) -> dict[str, Any]:
+    samples: list[float] = []
+
+    for arguments in argumentSets:
+        start: float = time.perf_counter()
+        function(*arguments)
+        samples.append(time.perf_counter() - start)
+
+    return summarize(samples)
+
+def generatePopulation(users: int, minLedger: int, maxLedger: int, breaks: int, seed: int) -> dict[str, Any]:
+    from models import BudgetType, UserData, createBalances
+
+    generator: random.Random = random.Random(seed)
+    budgetTypes: list[BudgetType] = list(BudgetType)
+    now: datetime = datetime.now()
+    population: dict[str, UserData] = {}
+
+    for i in range(users):
+        userID: str = str(100000000000000000 + i)
+        ledgerSize: int = generator.randint(minLedger, maxLedger)
+
+        startingBalances: dict[BudgetType, float] = {BudgetType.DINING_DOLLARS: 2000.0, BudgetType.TIGER_BUCKS: 500.0, BudgetType.USD: 300.0}
+        data: UserData = UserData(startingBalances=createBalances(startingBalances), balances=createBalances(startingBalances),
+                                  budgetDate=now + timedelta(days=120))
+
+        # Spread the history over the past year so date-range queries have something to skip
+        timestamp: datetime = now - timedelta(days=365)
+        step: timedelta = timedelta(days=365) / max(1, ledgerSize)
+
+        for _ in range(ledgerSize):
+            amount: float = -round(generator.uniform(1.0, 25.0), 2) if generator.random() < 0.95 else round(generator.uniform(10.0, 200.0), 2)
+            data.appendTransaction((amount, generator.choice(DESCRIPTIONS), timestamp), generator.choice(budgetTypes))
+            timestamp += step
+
+        breakStart: datetime = now - timedelta(days=180)
+        for _ in range(breaks):
+            breakStart += timedelta(days=generator.randint(3, 10))
+            data.breaks.add(breakStart, breakStart + timedelta(days=generator.randint(1, 3)))
+
+        population[userID] = data
+
+    return population
+
+def seedStore(backend, population: dict[str, Any]) -> None:
+    from storage import JournalStore, SQLiteStore
+
+    if isinstance(backend.store, SQLiteStore):
+        backend.store.importUsers(population)
+        backend.userData.update(population)
+    elif isinstance(backend.store, JournalStore):
+        backend.userData.update(population)
+        backend.store.compact(wait=True)
+
+def benchmarkBackend(backend, population: dict[str, Any], samples: int, seed: int) -> dict[str, Any]:
+    from models import BudgetType
+
+    generator: random.Random = random.Random(seed)
+    userIDs: list[str] = list(population)
+    sampleUsers: list[str] = [generator.choice(userIDs) for _ in range(samples)]
+    now: datetime = datetime.now()
+
+    def dateRange() -> tuple[datetime, datetime]:
+        start: datetime = now - timedelta(days=generator.randint(7, 300))
+        return start, start + timedelta(days=generator.randint(1, 30))
+
+    def coldDaysInBudget(userID: str) -> int:
+        backend.invalidateDaysInUserBudget(userID)
+        return backend.getDaysInUserBudget(userID)
+
+    return {
+        'spend': timeCalls(backend.spend, [(userID, 4.5, 'Benchmark coffee', BudgetType.DINING_DOLLARS) for userID in sampleUsers]),
+        'add': timeCalls(backend.add, [(userID, 20.0, 'Benchmark refund', BudgetType.USD) for userID in sampleUsers]),
+        'getUserBudgetReport': timeCalls(backend.getUserBudgetReport, [(userID,) for userID in sampleUsers]),
+        'getUserTransactionHistory': timeCalls(backend.getUserTransactionHistory, [(userID,) for userID in sampleUsers]),
+        'getUserTransactionHistoryRange': timeCalls(backend.getUserTransactionHistory, [(userID, *dateRange()) for userID in sampleUsers]),
+        'getDaysInUserBudget': timeCalls(backend.getDaysInUserBudget, [(userID,) for userID in sampleUsers]),
+        'getDaysInUserBudgetCold': timeCalls(coldDaysInBudget, [(userID,) for userID in sampleUsers])}
+
+def benchmarkPersistence(backend, rounds: int) -> dict[str, Any]:
+    saveSamples: list[float] = []
+    loadSamples: list[float] = []
+
+    for _ in range(rounds):
+        start: float = time.perf_counter()
+        backend.saveUserData()
+        saveSamples.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        backend.store = backend.createUserDataStore()
+        backend.userData = backend.loadUserData()
+        loadSamples.append(time.perf_counter() - start)
+
+    return {'saveUserData': summarize(saveSamples), 'loadUserData': summarize(loadSamples)}
+
+class FakeUser:
+    def __init__(self, userID: str) -> None:
+        self.id: int = int(userID)
+
+class FakeResponse:
+    def __init__(self) -> None:
+        self.done: bool = False
+        self.messages: list[Optional[str]] = []
+
+    def is_done(self) -> bool:
+        return self.done
+
+    async def defer(self, **kwargs) -> None:
+        self.done = True
+
+    async def send_message(self, content: Optional[str] = None, **kwargs) -> None:
+        self.done = True
+        self.messages.append(content)
+
+    async def edit_message(self, content: Optional[str] = None, **kwargs) -> None:
+        self.done = True
+        self.messages.append(content)
+
+class FakeFollowup:
+    def __init__(self, response: FakeResponse) -> None:
+        self.response: FakeResponse = response
+
+    async def send(self, content: Optional[str] = None, **kwargs) -> None:
+        self.response.messages.append(content)
+
+class FakeInteraction:
+    # Stands in for discord.Interaction with just the parts the command handlers touch
+    def __init__(self, userID: str) -> None:
+        self.user: FakeUser = FakeUser(userID)
+        self.response: FakeResponse = FakeResponse()
+        self.followup: FakeFollowup = FakeFollowup(self.response)
+
+async def benchmarkCommands(population: dict[str, Any], samples: int, seed: int) -> dict[str, Any]:
+    import main
+
+    generator: random.Random = random.Random(seed)
+    userIDs: list[str] = list(population)
+    endDate: str = (datetime.now() + timedelta(days=150)).strftime('%Y-%m-%d')
+    rangeStart: str = (datetime.now() - timedelta(days=60)).strftime('%Y-%m-%d')
+    rangeEnd: str = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+
+    commands: dict[str, Callable[[FakeInteraction], Any]] = {
+        'report': lambda interaction: main.reportCmd.callback(interaction),
+        'transactions': lambda interaction: main.transactionsCmd.callback(interaction),
+        'transactionsRange': lambda interaction: main.transactionsCmd.callback(interaction, rangeStart, rangeEnd),
+        'spent': lambda interaction: main.spentCmd.callback(interaction, 4.5, 'Benchmark coffee'),
+        'breaks': lambda interaction: main.breaksCmd.callback(interaction),
+        'respread': lambda interaction: main.respreadCmd.callback(interaction),
+        'set-budget-end-date': lambda interaction: main.setBudgetEndDateCmd.callback(interaction, endDate)}
+
+    results: dict[str, Any] = {}
+    for name, command in commands.items():
+        latencies: list[float] = []
+
+        for _ in range(samples):
+            interaction: FakeInteraction = FakeInteraction(generator.choice(userIDs))
+
+            start: float = time.perf_counter()
+            await command(interaction)
+            latencies.append(time.perf_counter() - start)
+
+        results[name] = summarize(latencies)
+
+    return results
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description='Benchmarks backend hot paths and command handlers against synthetic user data.')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--min-ledger', type=int, default=1000)
+    parser.add_argument('--max-ledger', type=int, default=5000)
+    parser.add_argument('--breaks', type=int, default=24)
+    parser.add_argument('--samples', type=int, default=1000)
+    parser.add_argument('--command-samples', type=int, default=200)
+    parser.add_argument('--persistence-rounds', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None, help='Write the JSON results here instead of stdout.')
+    arguments: argparse.Namespace = parser.parse_args()
+
+    outputPath: Optional[str] = os.path.abspath(arguments.output) if arguments.output else None
+
+    # The backend loads and saves its data files relative to the working directory, keep them away from real user data
+    workingDirectory: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory(prefix='budget-benchmark-')
+    os.chdir(workingDirectory.name)
+
+    import backend
+    backend.intialize()
+
+    start: float = time.perf_counter()
+    population: dict[str, Any] = generatePopulation(arguments.users, arguments.min_ledger, arguments.max_ledger, arguments.breaks, arguments.seed)
+    generationSeconds: float = time.perf_counter() - start
+
+    seedStore(backend, population)
+
+    results: dict[str, Any] = {
+        'parameters': vars(arguments),
+        'storage': backend.USER_DATA_STORAGE,
+        'ledgerEntries': sum(len(data.ledger) for data in population.values()),
+        'generationSeconds': generationSeconds,
+        'backend': benchmarkBackend(backend, population, arguments.samples, arguments.seed),
+        'persistence': benchmarkPersistence(backend, arguments.persistence_rounds),
+        'commands': asyncio.run(benchmarkCommands(population, arguments.command_samples, arguments.seed))}
+
+    results['peakRSSBytes'] = getPeakRSSBytes()
+
+    output: str = json.dumps(results, indent=2)
+    if outputPath is None:
+        print(output)
+    else:
+        with open(outputPath, 'w') as file:
+            file.write(output)
+
+    backend.saveUserData()
+    workingDirectory.cleanup()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+from typing import Final
+import threading
+import weakref
+import os
+
+RENDER_CACHE_MAX_BYTES: Final[int] = int(os.getenv('RENDER_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+STRING_OVERHEAD_BYTES: Final[int] = 49
+
+def getTextSize(text: Optional[str]) -> int:
+    # Close enough to sys.getsizeof for the mostly ASCII text the reports are made of, and far cheaper
+    return len(text) + STRING_OVERHEAD_BYTES if text is not None else 8
+
+class UserRenderCache:
+    def __init__(self, data: object, version: int) -> None:
+        self.dataRef: weakref.ref = weakref.ref(data)
+        self.version: int = version
+        self.fragments: dict[Hashable, str] = {}
+        self.lines: dict[str, list[Optional[str]]] = {}
+        self.size: int = 0
+
+class RenderCache:
+    # Rendered report text per user, least recently used users are evicted once the cache passes its byte budget.
+    # Whole fragments are only valid for the user version they were rendered at, ledger rows never change once
+    # written so their formatted lines stay valid until the user's record itself is replaced.
+    def __init__(self, maxBytes: int = RENDER_CACHE_MAX_BYTES) -> None:
+        self.maxBytes: int = maxBytes
+        self.users: OrderedDict[str, UserRenderCache] = OrderedDict()
+        self.size: int = 0
+        self.lock: threading.Lock = threading.Lock()
+
+    def getEntry(self, userID: str, data: object, version: Optional[int]) -> UserRenderCache:
+        entry: Optional[UserRenderCache] = self.users.get(userID)
+
+        if entry is None or entry.dataRef() is not data:
+            if entry is not None: self.size -= entry.size
+            entry = UserRenderCache(data, version if version is not None else 0)
+            self.users[userID] = entry
+        elif version is not None and entry.version != version:
+            # Whole fragments are stale once the user changes, the formatted ledger rows are kept
+            staleSize: int = sum(getTextSize(fragment) for fragment in entry.fragments.values())
+            entry.size -= staleSize
+            self.size -= staleSize
+            entry.fragments.clear()
+            entry.version = version
+
+        self.users.move_to_end(userID)
+        return entry
+
+    def getFragment(self, userID: str, data: object, version: int, key: Hashable, render: Callable[[], str]) -> str:
+        with self.lock:
+            fragment: Optional[str] = self.getEntry(userID, data, version).fragments.get(key)
+
+        if fragment is not None: return fragment
+
+        fragment = render()
+
+        with self.lock:
+            entry: UserRenderCache = self.getEntry(userID, data, version)
+            if key not in entry.fragments:
+                entry.fragments[key] = fragment
+                entry.size += getTextSize(fragment)
+                self.size += getTextSize(fragment)
+                self.evict()
+
+        return fragment
+
+    def getLines(self, userID: str, data: object, style: str, low: int, high: int, formatLine: Callable[[int], str]) -> list[str]:
+        with self.lock:
+            cached: list[Optional[str]] = self.getEntry(userID, data, None).lines.get(style, [])[low:high]
+        cached.extend([None] * (high - low - len(cached)))
+
+        missing: dict[int, str] = {}
+        for offset, line in enumerate(cached):
+            if line is None:
+                line = cached[offset] = formatLine(low + offset)
+                missing[low + offset] = line
+
+        if missing:
+            with self.lock:
+                entry: UserRenderCache = self.getEntry(userID, data, None)
+                lines: list[Optional[str]] = entry.lines.setdefault(style, [])
+
+                added: int = getTextSize(None) * max(0, high - len(lines))
+                if len(lines) < high: lines.extend([None] * (high - len(lines)))
+
+                for index, line in missing.items():
+                    if lines[index] is None:
+                        lines[index] = line
+                        added += getTextSize(line) - getTextSize(None)
+
+                entry.size += added
+                self.size += added
+                self.evict()
+
+        return cached
+
+    def evict(self) -> None:
+        while self.size > self.maxBytes and len(self.users) > 1:
+            _, entry = self.users.popitem(last=False)
+            self.size -= entry.size
+
+    def invalidate(self, userID: str) -> None:
+        with self.lock:
+            entry: Optional[UserRenderCache] = self.users.pop(userID, None)
+            if entry is not None: self.size -= entry.size
@@ -0,0 +1,208 @@
+from models import UserSummary
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from datetime import datetime, date, time, timedelta, timezone
+from typing import Optional
+from typing import Final
+import dispatcher
+import asyncio
+import discord
+import backend
+import metrics
+import heapq
+import random
+import os
+
+DIGEST_SEND_RATE: Final[float] = float(os.getenv('DIGEST_SEND_RATE', '5'))
+DIGEST_SEND_BURST: Final[int] = int(os.getenv('DIGEST_SEND_BURST', '10'))
+DIGEST_SEND_WORKERS: Final[int] = 4
+DIGEST_PREPARE_CONCURRENCY: Final[int] = dispatcher.BACKEND_WORKER_THREADS
+DIGEST_QUEUE_SIZE: Final[int] = 256
+DIGEST_MAX_ATTEMPTS: Final[int] = 5
+DIGEST_RETRY_DELAY: Final[float] = 2.0
+DIGEST_RESYNC_INTERVAL: Final[float] = 300.0
+DIGEST_CATCH_UP: Final[timedelta] = timedelta(hours=6)
+
+def parseDigestTime(value: str) -> time:
+    return datetime.strptime(value.strip(), '%H:%M').time()
+
+def getTimeZone(name: str) -> ZoneInfo:
+    try: return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError): raise ValueError(f'unknown time zone "{name}"') from None
+
+def getNextDigestTime(summary: UserSummary, now: datetime, skipDay: Optional[date] = None) -> Optional[tuple[datetime, date]]:
+    # Returns when the user's next digest is due and the local day it covers. A digest missed while the bot was down is
+    # sent late on the same day as long as it is not too stale, otherwise the schedule moves on to the next day
+    if summary.digestTime is None or summary.budgetDate is None: return None
+
+    zone: ZoneInfo = getTimeZone(summary.digestTimeZone)
+    digestTime: time = parseDigestTime(summary.digestTime)
+    day: date = now.astimezone(zone).date()
+
+    lastDay: Optional[date] = summary.digestLastSent.date() if summary.digestLastSent is not None else None
+    if skipDay is not None and (lastDay is None or skipDay > lastDay): lastDay = skipDay
+
+    if lastDay is not None and lastDay >= day: day = lastDay + timedelta(days=1)
+
+    fireAt: datetime = datetime.combine(day, digestTime, zone)
+    if fireAt + DIGEST_CATCH_UP < now:
+        day += timedelta(days=1)
+        fireAt = datetime.combine(day, digestTime, zone)
+
+    return max(fireAt, now), day
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate: float = rate
+        self.burst: int = burst
+        self.tokens: float = float(burst)
+        self.updated: float = asyncio.get_running_loop().time()
+        self.lock: asyncio.Lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        # Waiters queue on the lock, so tokens are handed out in order and a burst of digests drains at the steady rate
+        async with self.lock:
+            loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+
+            while True:
+                now: float = loop.time()
+                self.tokens = min(float(self.burst), self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+class DigestScheduler:
+    # Next fire times sit in a min-heap, each user's current entry is kept in nextFire and outdated heap entries are skipped
+    # when popped. Due digests are rendered on the backend pool and handed to a few senders that share one token bucket
+    def __init__(self, client: discord.Client) -> None:
+        self.client: discord.Client = client
+        self.heap: list[tuple[datetime, str]] = []
+        self.nextFire: dict[str, tuple[datetime, date]] = {}
+        self.wakeup: asyncio.Event = asyncio.Event()
+        self.queue: asyncio.Queue[tuple[str, str]] = asyncio.Queue(maxsize=DIGEST_QUEUE_SIZE)
+        self.preparing: asyncio.Semaphore = asyncio.Semaphore(DIGEST_PREPARE_CONCURRENCY)
+        self.bucket: TokenBucket = TokenBucket(DIGEST_SEND_RATE, DIGEST_SEND_BURST)
+        self.tasks: set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        self.spawn(self.run())
+        for _ in range(DIGEST_SEND_WORKERS): self.spawn(self.send())
+
+    def spawn(self, coroutine) -> None:
+        task: asyncio.Task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def schedule(self, userID: str, summary: Optional[UserSummary], skipDay: Optional[date] = None) -> None:
+        nextDigest: Optional[tuple[datetime, date]] = getNextDigestTime(summary, datetime.now(timezone.utc), skipDay) if summary is not None else None
+
+        if nextDigest is None:
+            self.nextFire.pop(userID, None)
+            return
+
+        if self.nextFire.get(userID) == nextDigest: return
+
+        self.nextFire[userID] = nextDigest
+        heapq.heappush(self.heap, (nextDigest[0], userID))
+        if self.heap[0][1] == userID: self.wakeup.set()
+
+    async def reschedule(self, userID: str, skipDay: Optional[date] = None) -> None:
+        self.schedule(userID, await dispatcher.runForUser(userID, backend.getDigestSummary, userID), skipDay)
+
+    async def resync(self) -> None:
+        # Picks up schedules changed by other processes sharing the database, and anything that was missed
+        subscriptions: dict[str, UserSummary] = await asyncio.get_running_loop().run_in_executor(dispatcher.backendPool, backend.getDigestSubscriptions)
+
+        for userID in self.nextFire.keys() - subscriptions.keys():
+            del self.nextFire[userID]
+
+        for userID, summary in subscriptions.items():
+            try: self.schedule(userID, summary)
+            except ValueError as error: print(f'Skipping the digest for {userID}: {error}')
+
+    async def run(self) -> None:
+        await dispatcher.waitForStartup()
+
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        nextResync: float = 0.0
+
+        while True:
+            if loop.time() >= nextResync:
+                try: await self.resync()
+                except Exception as error: print(f'Could not load the digest schedule: {error}')
+                nextResync = loop.time() + DIGEST_RESYNC_INTERVAL
+
+            now: datetime = datetime.now(timezone.utc)
+
+            while self.heap and self.heap[0][0] <= now:
+                fireAt, userID = heapq.heappop(self.heap)
+
+                nextDigest: Optional[tuple[datetime, date]] = self.nextFire.get(userID)
+                if nextDigest is None or nextDigest[0] != fireAt: continue
+                del self.nextFire[userID]
+
+                # Only a bounded number of digests are rendered at once, the rest wait their turn here
+                await self.preparing.acquire()
+                self.spawn(self.prepare(userID, nextDigest[1]))
+
+            timeout: float = max(0.0, nextResync - loop.time())
+            if self.heap: timeout = min(timeout, max(0.0, (self.heap[0][0] - datetime.now(timezone.utc)).total_seconds()))
+
+            self.wakeup.clear()
+            try: await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError: pass
+
+    async def prepare(self, userID: str, day: date) -> None:
+        try:
+            digest: Optional[str] = await dispatcher.runForUser(userID, backend.claimDigest, userID, day)
+            if digest is not None: await self.queue.put((userID, digest))
+        except Exception as error:
+            print(f'Could not prepare the digest for {userID}: {error}')
+        finally:
+            self.preparing.release()
+
+        # The day is skipped even when preparing it failed, so one broken record cannot retry in a tight loop
+        try: await self.reschedule(userID, skipDay=day)
+        except Exception as error: print(f'Could not reschedule the digest for {userID}: {error}')
+
+    async def send(self) -> None:
+        while True:
+            userID, digest = await self.queue.get()
+
+            try: status: str = await self.deliver(userID, digest)
+            except Exception as error:
+                print(f'Could not send the digest to {userID}: {error}')
+                status = 'failed'
+            finally:
+                self.queue.task_done()
+
+            if metrics.METRICS_ENABLED:
+                metrics.increment('budget_bot_digests_total', status=status)
+
+    async def deliver(self, userID: str, digest: str) -> str:
+        for attempt in range(DIGEST_MAX_ATTEMPTS):
+            try:
+                user: Optional[discord.User] = self.client.get_user(int(userID))
+
+                if user is None:
+                    await self.bucket.acquire()
+                    user = await self.client.fetch_user(int(userID))
+
+                await self.bucket.acquire()
+                await user.send(digest)
+                return 'sent'
+            except (discord.Forbidden, discord.NotFound):
+                # DMs are closed or the account is gone, retrying will not help
+                return 'undeliverable'
+            except discord.HTTPException as error:
+                if error.status != 429 and error.status < 500: return 'failed'
+            except (OSError, asyncio.TimeoutError):
+                pass
+
+            # discord.py already waits out the rate limits it is told about, this backs off from anything past that
+            await asyncio.sleep(DIGEST_RETRY_DELAY * 2 ** attempt * random.uniform(1.0, 1.5))
+
+        return 'failed'
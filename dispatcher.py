@@ -0,0 +1,97 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from weakref import WeakValueDictionary
+from typing import Any, Callable, Optional
+from typing import Final
+import functools
+import asyncio
+import discord
+import storage
+import metrics
+import os
+
+BACKEND_WORKER_THREADS: Final[int] = int(os.getenv('BACKEND_WORKER_THREADS', min(8, (os.cpu_count() or 1) + 2)))
+INTERACTION_DEFER_AFTER: Final[float] = 1.0
+DISCORD_MESSAGE_LIMIT: Final[int] = 2000
+
+backendPool: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=BACKEND_WORKER_THREADS, thread_name_prefix='backend')
+userLocks: WeakValueDictionary[str, asyncio.Lock] = WeakValueDictionary()
+startupTask: Optional[Future] = None
+
+def getUserLock(userID: str) -> asyncio.Lock:
+    lock: asyncio.Lock = userLocks.get(userID)
+
+    if lock is None:
+        lock = asyncio.Lock()
+        userLocks[userID] = lock
+
+    return lock
+
+def runStartupTask(function: Callable) -> None:
+    # Runs on the pool alongside the gateway connecting, backend calls wait for it before they start
+    global startupTask
+    startupTask = backendPool.submit(function)
+
+async def waitForStartup() -> None:
+    if startupTask is None: return
+
+    if not startupTask.done(): await asyncio.wrap_future(startupTask)
+    else: startupTask.result()
+
+def callAndTakeCommit(call: Callable) -> tuple[Any, Optional[Future]]:
+    storage.takePendingCommit()
+    return call(), storage.takePendingCommit()
+
+async def runForUser(userID: str, function: Callable, *args, **kwargs) -> Any:
+    # Calls for the same user run one at a time in order, calls for different users run side by side on the pool
+    await waitForStartup()
+
+    async with getUserLock(userID):
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        call: Callable = functools.partial(metrics.timeBackendCall, function, *args, **kwargs) if metrics.METRICS_ENABLED else functools.partial(function, *args, **kwargs)
+
+        result, commit = await loop.run_in_executor(backendPool, callAndTakeCommit, call)
+
+    # A mutation is only reported done once its batch is durable. The wait happens after the user's lock is released,
+    # so their next call joins the following batch instead of waiting behind this one
+    if commit is not None: await asyncio.wrap_future(commit)
+    return result
+
+async def runForInteraction(interaction: discord.Interaction, userID: str, function: Callable, *args, ephemeral: bool = True, **kwargs) -> Any:
+    task: asyncio.Task = asyncio.ensure_future(runForUser(userID, function, *args, **kwargs))
+    done, _ = await asyncio.wait({task}, timeout=INTERACTION_DEFER_AFTER)
+
+    # Discord drops interactions that are not acknowledged within 3 seconds, so slow work gets a deferred response
+    if not done and not interaction.response.is_done():
+        await interaction.response.defer(ephemeral=ephemeral, thinking=True)
+
+    return await task
+
+async def respond(interaction: discord.Interaction, content: str = None, **kwargs) -> None:
+    if interaction.response.is_done(): await interaction.followup.send(content, **kwargs)
+    else: await interaction.response.send_message(content, **kwargs)
+
+def splitMessage(content: str, limit: int = DISCORD_MESSAGE_LIMIT) -> list[str]:
+    # Breaks between lines so report rows stay whole, only a single line longer than the limit is cut
+    parts: list[str] = []
+    part: str = ''
+
+    for line in content.splitlines(keepends=True):
+        while len(line) > limit:
+            if part: parts.append(part)
+            part = ''
+            parts.append(line[:limit])
+            line = line[limit:]
+
+        if len(part) + len(line) > limit:
+            parts.append(part)
+            part = ''
+
+        part += line
+
+    if part or not parts: parts.append(part)
+    return parts
+
+async def respondInParts(interaction: discord.Interaction, content: str, **kwargs) -> None:
+    # The first part answers the interaction, the rest follow up
+    for part in splitMessage(content):
+        await respond(interaction, part, **kwargs)
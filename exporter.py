@@ -0,0 +1,237 @@
+from models import BreakSchedule, Ledger, UserData, LEDGER_EPOCH, ONE_MICROSECOND, toCents, fromCents
+from datetime import datetime, timedelta
+from typing import BinaryIO, Iterator, Optional
+from typing import Final
+from array import array
+import tempfile
+import argparse
+import struct
+import gzip
+import zlib
+import csv
+import sys
+import io
+import os
+
+EXPORT_CHUNK_ROWS: Final[int] = 4096
+EXPORT_SPOOL_BYTES: Final[int] = 1024 * 1024
+EXPORT_MAX_ATTACHMENT_BYTES: Final[int] = 10 * 1024 * 1024
+EXPORT_FORMATS: Final[tuple[str, ...]] = ('csv', 'columnar')
+
+CSV_TRANSACTION_HEADER: Final[tuple[str, ...]] = ('Date', 'Description', 'Amount', 'Budget Type')
+CSV_BREAK_HEADER: Final[tuple[str, ...]] = ('Start', 'End')
+
+# Columnar layout: the magic, then tagged blocks (4 byte tag, 4 byte length, payload) until an END block.
+# DESC blocks add to the description table, ROWS blocks hold one chunk of rows as separately compressed
+# little endian columns (amounts i64 cents, timestamps i64 microseconds since 1970-01-01, budget type codes i8,
+# description indexes i32) and the BRKS block holds the break start and end timestamps interleaved.
+# Version 1 exports are the same apart from the amounts, which were f64 dollars
+COLUMNAR_MAGIC: Final[bytes] = b'BGTCOL02'
+COLUMNAR_V1_MAGIC: Final[bytes] = b'BGTCOL01'
+COLUMNAR_BLOCK_HEADER: Final[struct.Struct] = struct.Struct('<4sI')
+COLUMNAR_COUNT: Final[struct.Struct] = struct.Struct('<I')
+COLUMNAR_COLUMN_TYPES: Final[tuple[str, ...]] = ('q', 'q', 'b', 'i')
+
+def formatTimestamp(timestamp: int) -> str:
+    return (LEDGER_EPOCH + timedelta(microseconds=timestamp)).isoformat(sep=' ')
+
+def getBreaksInRange(breaks: BreakSchedule, start: Optional[datetime], end: Optional[datetime]) -> list[tuple[datetime, datetime]]:
+    return [(breakStart, breakEnd) for breakStart, breakEnd in breaks
+            if (end is None or breakStart < end) and (start is None or breakEnd >= start)]
+
+def iterChunks(low: int, high: int, chunkRows: int = EXPORT_CHUNK_ROWS) -> Iterator[tuple[int, int]]:
+    for chunkStart in range(low, high, chunkRows):
+        yield chunkStart, min(high, chunkStart + chunkRows)
+
+def writeCSVTransactions(ledger: Ledger, output: BinaryIO, start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+    # Written a chunk of rows at a time through gzip, the columns match what /import expects by default
+    low, high = ledger.indexRange(start, end)
+
+    with gzip.GzipFile(fileobj=output, mode='wb') as compressed, io.TextIOWrapper(compressed, encoding='utf-8', newline='') as text:
+        writer = csv.writer(text)
+        writer.writerow(CSV_TRANSACTION_HEADER)
+
+        for chunkStart, chunkEnd in iterChunks(low, high):
+            writer.writerows((formatTimestamp(ledger.timestamps[i]),
+                              ledger.descriptions[ledger.descriptionIndexes[i]],
+                              f'{fromCents(ledger.amounts[i]):.2f}',
+                              str(ledger.getBudgetType(i) or '')) for i in range(chunkStart, chunkEnd))
+
+    return high - low
+
+def writeCSVBreaks(breaks: BreakSchedule, output: BinaryIO, start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+    selectedBreaks: list[tuple[datetime, datetime]] = getBreaksInRange(breaks, start, end)
+
+    with gzip.GzipFile(fileobj=output, mode='wb') as compressed, io.TextIOWrapper(compressed, encoding='utf-8', newline='') as text:
+        writer = csv.writer(text)
+        writer.writerow(CSV_BREAK_HEADER)
+        writer.writerows((breakStart.isoformat(sep=' '), breakEnd.isoformat(sep=' ')) for breakStart, breakEnd in selectedBreaks)
+
+    return len(selectedBreaks)
+
+def writeColumnarBlock(output: BinaryIO, tag: bytes, payload: bytes) -> None:
+    output.write(COLUMNAR_BLOCK_HEADER.pack(tag, len(payload)))
+    output.write(payload)
+
+def packColumn(column: array) -> bytes:
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+
+    compressed: bytes = zlib.compress(column.tobytes())
+    return COLUMNAR_COUNT.pack(len(compressed)) + compressed
+
+def unpackColumn(payload: memoryview, offset: int, typecode: str) -> tuple[array, int]:
+    (length,) = COLUMNAR_COUNT.unpack_from(payload, offset)
+    offset += COLUMNAR_COUNT.size
+
+    column: array = array(typecode, zlib.decompress(payload[offset:offset + length]))
+    if sys.byteorder == 'big': column.byteswap()
+
+    return column, offset + length
+
+def writeColumnarExport(ledger: Ledger, breaks: BreakSchedule, output: BinaryIO, start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+    low, high = ledger.indexRange(start, end)
+    output.write(COLUMNAR_MAGIC)
+
+    # Descriptions are renumbered in the order the export first uses them, each chunk only carries the new ones
+    exportIndexes: dict[int, int] = {}
+
+    for chunkStart, chunkEnd in iterChunks(low, high):
+        newDescriptions: list[str] = []
+        descriptionIndexes: array = array('i')
+
+        for descriptionIndex in ledger.descriptionIndexes[chunkStart:chunkEnd]:
+            exportIndex: Optional[int] = exportIndexes.get(descriptionIndex)
+            if exportIndex is None:
+                exportIndex = exportIndexes[descriptionIndex] = len(exportIndexes)
+                newDescriptions.append(ledger.descriptions[descriptionIndex])
+
+            descriptionIndexes.append(exportIndex)
+
+        if newDescriptions:
+            encoded: list[bytes] = [description.encode() for description in newDescriptions]
+            writeColumnarBlock(output, b'DESC', COLUMNAR_COUNT.pack(len(encoded)) + zlib.compress(
+                b''.join(COLUMNAR_COUNT.pack(len(description)) + description for description in encoded)))
+
+        columns: tuple[array, ...] = (ledger.amounts[chunkStart:chunkEnd], ledger.timestamps[chunkStart:chunkEnd],
+                                      ledger.budgetTypeCodes[chunkStart:chunkEnd], descriptionIndexes)
+        writeColumnarBlock(output, b'ROWS', COLUMNAR_COUNT.pack(chunkEnd - chunkStart) + b''.join(packColumn(column) for column in columns))
+
+    breakTimestamps: array = array('q')
+    for breakStart, breakEnd in getBreaksInRange(breaks, start, end):
+        breakTimestamps.append((breakStart - LEDGER_EPOCH) // ONE_MICROSECOND)
+        breakTimestamps.append((breakEnd - LEDGER_EPOCH) // ONE_MICROSECOND)
+
+    writeColumnarBlock(output, b'BRKS', COLUMNAR_COUNT.pack(len(breakTimestamps) // 2) + packColumn(breakTimestamps))
+    writeColumnarBlock(output, b'END\0', b'')
+    return high - low
+
+def readColumnarExport(source: BinaryIO) -> tuple[Ledger, BreakSchedule]:
+    magic: bytes = source.read(len(COLUMNAR_MAGIC))
+    if magic != COLUMNAR_MAGIC and magic != COLUMNAR_V1_MAGIC: raise ValueError('Not a columnar ledger export')
+
+    ledger: Ledger = Ledger()
+    breaks: BreakSchedule = BreakSchedule()
+
+    while True:
+        header: bytes = source.read(COLUMNAR_BLOCK_HEADER.size)
+        if len(header) < COLUMNAR_BLOCK_HEADER.size: raise ValueError('Columnar ledger export is truncated')
+
+        tag, length = COLUMNAR_BLOCK_HEADER.unpack(header)
+        payload: memoryview = memoryview(source.read(length))
+        if len(payload) < length: raise ValueError('Columnar ledger export is truncated')
+
+        if tag == b'END\0': return ledger, breaks
+
+        if tag == b'DESC':
+            table: bytes = zlib.decompress(payload[COLUMNAR_COUNT.size:])
+            offset: int = 0
+
+            for _ in range(COLUMNAR_COUNT.unpack_from(payload)[0]):
+                (descriptionLength,) = COLUMNAR_COUNT.unpack_from(table, offset)
+                offset += COLUMNAR_COUNT.size
+                ledger.getDescriptionIndex(table[offset:offset + descriptionLength].decode())
+                offset += descriptionLength
+        elif tag == b'ROWS':
+            offset = COLUMNAR_COUNT.size
+            columns: list[array] = []
+
+            amountType: str = 'd' if magic == COLUMNAR_V1_MAGIC else COLUMNAR_COLUMN_TYPES[0]
+
+            for typecode in (amountType, *COLUMNAR_COLUMN_TYPES[1:]):
+                column, offset = unpackColumn(payload, offset, typecode)
+                columns.append(column)
+
+            if magic == COLUMNAR_V1_MAGIC: columns[0] = array('q', map(toCents, columns[0]))
+            ledger.extendColumns(*columns)
+        elif tag == b'BRKS':
+            timestamps, _ = unpackColumn(payload, COLUMNAR_COUNT.size, 'q')
+
+            for i in range(0, len(timestamps), 2):
+                breaks.add(LEDGER_EPOCH + timedelta(microseconds=timestamps[i]), LEDGER_EPOCH + timedelta(microseconds=timestamps[i + 1]))
+
+def getExportFileNames(exportFormat: str, baseName: str) -> tuple[str, ...]:
+    if exportFormat == 'csv': return f'{baseName}-transactions.csv.gz', f'{baseName}-breaks.csv.gz'
+    return (f'{baseName}.bgtcol',)
+
+def exportUserData(data: UserData, exportFormat: str, baseName: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> list[tuple[str, BinaryIO]]:
+    # Small exports stay in memory, larger ones spill to disk, either way the caller gets rewound files to attach or copy
+    if exportFormat not in EXPORT_FORMATS: raise ValueError(f'Unknown export format "{exportFormat}", expected one of {", ".join(EXPORT_FORMATS)}')
+
+    files: list[tuple[str, BinaryIO]] = [(fileName, tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)) for fileName in getExportFileNames(exportFormat, baseName)]
+
+    if exportFormat == 'csv':
+        writeCSVTransactions(data.ledger, files[0][1], start, end)
+        writeCSVBreaks(data.breaks, files[1][1], start, end)
+    else:
+        writeColumnarExport(data.ledger, data.breaks, files[0][1], start, end)
+
+    for _, file in files:
+        file.seek(0)
+
+    return files
+
+def loadSavedUser(userID: str, storage: str, snapshotPath: str, journalPath: str, databasePath: str) -> Optional[UserData]:
+    # Reads the saved files as they are, without opening the journal for writing or touching the bot
+    from storage import JournalStore, SQLiteStore
+
+    if storage == 'sqlite':
+        store: SQLiteStore = SQLiteStore(databasePath)
+        try: return store.loadUser(userID)
+        finally: store.close()
+
+    journalStore: JournalStore = JournalStore(snapshotPath, journalPath)
+    journalStore.readState()
+    return journalStore.userData[userID] if userID in journalStore.userData else None
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description='Exports a user\'s ledger and breaks from the saved user data, without running the bot.')
+    parser.add_argument('user', help='Discord user ID to export.')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    parser.add_argument('--start', type=str, default=None, help='First day to export, YYYY-MM-DD.')
+    parser.add_argument('--end', type=str, default=None, help='Last day to export, YYYY-MM-DD.')
+    parser.add_argument('--output-dir', type=str, default='.')
+    parser.add_argument('--storage', choices=('journal', 'sqlite'), default=os.getenv('USER_DATA_STORAGE', 'journal'))
+    parser.add_argument('--snapshot', type=str, default='user_data.pkl')
+    parser.add_argument('--journal', type=str, default='user_data.journal')
+    parser.add_argument('--database', type=str, default='user_data.db')
+    arguments: argparse.Namespace = parser.parse_args()
+
+    start: Optional[datetime] = datetime.strptime(arguments.start, '%Y-%m-%d') if arguments.start else None
+    end: Optional[datetime] = datetime.strptime(arguments.end, '%Y-%m-%d') + timedelta(days=1) if arguments.end else None
+
+    data: Optional[UserData] = loadSavedUser(arguments.user, arguments.storage, arguments.snapshot, arguments.journal, arguments.database)
+    if data is None: sys.exit(f'No saved data for user {arguments.user}')
+
+    for fileName, file in exportUserData(data, arguments.format, f'budget-{arguments.user}', start, end):
+        path: str = os.path.join(arguments.output_dir, fileName)
+
+        with file, open(path, 'wb') as destination:
+            while chunk := file.read(1 << 16):
+                destination.write(chunk)
+
+        print(f'Wrote {path}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+from models import BudgetType, Ledger, BUDGET_TYPES
+from dataclasses import dataclass
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Iterator, Optional, TextIO, Union
+from typing import Final
+import functools
+import hashlib
+import gzip
+import csv
+import re
+
+IMPORT_MAX_FILE_BYTES: Final[int] = 25 * 1024 * 1024
+IMPORT_MAX_ROWS: Final[int] = 200_000
+IMPORT_MAX_REPORTED_ERRORS: Final[int] = 5
+IMPORT_DATE_FORMATS: Final[tuple[str, ...]] = (
+    '%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S',
+    '%m/%d/%Y', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M', '%m/%d/%Y %I:%M %p', '%m/%d/%y', '%m/%d/%y %H:%M')
+
+BUDGET_TYPE_NAMES: Final[dict[str, BudgetType]] = {
+    'diningdollars': BudgetType.DINING_DOLLARS, 'dining': BudgetType.DINING_DOLLARS, 'dd': BudgetType.DINING_DOLLARS,
+    'tigerbucks': BudgetType.TIGER_BUCKS, 'tiger': BudgetType.TIGER_BUCKS, 'tb': BudgetType.TIGER_BUCKS,
+    'usd': BudgetType.USD, 'dollars': BudgetType.USD, 'cash': BudgetType.USD}
+
+OFX_TAG_PATTERN: Final[re.Pattern] = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+class ImportFileError(ValueError):
+    pass
+
+@dataclass
+class ColumnMapping:
+    amount: str = 'Amount'
+    description: str = 'Description'
+    timestamp: str = 'Date'
+    budgetType: Optional[str] = None
+    dateFormat: Optional[str] = None
+    defaultBudgetType: Optional[BudgetType] = None
+    spendingIsPositive: bool = False
+
+def parseAmount(value: str) -> float:
+    value = value.strip().replace('$', '').replace(',', '')
+
+    # Accounting exports write negative amounts in parentheses
+    if value.startswith('(') and value.endswith(')'): value = f'-{value[1:-1]}'
+
+    try: return round(float(value), 2)
+    except ValueError: raise ValueError(f'invalid amount "{value}"') from None
+
+def parseBudgetType(value: str) -> BudgetType:
+    budgetType: Optional[BudgetType] = BUDGET_TYPE_NAMES.get(re.sub(r'[^a-z]', '', value.lower()))
+    if budgetType is None: raise ValueError(f'unknown budget type "{value}"')
+
+    return budgetType
+
+class DateParser:
+    # Exports use one date format throughout, so the format that last worked is tried first
+    def __init__(self, dateFormat: Optional[str] = None) -> None:
+        self.formats: list[str] = [dateFormat] if dateFormat else list(IMPORT_DATE_FORMATS)
+
+    def parse(self, value: str) -> datetime:
+        value = value.strip()
+
+        for i, dateFormat in enumerate(self.formats):
+            try: parsed: datetime = datetime.strptime(value, dateFormat)
+            except ValueError: continue
+
+            if i > 0: self.formats.insert(0, self.formats.pop(i))
+            return parsed
+
+        raise ValueError(f'unrecognized date "{value}"')
+
+def getColumnIndex(header: list[str], name: str) -> int:
+    normalizedHeader: list[str] = [column.strip().lower() for column in header]
+
+    try: return normalizedHeader.index(name.strip().lower())
+    except ValueError: raise ImportFileError(f'The file has no "{name}" column, its columns are: {", ".join(header)}')
+
+ImportedRow = tuple[int, Union[tuple[tuple[float, str, datetime], BudgetType], ValueError]]
+
+def readCSVTransactions(file: TextIO, mapping: ColumnMapping) -> Iterator[ImportedRow]:
+    # Yields (row number, (transaction, budget type)) one row at a time, rows that cannot be read yield their ValueError instead
+    reader: Iterator[list[str]] = csv.reader(file)
+
+    header: Optional[list[str]] = next(reader, None)
+    if header is None: raise ImportFileError('The file is empty.')
+
+    amountColumn: int = getColumnIndex(header, mapping.amount)
+    descriptionColumn: int = getColumnIndex(header, mapping.description)
+    timestampColumn: int = getColumnIndex(header, mapping.timestamp)
+    budgetTypeColumn: Optional[int] = getColumnIndex(header, mapping.budgetType) if mapping.budgetType else None
+    lastColumn: int = max(amountColumn, descriptionColumn, timestampColumn, budgetTypeColumn or 0)
+
+    if budgetTypeColumn is None and mapping.defaultBudgetType is None:
+        raise ImportFileError('Pick a budget type column or a default budget type for the imported transactions.')
+
+    dateParser: DateParser = DateParser(mapping.dateFormat)
+    sign: float = -1.0 if mapping.spendingIsPositive else 1.0
+
+    for rowNumber, row in enumerate(reader, start=2):
+        if not any(cell.strip() for cell in row): continue
+
+        try:
+            if len(row) <= lastColumn: raise ValueError(f'expected at least {lastColumn + 1} columns, found {len(row)}')
+
+            budgetType: Optional[BudgetType] = mapping.defaultBudgetType
+            if budgetTypeColumn is not None and row[budgetTypeColumn].strip(): budgetType = parseBudgetType(row[budgetTypeColumn])
+            if budgetType is None: raise ValueError('no budget type given')
+
+            yield rowNumber, ((sign * parseAmount(row[amountColumn]), row[descriptionColumn].strip(), dateParser.parse(row[timestampColumn])), budgetType)
+        except ValueError as error:
+            yield rowNumber, error
+
+def readOFXTransaction(fields: dict[str, str], mapping: ColumnMapping) -> tuple[tuple[float, str, datetime], BudgetType]:
+    if 'TRNAMT' not in fields or 'DTPOSTED' not in fields: raise ValueError('missing TRNAMT or DTPOSTED')
+
+    # DTPOSTED is YYYYMMDD with an optional HHMMSS, fractional seconds and a [offset:zone] suffix
+    posted: str = re.sub(r'[^0-9].*$', '', fields['DTPOSTED'])
+    timestamp: datetime = datetime.strptime(posted[:14], '%Y%m%d%H%M%S') if len(posted) >= 14 else datetime.strptime(posted[:8], '%Y%m%d')
+    description: str = fields.get('NAME') or fields.get('MEMO') or 'Imported transaction'
+
+    sign: float = -1.0 if mapping.spendingIsPositive else 1.0
+    return (sign * parseAmount(fields['TRNAMT']), description, timestamp), mapping.defaultBudgetType
+
+def readOFXTransactions(file: TextIO, mapping: ColumnMapping) -> Iterator[ImportedRow]:
+    # Handles both SGML style OFX, where closing tags are optional, and the XML variant, one tag at a time
+    if mapping.defaultBudgetType is None: raise ImportFileError('OFX files do not say which budget a transaction used, pick a default budget type.')
+
+    fields: Optional[dict[str, str]] = None
+    transactionNumber: int = 0
+
+    for line in file:
+        for closing, tag, value in OFX_TAG_PATTERN.findall(line):
+            tag = tag.upper()
+
+            if tag == 'STMTTRN' and not closing:
+                fields = {}
+            elif tag == 'STMTTRN' and fields is not None:
+                transactionNumber += 1
+
+                try: yield transactionNumber, readOFXTransaction(fields, mapping)
+                except ValueError as error: yield transactionNumber, error
+
+                fields = None
+            elif fields is not None and not closing and value.strip():
+                fields[tag] = value.strip()
+
+def isCompressedFile(fileName: str) -> bool:
+    return fileName.lower().endswith('.gz')
+
+def isOFXFile(fileName: str) -> bool:
+    return fileName.lower().removesuffix('.gz').endswith(('.ofx', '.qfx'))
+
+def readImportFile(path: str, fileName: str, mapping: ColumnMapping) -> Ledger:
+    # Parsed straight into a columnar ledger, so even the largest accepted file only costs a few bytes per row.
+    # Either every row is read or nothing is imported, the first few bad rows are reported back
+    transactions: Ledger = Ledger()
+    errors: list[str] = []
+    errorCount: int = 0
+    rowLabel: str = 'Transaction' if isOFXFile(fileName) else 'Row'
+
+    # The ledger is kept in time order by appending new transactions at the end, a future dated row would sit after them
+    now: datetime = datetime.now()
+
+    # Compressed CSV exports from /export import as they are
+    openFile: Callable[..., TextIO] = functools.partial(gzip.open, mode='rt') if isCompressedFile(fileName) else open
+
+    try:
+        with openFile(path, newline='', encoding='utf-8-sig') as file:
+            rows: Iterator[ImportedRow] = readOFXTransactions(file, mapping) if isOFXFile(fileName) else readCSVTransactions(file, mapping)
+
+            for rowNumber, row in rows:
+                if not isinstance(row, ValueError) and row[0][2] > now:
+                    row = ValueError(f'dated {row[0][2].strftime("%Y-%m-%d %H:%M")}, which is in the future')
+
+                if isinstance(row, ValueError):
+                    errorCount += 1
+                    if len(errors) < IMPORT_MAX_REPORTED_ERRORS: errors.append(f'{rowLabel} {rowNumber}: {row}')
+                    continue
+
+                transactions.append(*row)
+
+                if len(transactions) > IMPORT_MAX_ROWS:
+                    raise ImportFileError(f'The file has more than {IMPORT_MAX_ROWS} transactions, split it up and import the parts one at a time.')
+    # Files that cannot be read at all still need an answer for the user, not an error that leaves the command hanging
+    except csv.Error as error:
+        raise ImportFileError(f'The file is not valid CSV ({error}).') from error
+    except (OSError, EOFError) as error:
+        # gzip.BadGzipFile is an OSError, a gzip file that was cut short raises EOFError
+        raise ImportFileError(f'The file could not be read, it may be damaged or not really compressed ({error}).') from error
+    except UnicodeDecodeError as error:
+        raise ImportFileError(f'The file is not UTF-8 text ({error}).') from error
+
+    if errors: raise ImportFileError(f'{errorCount} row(s) could not be read, nothing was imported:\n' + '\n'.join(f'- {error}' for error in errors))
+    if not transactions: raise ImportFileError('The file has no transactions in it.')
+
+    return transactions.sortedByTime()
+
+def getTransactionHash(amount: int, description: str, timestamp: int, budgetTypeCode: int) -> int:
+    return int.from_bytes(hashlib.blake2b(f'{amount}\x1f{description}\x1f{timestamp}\x1f{budgetTypeCode}'.encode(), digest_size=8).digest(), 'little')
+
+def getLedgerHashes(ledger: Ledger) -> Iterator[int]:
+    for i in range(len(ledger)):
+        yield getTransactionHash(ledger.amounts[i], ledger.descriptions[ledger.descriptionIndexes[i]], ledger.timestamps[i], ledger.budgetTypeCodes[i])
+
+def removeDuplicates(ledger: Ledger, transactions: Ledger) -> Ledger:
+    # Hashes are counted rather than just collected, so two identical purchases on the same day in a statement both
+    # import the first time and neither does the second, while a file imported twice adds nothing
+    seen: Counter[int] = Counter(getLedgerHashes(ledger))
+    newTransactions: Ledger = Ledger()
+
+    for i, transactionHash in enumerate(getLedgerHashes(transactions)):
+        if seen[transactionHash] > 0:
+            seen[transactionHash] -= 1
+            continue
+
+        newTransactions.appendRow(transactions, i)
+
+    return newTransactions
+
+def getBalanceChanges(transactions: Ledger) -> dict[BudgetType, int]:
+    # Cents per budget type straight from the ledger's running totals, imported rows always have a budget type
+    return {budgetType: transactions.getTotal(budgetType) for budgetType in BUDGET_TYPES if transactions.getTotal(budgetType) != 0}
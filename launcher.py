@@ -0,0 +1,62 @@
+from typing import Final
+import multiprocessing
+import argparse
+import signal
+import time
+import sys
+import os
+
+SHARED_STORAGE_ENVIRONMENT: Final[dict[str, str]] = {'USER_DATA_STORAGE': 'sqlite', 'USER_DATA_SHARED': '1'}
+PROCESS_POLL_INTERVAL: Final[float] = 1.0
+
+def runShardProcess(shardIDs: list[int], shardCount: int, processIndex: int) -> None:
+    # Runs in a freshly spawned interpreter, so the environment is in place before backend and main read it on import
+    os.environ.update(SHARED_STORAGE_ENVIRONMENT)
+    os.environ['SHARD_COUNT'] = str(shardCount)
+    os.environ['SHARD_IDS'] = ','.join(str(shardID) for shardID in shardIDs)
+    os.environ['METRICS_PORT'] = str(int(os.getenv('METRICS_PORT', '9464')) + processIndex)
+
+    import main
+    main.main()
+
+def splitShards(shardCount: int, processCount: int) -> list[list[int]]:
+    return [list(range(processIndex, shardCount, processCount)) for processIndex in range(processCount)]
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description='Runs the bot as several processes, each owning a subset of the gateway shards.')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--shards', type=int, default=None, help='Total shard count, defaults to one shard per process.')
+    arguments: argparse.Namespace = parser.parse_args()
+
+    shardCount: int = arguments.shards or arguments.processes
+    processCount: int = min(arguments.processes, shardCount)
+
+    # Every process shares the SQLite user data file, which serializes each user's writes across processes
+    context = multiprocessing.get_context('spawn')
+    processes: list[multiprocessing.Process] = [
+        context.Process(target=runShardProcess, args=(shardIDs, shardCount, processIndex), name=f'shards-{processIndex}')
+        for processIndex, shardIDs in enumerate(splitShards(shardCount, processCount))]
+
+    for process in processes:
+        process.start()
+        print(f'Started {process.name} (pid {process.pid})')
+
+    def stop(*_) -> None:
+        for process in processes:
+            if process.is_alive(): process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # If any shard process dies the whole deployment goes down, so a supervisor can restart it as one unit
+    while all(process.is_alive() for process in processes):
+        time.sleep(PROCESS_POLL_INTERVAL)
+
+    stop()
+    for process in processes:
+        process.join()
+
+    sys.exit(max((process.exitcode or 0) for process in processes))
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,53 @@
 from discord.app_commands import CommandTree
-from discord import Intents, Client, Message
+from discord import Intents, Client, AutoShardedClient, Message
 from dotenv import load_dotenv
 from datetime import datetime
-from typing import Optional
+from models import BudgetType, DEFAULT_TIME_ZONE, getGroupID
+from typing import BinaryIO, Iterator, Optional
 from typing import Final
+import dispatcher
+import tempfile
+import hashlib
+import importer
+import exporter
+import digest
+import asyncio
 import discord
+import metrics
 import backend
+import views
+import json
+import time
 import os
 
 load_dotenv()
 DISCORD_TOKEN: Final[str] = os.getenv('DISCORD_TOKEN')
+SHARD_COUNT: Final[Optional[str]] = os.getenv('SHARD_COUNT')
+SHARD_IDS: Final[Optional[list[int]]] = [int(shardID) for shardID in os.getenv('SHARD_IDS').split(',')] if os.getenv('SHARD_IDS') else None
+COMMAND_TREE_HASH_FILE: Final[str] = os.getenv('COMMAND_TREE_HASH_FILE', 'command_tree.hash')
+FORCE_COMMAND_SYNC: Final[bool] = os.getenv('FORCE_COMMAND_SYNC', '0') == '1'
+
+def createClient(intents: Intents) -> Client:
+    if SHARD_COUNT is None: return Client(intents=intents)
+
+    # SHARD_COUNT=auto lets Discord pick the shard count, SHARD_IDS limits this process to some of the shards (see launcher.py)
+    if SHARD_COUNT == 'auto': return AutoShardedClient(intents=intents)
+    return AutoShardedClient(intents=intents, shard_count=int(SHARD_COUNT), shard_ids=SHARD_IDS)
+
+def ownsCommandSync() -> bool:
+    # Commands are global, so only the process running shard 0 uploads them
+    return SHARD_IDS is None or 0 in SHARD_IDS
 
 intents: Intents = Intents.default()
 intents.message_content = True
-client: Client = Client(intents=intents)
+client: Client = createClient(intents)
 tree: CommandTree = CommandTree(client)
+metricsServer: Optional[asyncio.AbstractServer] = None
+connectStarted: Optional[float] = None
+digestScheduler: Optional[digest.DigestScheduler] = None
 
 @tree.command(name='setup', description='Sets up the bot for the user.')
+@metrics.instrumentCommand('setup')
 async def setupCmd(interaction: discord.Interaction, 
                    starting_dining_dollars: float, 
                    starting_tiger_bucks: float, 
@@ -25,45 +56,60 @@ async def setupCmd(interaction: discord.Interaction,
     
     userID: str = str(interaction.user.id)
 
-    if backend.isBudgetSetup(userID):
-        await interaction.response.send_message('You have already set up your budget!', ephemeral=True)
+    if await dispatcher.runForInteraction(interaction, userID, backend.isBudgetSetup, userID):
+        await dispatcher.respond(interaction, 'You have already set up your budget!', ephemeral=True)
         return
     
     try: 
         parsedDate: datetime = datetime.strptime(budget_end_date, '%Y-%m-%d')
 
         if parsedDate.date() <= datetime.now().date():
-            await interaction.response.send_message('The budget end date must be in the future!', ephemeral=True)
+            await dispatcher.respond(interaction, 'The budget end date must be in the future!', ephemeral=True)
             return
 
-        backend.setupBudget(userID, starting_dining_dollars, starting_tiger_bucks, starting_us_dollars, parsedDate)
-        await interaction.response.send_message(f'Setup complete! Your budget will end on {parsedDate.strftime("%A, %B %d, %Y")}.\n\nYour current balance: {backend.getUserBalance(userID)}', ephemeral=True)
+        await dispatcher.runForInteraction(interaction, userID, backend.setupBudget, userID, starting_dining_dollars, starting_tiger_bucks, starting_us_dollars, parsedDate)
+        balance: float = await dispatcher.runForInteraction(interaction, userID, backend.getUserBalance, userID)
+        await dispatcher.respond(interaction, f'Setup complete! Your budget will end on {parsedDate.strftime("%A, %B %d, %Y")}.\n\nYour current balance: {balance}', ephemeral=True)
     except ValueError:
-        await interaction.response.send_message('Invalid date format! Use YYYY-MM-DD.', ephemeral=True)
+        await dispatcher.respond(interaction, 'Invalid date format! Use YYYY-MM-DD.', ephemeral=True)
         return
     
 @tree.command(name='report', description='Reports your current balance and daily budget.')
+@metrics.instrumentCommand('report')
 async def reportCmd(interaction: discord.Interaction) -> None:
     userID: str = str(interaction.user.id)
 
-    if not backend.isBudgetSetup(userID):
-        await interaction.response.send_message('You need to set up your budget first using /setup.', ephemeral=True)
+    if not await dispatcher.runForInteraction(interaction, userID, backend.isBudgetSetup, userID):
+        await dispatcher.respond(interaction, 'You need to set up your budget first using /setup.', ephemeral=True)
         return
 
-    report: str = backend.getUserBudgetReport(userID)
+    report: str = await dispatcher.runForInteraction(interaction, userID, backend.getUserBudgetReport, userID)
+
+    await dispatcher.respond(interaction, report, ephemeral=True)   
+
+@tree.command(name='stats', description='Shows your spending trends and when your money will run out at your current pace.')
+@metrics.instrumentCommand('stats')
+async def statsCmd(interaction: discord.Interaction) -> None:
+    userID: str = str(interaction.user.id)
+
+    if not await dispatcher.runForInteraction(interaction, userID, backend.isBudgetSetup, userID):
+        await dispatcher.respond(interaction, 'You need to set up your budget first using /setup.', ephemeral=True)
+        return
 
-    await interaction.response.send_message(report, ephemeral=True)   
+    report: str = await dispatcher.runForInteraction(interaction, userID, backend.getUserStatsReport, userID)
+    await dispatcher.respond(interaction, report, ephemeral=True)
 
 @tree.command(name='transactions', description='Shows the user\'s transactions.')
+@metrics.instrumentCommand('transactions')
 async def transactionsCmd(interaction: discord.Interaction, date_start_range: Optional[str] = None, date_end_range: Optional[str] = None) -> None:
     userID: str = str(interaction.user.id)
 
-    if not backend.isBudgetSetup(userID):
-        await interaction.response.send_message('You need to set up your budget first using /setup.', ephemeral=True)
+    if not await dispatcher.runForInteraction(interaction, userID, backend.isBudgetSetup, userID):
+        await dispatcher.respond(interaction, 'You need to set up your budget first using /setup.', ephemeral=True)
         return
     
     if (date_start_range is None) != (date_end_range is None):
-        await interaction.response.send_message('Please provide both date ranges (start and end).', ephemeral=True)
+        await dispatcher.respond(interaction, 'Please provide both date ranges (start and end).', ephemeral=True)
         return
 
     try:
@@ -71,139 +117,534 @@ async def transactionsCmd(interaction: discord.Interaction, date_start_range: Op
         parsedEndDate: Optional[datetime] = datetime.strptime(date_end_range, '%Y-%m-%d') if date_end_range else None
 
         if (parsedStartDate is not None and parsedEndDate is not None) and parsedStartDate >= parsedEndDate:
-            await interaction.response.send_message('The start date must be before the end date!', ephemeral=True)
+            await dispatcher.respond(interaction, 'The start date must be before the end date!', ephemeral=True)
+            return
+
+        pages: Iterator[tuple[str, bool]] = backend.iterUserTransactionHistoryPages(userID, parsedStartDate, parsedEndDate)
+        firstPage, hasMorePages = await dispatcher.runForInteraction(interaction, userID, next, pages)
+
+        if not hasMorePages:
+            await dispatcher.respond(interaction, firstPage, ephemeral=True)
             return
 
-        transactions: str = backend.getUserTransactionHistory(userID, parsedStartDate, parsedEndDate)
-        await interaction.response.send_message(transactions, ephemeral=True)
+        paginator: views.TransactionHistoryPaginatorView = views.TransactionHistoryPaginatorView(userID, pages, firstPage, hasMorePages)
+        await dispatcher.respond(interaction, paginator.getContent(), view=paginator, ephemeral=True)
     except ValueError:
-        await interaction.response.send_message('Invalid date format! Use YYYY-MM-DD.', ephemeral=True)
+        await dispatcher.respond(interaction, 'Invalid date format! Use YYYY-MM-DD.', ephemeral=True)
         return
 
+@tree.command(name='search', description='Finds transactions by words in their description, optionally by amount and date.')
+@metrics.instrumentCommand('search')
+async def searchCmd(interaction: discord.Interaction,
+                    query: str,
+                    min_amount: Optional[float] = None,
+                    max_amount: Optional[float] = None,
+                    date_start_range: Optional[str] = None,
+                    date_end_range: Optional[str] = None) -> None:
+
+    userID: str = str(interaction.user.id)
+
+    if not await dispatcher.runForInteraction(interaction, userID, backend.isBudgetSetup, userID):
+        await dispatcher.respond(interaction, 'You need to set up your budget first using /setup.', ephemeral=True)
+        return
+
+    if (date_start_range is None) != (date_end_range is None):
+        await dispatcher.respond(interaction, 'Please provide both date ranges (start and end).', ephemeral=True)
+        return
+
+    try:
+        parsedStartDate: Optional[datetime] = datetime.strptime(date_start_range, '%Y-%m-%d') if date_start_range else None
+        parsedEndDate: Optional[datetime] = datetime.strptime(date_end_range, '%Y-%m-%d') if date_end_range else None
+    except ValueError:
+        await dispatcher.respond(interaction, 'Invalid date format! Use YYYY-MM-DD.', ephemeral=True)
+        return
+
+    if (parsedStartDate is not None and parsedEndDate is not None) and parsedStartDate >= parsedEndDate:
+        await dispatcher.respond(interaction, 'The start date must be before the end date!', ephemeral=True)
+        return
+
+    if (min_amount is not None and max_amount is not None) and min_amount > max_amount:
+        await dispatcher.respond(interaction, 'The minimum amount must not be more than the maximum amount!', ephemeral=True)
+        return
+
+    results: str = await dispatcher.runForInteraction(interaction, userID, backend.searchUserTransactions, userID, query, min_amount, max_amount, parsedStartDate, parsedEndDate)
+    await dispatcher.respond(interaction, results, ephemeral=True)
+
 @tree.command(name='spent', description='Records an expense for the user.')
+@metrics.instrumentCommand('spent')
 async def spentCmd(interaction: discord.Interaction, amount: float, description: str) -> None:
     userID: str = str(interaction.user.id)
 
-    if not backend.isBudgetSetup(userID):
-        await interaction.response.send_message('You need to set up your budget first using /setup.', ephemeral=True)
+    if not await dispatcher.runForInteraction(interaction, userID, backend.isBudgetSetup, userID):
+        await dispatcher.respond(interaction, 'You need to set up your budget first using /setup.', ephemeral=True)
         return
     
-    await interaction.response.send_message(
+    await dispatcher.respond(
+        interaction,
         'Choose which money type to apply the transaction to:',
-        view=backend.BudgetTypeSelectorView(userID, amount, description, spending=True),
+        view=views.BudgetTypeSelectorView(userID, amount, description, spending=True),
         ephemeral=True)
     
 @tree.command(name='add', description='Adds money to the user\'s budget.')
+@metrics.instrumentCommand('add')
 async def addCmd(interaction: discord.Interaction, amount: float, description: str) -> None:
     userID: str = str(interaction.user.id)
 
-    if not backend.isBudgetSetup(userID):
-        await interaction.response.send_message('You need to set up your budget first using /setup.', ephemeral=True)
+    if not await dispatcher.runForInteraction(interaction, userID, backend.isBudgetSetup, userID):
+        await dispatcher.respond(interaction, 'You need to set up your budget first using /setup.', ephemeral=True)
         return
     
-    await interaction.response.send_message(
+    await dispatcher.respond(
+        interaction,
         'Choose which money type to apply the transaction to:',
-        view=backend.BudgetTypeSelectorView(userID, amount, description, spending=False),
+        view=views.BudgetTypeSelectorView(userID, amount, description, spending=False),
         ephemeral=True)
     
+@tree.command(name='import', description='Imports transactions from an attached CSV or OFX export, negative amounts are spending.')
+@discord.app_commands.choices(default_budget_type=[discord.app_commands.Choice(name=budgetType.getPrettyString(), value=str(budgetType)) for budgetType in BudgetType])
+@metrics.instrumentCommand('import')
+async def importCmd(interaction: discord.Interaction,
+                    file: discord.Attachment,
+                    default_budget_type: Optional[str] = None,
+                    amount_column: str = 'Amount',
+                    description_column: str = 'Description',
+                    date_column: str = 'Date',
+                    budget_type_column: Optional[str] = None,
+                    date_format: Optional[str] = None,
+                    spending_is_positive: bool = False) -> None:
+
+    userID: str = str(interaction.user.id)
+
+    if not await dispatcher.runForInteraction(interaction, userID, backend.isBudgetSetup, userID):
+        await dispatcher.respond(interaction, 'You need to set up your budget first using /setup.', ephemeral=True)
+        return
+
+    if file.size > importer.IMPORT_MAX_FILE_BYTES:
+        await dispatcher.respond(interaction, f'The file is too large, imports are limited to {importer.IMPORT_MAX_FILE_BYTES // (1024 * 1024)}MB.', ephemeral=True)
+        return
+
+    mapping: importer.ColumnMapping = importer.ColumnMapping(
+        amount=amount_column,
+        description=description_column,
+        timestamp=date_column,
+        budgetType=budget_type_column,
+        dateFormat=date_format,
+        defaultBudgetType=BudgetType(default_budget_type) if default_budget_type else None,
+        spendingIsPositive=spending_is_positive)
+
+    if not interaction.response.is_done():
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+    # The attachment goes to a temporary file so the backend worker can stream it instead of holding the rows in memory
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(file.filename)[1]) as temporaryFile:
+        await file.save(temporaryFile)
+        temporaryFile.flush()
+
+        try:
+            imported, skipped = await dispatcher.runForInteraction(interaction, userID, backend.importTransactionFile, userID, temporaryFile.name, file.filename, mapping)
+        except importer.ImportFileError as error:
+            await dispatcher.respond(interaction, str(error), ephemeral=True)
+            return
+
+    await dispatcher.respond(interaction, f'Imported **{imported}** transaction(s) from `{file.filename}`, skipped **{skipped}** already imported.', ephemeral=True)
+
+@tree.command(name='export', description='Exports your transactions and breaks as compressed CSV or a compact columnar file.')
+@discord.app_commands.choices(export_format=[discord.app_commands.Choice(name='Compressed CSV', value='csv'), discord.app_commands.Choice(name='Columnar', value='columnar')])
+@metrics.instrumentCommand('export')
+async def exportCmd(interaction: discord.Interaction, export_format: str = 'csv', date_start_range: Optional[str] = None, date_end_range: Optional[str] = None) -> None:
+    userID: str = str(interaction.user.id)
+
+    if not await dispatcher.runForInteraction(interaction, userID, backend.isBudgetSetup, userID):
+        await dispatcher.respond(interaction, 'You need to set up your budget first using /setup.', ephemeral=True)
+        return
+
+    if (date_start_range is None) != (date_end_range is None):
+        await dispatcher.respond(interaction, 'Please provide both date ranges (start and end).', ephemeral=True)
+        return
+
+    try:
+        parsedStartDate: Optional[datetime] = datetime.strptime(date_start_range, '%Y-%m-%d') if date_start_range else None
+        parsedEndDate: Optional[datetime] = datetime.strptime(date_end_range, '%Y-%m-%d') if date_end_range else None
+    except ValueError:
+        await dispatcher.respond(interaction, 'Invalid date format! Use YYYY-MM-DD.', ephemeral=True)
+        return
+
+    if (parsedStartDate is not None and parsedEndDate is not None) and parsedStartDate >= parsedEndDate:
+        await dispatcher.respond(interaction, 'The start date must be before the end date!', ephemeral=True)
+        return
+
+    files: list[tuple[str, BinaryIO]] = await dispatcher.runForInteraction(interaction, userID, backend.exportUserData, userID, export_format, parsedStartDate, parsedEndDate)
+
+    try:
+        exportBytes: int = sum(file.seek(0, os.SEEK_END) for _, file in files)
+        if exportBytes > exporter.EXPORT_MAX_ATTACHMENT_BYTES:
+            await dispatcher.respond(interaction, 'Your export is too large to attach, try a smaller date range.', ephemeral=True)
+            return
+
+        for _, file in files:
+            file.seek(0)
+
+        await dispatcher.respond(interaction, 'Here is your export.', files=[discord.File(file, filename=fileName) for fileName, file in files], ephemeral=True)
+    finally:
+        for _, file in files:
+            file.close()
+
 @tree.command(name='respread', description='Respreads the user\'s remaining budget over the remaining days.')
+@metrics.instrumentCommand('respread')
 async def respreadCmd(interaction: discord.Interaction) -> None:
     userID: str = str(interaction.user.id)
 
-    if not backend.isBudgetSetup(userID):
-        await interaction.response.send_message('You need to set up your budget first using /setup.', ephemeral=True)
+    if not await dispatcher.runForInteraction(interaction, userID, backend.isBudgetSetup, userID):
+        await dispatcher.respond(interaction, 'You need to set up your budget first using /setup.', ephemeral=True)
         return
 
-    backend.respreadUserBudget(userID)
-    dailyBudget = backend.getUserDailyBudget(userID)
-    await interaction.response.send_message(
+    await dispatcher.runForInteraction(interaction, userID, backend.respreadUserBudget, userID)
+    dailyBudget = await dispatcher.runForInteraction(interaction, userID, backend.getUserDailyBudget, userID)
+    await dispatcher.respond(
+        interaction,
         f'Your remaining budget has been respread over the remaining days.\nYour daily budget is now ${dailyBudget:.2f}.',
         ephemeral=True)
     
 @tree.command(name='set-budget-end-date', description='Sets the end date for the user\'s budget.')
+@metrics.instrumentCommand('set-budget-end-date')
 async def setBudgetEndDateCmd(interaction: discord.Interaction, budget_end_date: str) -> None:
     userID: str = str(interaction.user.id)
 
-    if not backend.isBudgetSetup(userID):
-        await interaction.response.send_message('You need to set up your budget first using /setup.', ephemeral=True)
+    if not await dispatcher.runForInteraction(interaction, userID, backend.isBudgetSetup, userID):
+        await dispatcher.respond(interaction, 'You need to set up your budget first using /setup.', ephemeral=True)
         return
 
     try:
         parsedDate: datetime = datetime.strptime(budget_end_date, '%Y-%m-%d')
 
         if parsedDate.date() <= datetime.now().date():
-            await interaction.response.send_message('The budget end date must be in the future!', ephemeral=True)
+            await dispatcher.respond(interaction, 'The budget end date must be in the future!', ephemeral=True)
             return
 
-        backend.setUserBudgetEndDate(userID, parsedDate)
-        await interaction.response.send_message(f'Your budget end date has been set to {parsedDate.strftime("%A, %B %d, %Y")}.', ephemeral=True)
+        await dispatcher.runForInteraction(interaction, userID, backend.setUserBudgetEndDate, userID, parsedDate)
+        await dispatcher.respond(interaction, f'Your budget end date has been set to {parsedDate.strftime("%A, %B %d, %Y")}.', ephemeral=True)
     except ValueError:
-        await interaction.response.send_message('Invalid date format! Use YYYY-MM-DD.', ephemeral=True)
+        await dispatcher.respond(interaction, 'Invalid date format! Use YYYY-MM-DD.', ephemeral=True)
         return
     
-@tree.command(name='add-break', description='Adds a break period to the user\'s budget.')
-async def addBreakCmd(interaction: discord.Interaction, start_date: str, end_date: str) -> None:
-    userID: str = str(interaction.user.id)
-
-    if not backend.isBudgetSetup(userID):
-        await interaction.response.send_message('You need to set up your budget first using /setup.', ephemeral=True)
-        return
-
+async def addRecordBreak(interaction: discord.Interaction, recordID: str, start_date: str, end_date: str) -> None:
     try:
         parsedStartDate: datetime = datetime.strptime(start_date, '%Y-%m-%d')
         parsedEndDate: datetime = datetime.strptime(end_date, '%Y-%m-%d')
 
         if parsedStartDate >= parsedEndDate:
-            await interaction.response.send_message('The start date must be before the end date!', ephemeral=True)
+            await dispatcher.respond(interaction, 'The start date must be before the end date!', ephemeral=True)
             return
 
-        backend.addBreak(userID, parsedStartDate, parsedEndDate)
-        await interaction.response.send_message(f'Break added from `{parsedStartDate.strftime("%A, %B %d, %Y")}` to `{parsedEndDate.strftime("%A, %B %d, %Y")}`.', ephemeral=True)
+        await dispatcher.runForInteraction(interaction, recordID, backend.addBreak, recordID, parsedStartDate, parsedEndDate)
+        await dispatcher.respond(interaction, f'Break added from `{parsedStartDate.strftime("%A, %B %d, %Y")}` to `{parsedEndDate.strftime("%A, %B %d, %Y")}`.', ephemeral=True)
     except ValueError:
-        await interaction.response.send_message('Invalid date format! Use YYYY-MM-DD.', ephemeral=True)
+        await dispatcher.respond(interaction, 'Invalid date format! Use YYYY-MM-DD.', ephemeral=True)
         return
+
+async def removeRecordBreak(interaction: discord.Interaction, recordID: str) -> None:
+    breaks: list[tuple[datetime, datetime]] = await dispatcher.runForInteraction(interaction, recordID, backend.getUserBreaks, recordID)
     
-@tree.command(name='remove-break', description='Removes a break period from the user\'s budget.')
-async def removeBreakCmd(interaction: discord.Interaction) -> None:
+    if not breaks:
+        await dispatcher.respond(interaction, 'There are no breaks to remove.', ephemeral=True)
+        return
+
+    await dispatcher.respond(
+        interaction,
+        'Select a break to remove:', 
+        view=views.BreakRemovalSelectorView(recordID, breaks), 
+        ephemeral=True)
+
+async def showRecordBreaks(interaction: discord.Interaction, recordID: str) -> None:
+    breaks: int = await dispatcher.runForInteraction(interaction, recordID, backend.getUserNumBreaks, recordID)
+
+    if breaks == 0:
+        await dispatcher.respond(interaction, 'There are no breaks.', ephemeral=True)
+        return
+    
+    await dispatcher.respond(interaction, f'There are {breaks} break(s).\n\n{await dispatcher.runForInteraction(interaction, recordID, backend.getBreaksReport, recordID)}', ephemeral=True)
+
+@tree.command(name='add-break', description='Adds a break period to the user\'s budget.')
+@metrics.instrumentCommand('add-break')
+async def addBreakCmd(interaction: discord.Interaction, start_date: str, end_date: str) -> None:
     userID: str = str(interaction.user.id)
 
-    if not backend.isBudgetSetup(userID):
-        await interaction.response.send_message('You need to set up your budget first using /setup.', ephemeral=True)
+    if not await dispatcher.runForInteraction(interaction, userID, backend.isBudgetSetup, userID):
+        await dispatcher.respond(interaction, 'You need to set up your budget first using /setup.', ephemeral=True)
         return
 
-    breaks: int = backend.getUserNumBreaks(userID)
+    await addRecordBreak(interaction, userID, start_date, end_date)
     
-    if breaks == 0:
-        await interaction.response.send_message('You have no breaks to remove.', ephemeral=True)
+@tree.command(name='remove-break', description='Removes a break period from the user\'s budget.')
+@metrics.instrumentCommand('remove-break')
+async def removeBreakCmd(interaction: discord.Interaction) -> None:
+    userID: str = str(interaction.user.id)
+
+    if not await dispatcher.runForInteraction(interaction, userID, backend.isBudgetSetup, userID):
+        await dispatcher.respond(interaction, 'You need to set up your budget first using /setup.', ephemeral=True)
         return
 
-    await interaction.response.send_message(
-        'Select a break to remove:', 
-        view=backend.BreakRemovalSelectorView(userID), 
-        ephemeral=True)
+    await removeRecordBreak(interaction, userID)
     
 @tree.command(name='breaks', description='Shows the user\'s break periods.')
+@metrics.instrumentCommand('breaks')
 async def breaksCmd(interaction: discord.Interaction) -> None:
     userID: str = str(interaction.user.id)
 
-    if not backend.isBudgetSetup(userID):
-        await interaction.response.send_message('You need to set up your budget first using /setup.', ephemeral=True)
+    if not await dispatcher.runForInteraction(interaction, userID, backend.isBudgetSetup, userID):
+        await dispatcher.respond(interaction, 'You need to set up your budget first using /setup.', ephemeral=True)
         return
 
-    breaks: int = backend.getUserNumBreaks(userID)
+    await showRecordBreaks(interaction, userID)
+    
+@tree.command(name='digest', description='DMs you your budget report every day at a time you pick, or "off" to stop.')
+@metrics.instrumentCommand('digest')
+async def digestCmd(interaction: discord.Interaction, time: str, time_zone: str = DEFAULT_TIME_ZONE) -> None:
+    userID: str = str(interaction.user.id)
 
-    if breaks == 0:
-        await interaction.response.send_message('You have no breaks.', ephemeral=True)
+    if not await dispatcher.runForInteraction(interaction, userID, backend.isBudgetSetup, userID):
+        await dispatcher.respond(interaction, 'You need to set up your budget first using /setup.', ephemeral=True)
         return
-    
-    await interaction.response.send_message(f'You have {breaks} break(s).\n\n{backend.getBreaksReport(userID)}', ephemeral=True)
-    
+
+    if time.strip().lower() == 'off':
+        await dispatcher.runForInteraction(interaction, userID, backend.setDigestSchedule, userID, None, time_zone)
+        if digestScheduler is not None: await digestScheduler.reschedule(userID)
+        await dispatcher.respond(interaction, 'Daily digests are turned off.', ephemeral=True)
+        return
+
+    try:
+        digestTime: str = digest.parseDigestTime(time).strftime("%H:%M")
+        digest.getTimeZone(time_zone)
+    except ValueError as error:
+        await dispatcher.respond(interaction, f'Invalid digest time or time zone ({error}). Use HH:MM in 24 hour time and a zone like America/New_York.', ephemeral=True)
+        return
+
+    await dispatcher.runForInteraction(interaction, userID, backend.setDigestSchedule, userID, digestTime, time_zone)
+    if digestScheduler is not None: await digestScheduler.reschedule(userID)
+    await dispatcher.respond(interaction, f'You will get your budget report every day at `{digestTime}` ({time_zone}).', ephemeral=True)
+
+def getInteractionGroupID(interaction: discord.Interaction, name: str) -> Optional[str]:
+    # Groups belong to a server, so they cannot be used from DMs
+    return getGroupID(str(interaction.guild_id), name) if interaction.guild_id is not None else None
+
+@tree.command(name='group-create', description='Creates a budget shared by a group of people in this server.')
+@metrics.instrumentCommand('group-create')
+async def groupCreateCmd(interaction: discord.Interaction,
+                         name: str,
+                         starting_dining_dollars: float,
+                         starting_tiger_bucks: float,
+                         starting_us_dollars: float,
+                         budget_end_date: str) -> None:
+
+    userID: str = str(interaction.user.id)
+    groupID: Optional[str] = getInteractionGroupID(interaction, name)
+
+    if groupID is None:
+        await dispatcher.respond(interaction, 'Group budgets can only be used in a server.', ephemeral=True)
+        return
+
+    if len(name.strip()) > backend.GROUP_NAME_LIMIT:
+        await dispatcher.respond(interaction, f'Group names can be at most {backend.GROUP_NAME_LIMIT} characters long.', ephemeral=True)
+        return
+
+    try:
+        parsedDate: datetime = datetime.strptime(budget_end_date, '%Y-%m-%d')
+    except ValueError:
+        await dispatcher.respond(interaction, 'Invalid date format! Use YYYY-MM-DD.', ephemeral=True)
+        return
+
+    if parsedDate.date() <= datetime.now().date():
+        await dispatcher.respond(interaction, 'The budget end date must be in the future!', ephemeral=True)
+        return
+
+    if not await dispatcher.runForInteraction(interaction, groupID, backend.setupGroupBudget, groupID, name.strip(), userID,
+                                              starting_dining_dollars, starting_tiger_bucks, starting_us_dollars, parsedDate):
+        await dispatcher.respond(interaction, f'There is already a group called **{name}** in this server!', ephemeral=True)
+        return
+
+    await dispatcher.respond(interaction, f'Group **{name}** is set up and will end on {parsedDate.strftime("%A, %B %d, %Y")}. Invite others with /group-invite.', ephemeral=True)
+
+@tree.command(name='group-join', description='Joins a group budget in this server.')
+@metrics.instrumentCommand('group-join')
+async def groupJoinCmd(interaction: discord.Interaction, name: str) -> None:
+    userID: str = str(interaction.user.id)
+    groupID: Optional[str] = getInteractionGroupID(interaction, name)
+
+    if groupID is None or not await dispatcher.runForInteraction(interaction, groupID, backend.isBudgetSetup, groupID):
+        await dispatcher.respond(interaction, f'There is no group called **{name}** in this server.', ephemeral=True)
+        return
+
+    if await dispatcher.runForInteraction(interaction, groupID, backend.isGroupMember, groupID, userID):
+        await dispatcher.respond(interaction, f'You are already in **{name}**.', ephemeral=True)
+        return
+
+    if not await dispatcher.runForInteraction(interaction, groupID, backend.joinGroup, groupID, userID):
+        await dispatcher.respond(interaction, f'You need an invite from the owner of **{name}** to join it.', ephemeral=True)
+        return
+
+    await dispatcher.respond(interaction, f'You joined **{name}**.', ephemeral=True)
+
+@tree.command(name='group-invite', description='Invites someone to join a group budget you own.')
+@metrics.instrumentCommand('group-invite')
+async def groupInviteCmd(interaction: discord.Interaction, name: str, member: discord.User) -> None:
+    userID: str = str(interaction.user.id)
+    groupID: Optional[str] = getInteractionGroupID(interaction, name)
+
+    if groupID is None or not await dispatcher.runForInteraction(interaction, groupID, backend.isGroupOwner, groupID, userID):
+        await dispatcher.respond(interaction, f'You do not own a group called **{name}**.', ephemeral=True)
+        return
+
+    await dispatcher.runForInteraction(interaction, groupID, backend.setGroupInvite, groupID, str(member.id), True)
+    await dispatcher.respond(interaction, f'{member.mention} can now join **{name}** with /group-join.', ephemeral=True)
+
+@tree.command(name='group-leave', description='Leaves a group budget, what you already spent stays in it.')
+@metrics.instrumentCommand('group-leave')
+async def groupLeaveCmd(interaction: discord.Interaction, name: str) -> None:
+    userID: str = str(interaction.user.id)
+    groupID: Optional[str] = getInteractionGroupID(interaction, name)
+
+    if groupID is None or not await dispatcher.runForInteraction(interaction, groupID, backend.isGroupMember, groupID, userID):
+        await dispatcher.respond(interaction, f'You are not in a group called **{name}**.', ephemeral=True)
+        return
+
+    await dispatcher.runForInteraction(interaction, groupID, backend.setGroupMember, groupID, userID, False)
+    await dispatcher.respond(interaction, f'You left **{name}**.', ephemeral=True)
+
+async def recordGroupTransaction(interaction: discord.Interaction, name: str, amount: float, description: str, budget_type: str, spending: bool) -> None:
+    userID: str = str(interaction.user.id)
+    groupID: Optional[str] = getInteractionGroupID(interaction, name)
+
+    if groupID is None or not await dispatcher.runForInteraction(interaction, groupID, backend.isGroupMember, groupID, userID):
+        await dispatcher.respond(interaction, f'You need to join **{name}** first using /group-join.', ephemeral=True)
+        return
+
+    budgetType: BudgetType = BudgetType(budget_type)
+    await dispatcher.runForInteraction(interaction, groupID, backend.recordGroupTransaction, groupID, userID, amount, description, budgetType, spending)
+    await dispatcher.respond(interaction, f'{"Spent" if spending else "Added"} ${amount:.2f} {"from" if spending else "to"} **{name}** ({budgetType.getPrettyString()}).', ephemeral=True)
+
+@tree.command(name='group-spent', description='Records an expense against a group budget.')
+@discord.app_commands.choices(budget_type=[discord.app_commands.Choice(name=budgetType.getPrettyString(), value=str(budgetType)) for budgetType in BudgetType])
+@metrics.instrumentCommand('group-spent')
+async def groupSpentCmd(interaction: discord.Interaction, name: str, amount: float, description: str, budget_type: str) -> None:
+    await recordGroupTransaction(interaction, name, amount, description, budget_type, spending=True)
+
+@tree.command(name='group-add', description='Adds money to a group budget.')
+@discord.app_commands.choices(budget_type=[discord.app_commands.Choice(name=budgetType.getPrettyString(), value=str(budgetType)) for budgetType in BudgetType])
+@metrics.instrumentCommand('group-add')
+async def groupAddCmd(interaction: discord.Interaction, name: str, amount: float, description: str, budget_type: str) -> None:
+    await recordGroupTransaction(interaction, name, amount, description, budget_type, spending=False)
+
+@tree.command(name='group-report', description='Reports a group budget\'s balance and what each member has spent.')
+@metrics.instrumentCommand('group-report')
+async def groupReportCmd(interaction: discord.Interaction, name: str) -> None:
+    userID: str = str(interaction.user.id)
+    groupID: Optional[str] = getInteractionGroupID(interaction, name)
+
+    if groupID is None or not await dispatcher.runForInteraction(interaction, groupID, backend.isGroupMember, groupID, userID):
+        await dispatcher.respond(interaction, f'You are not in a group called **{name}**.', ephemeral=True)
+        return
+
+    report: str = await dispatcher.runForInteraction(interaction, groupID, backend.getGroupBudgetReport, groupID)
+    await dispatcher.respond(interaction, report, ephemeral=True)
+
+@tree.command(name='group-add-break', description='Adds a break period to a group budget you own.')
+@metrics.instrumentCommand('group-add-break')
+async def groupAddBreakCmd(interaction: discord.Interaction, name: str, start_date: str, end_date: str) -> None:
+    userID: str = str(interaction.user.id)
+    groupID: Optional[str] = getInteractionGroupID(interaction, name)
+
+    if groupID is None or not await dispatcher.runForInteraction(interaction, groupID, backend.isGroupOwner, groupID, userID):
+        await dispatcher.respond(interaction, f'You do not own a group called **{name}**.', ephemeral=True)
+        return
+
+    await addRecordBreak(interaction, groupID, start_date, end_date)
+
+@tree.command(name='group-remove-break', description='Removes a break period from a group budget you own.')
+@metrics.instrumentCommand('group-remove-break')
+async def groupRemoveBreakCmd(interaction: discord.Interaction, name: str) -> None:
+    userID: str = str(interaction.user.id)
+    groupID: Optional[str] = getInteractionGroupID(interaction, name)
+
+    if groupID is None or not await dispatcher.runForInteraction(interaction, groupID, backend.isGroupOwner, groupID, userID):
+        await dispatcher.respond(interaction, f'You do not own a group called **{name}**.', ephemeral=True)
+        return
+
+    await removeRecordBreak(interaction, groupID)
+
+@tree.command(name='group-breaks', description='Shows a group budget\'s break periods.')
+@metrics.instrumentCommand('group-breaks')
+async def groupBreaksCmd(interaction: discord.Interaction, name: str) -> None:
+    userID: str = str(interaction.user.id)
+    groupID: Optional[str] = getInteractionGroupID(interaction, name)
+
+    if groupID is None or not await dispatcher.runForInteraction(interaction, groupID, backend.isGroupMember, groupID, userID):
+        await dispatcher.respond(interaction, f'You are not in a group called **{name}**.', ephemeral=True)
+        return
+
+    await showRecordBreaks(interaction, groupID)
+
+@tree.command(name='bot-stats', description='Shows command latency and usage stats for the bot (admins only).')
+@discord.app_commands.default_permissions(administrator=True)
+@metrics.instrumentCommand('bot-stats')
+async def botStatsCmd(interaction: discord.Interaction) -> None:
+    if not getattr(interaction.user, 'guild_permissions', None) or not interaction.user.guild_permissions.administrator:
+        await dispatcher.respond(interaction, 'Only server administrators can view bot stats.', ephemeral=True)
+        return
+
+    await dispatcher.respondInParts(interaction, metrics.getStatsReport(), ephemeral=True)
+
+def getCommandTreeHash() -> str:
+    definitions: list[dict] = sorted((command.to_dict(tree) for command in tree.get_commands()), key=lambda definition: definition['name'])
+    return hashlib.sha256(json.dumps(definitions, sort_keys=True, default=str).encode()).hexdigest()
+
+def readSyncedCommandTreeHash() -> Optional[str]:
+    try:
+        with open(COMMAND_TREE_HASH_FILE) as file: return file.read().strip()
+    except OSError:
+        return None
+
+async def syncCommandTree() -> None:
+    # A global sync is slow and rate limited, so it only runs when the command definitions differ from the last upload
+    commandTreeHash: str = f'{client.application_id}:{getCommandTreeHash()}'
+    if not FORCE_COMMAND_SYNC and readSyncedCommandTreeHash() == commandTreeHash:
+        print('Commands are unchanged since the last sync, skipping it.')
+        return
+
+    await tree.sync()
+
+    with open(COMMAND_TREE_HASH_FILE, 'w') as file:
+        file.write(commandTreeHash)
+
 @client.event
 async def on_ready() -> None:
-    await tree.sync()
+    global metricsServer, digestScheduler, connectStarted
+    if metricsServer is None: metricsServer = await metrics.startMetricsServer()
+
+    # on_ready fires again after reconnects, only the first one is part of startup
+    isStartup: bool = connectStarted is not None
+    if isStartup:
+        metrics.recordStartupPhase('gateway connect', time.perf_counter() - connectStarted)
+        connectStarted = None
+
+    # Digests go out from a single process, the one running shard 0, and on_ready fires again after reconnects
+    if digestScheduler is None and ownsCommandSync():
+        digestScheduler = digest.DigestScheduler(client)
+        digestScheduler.start()
+
+    if ownsCommandSync() and isStartup:
+        with metrics.timeStartupPhase('command sync'): await syncCommandTree()
+
+    if isStartup: metrics.recordStartupPhase('ready since process start', metrics.getProcessUptime())
     print(f'{client.user} is now running!')
 
 def main() -> None:
+    global connectStarted
+    metrics.recordStartupPhase('imports since process start', metrics.getProcessUptime())
+
+    # User data loads while the gateway connects, interactions that arrive first wait for it
+    dispatcher.runStartupTask(backend.intialize)
+
+    connectStarted = time.perf_counter()
     client.run(DISCORD_TOKEN)
 
 if __name__ == '__main__':
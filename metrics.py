@@ -0,0 +1,252 @@
+from typing import Callable, Optional
+from collections import deque
+from typing import Final
+import contextlib
+import threading
+import traceback
+import functools
+import asyncio
+import time
+import sys
+import os
+
+METRICS_ENABLED: Final[bool] = os.getenv('METRICS_ENABLED', '0') == '1'
+METRICS_HOST: Final[str] = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT: Final[int] = int(os.getenv('METRICS_PORT', '9464'))
+PROFILE_SLOW_INTERACTIONS: Final[bool] = os.getenv('PROFILE_SLOW_INTERACTIONS', '0') == '1'
+SLOW_INTERACTION_SECONDS: Final[float] = float(os.getenv('SLOW_INTERACTION_SECONDS', '2.0'))
+SLOW_INTERACTION_STACKS_KEPT: Final[int] = 20
+BALANCE_DRIFTS_KEPT: Final[int] = 50
+LATENCY_BUCKETS: Final[tuple[float, ...]] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets: tuple[float, ...] = buckets
+        self.bucketCounts: list[int] = [0] * (len(buckets) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+
+    def observe(self, value: float) -> None:
+        index: int = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+
+        self.bucketCounts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, fraction: float) -> float:
+        # Upper bound of the bucket holding the quantile, the same estimate a Prometheus histogram gives
+        if self.count == 0: return 0.0
+
+        target: float = fraction * self.count
+        seen: int = 0
+        for index, bucketCount in enumerate(self.bucketCounts):
+            seen += bucketCount
+            if seen >= target: return self.buckets[index] if index < len(self.buckets) else float('inf')
+
+        return float('inf')
+
+IMPORT_CLOCK: Final[float] = time.perf_counter()
+
+lock: threading.Lock = threading.Lock()
+histograms: dict[str, dict[Labels, Histogram]] = {}
+counters: dict[str, dict[Labels, float]] = {}
+gauges: dict[str, Callable[[], float]] = {}
+slowInteractionStacks: deque[str] = deque(maxlen=SLOW_INTERACTION_STACKS_KEPT)
+balanceDrifts: deque[str] = deque(maxlen=BALANCE_DRIFTS_KEPT)
+startupPhases: dict[str, float] = {}
+
+def observe(name: str, seconds: float, **labels: str) -> None:
+    key: Labels = tuple(sorted(labels.items()))
+
+    with lock:
+        series: dict[Labels, Histogram] = histograms.setdefault(name, {})
+        histogram: Optional[Histogram] = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+
+        histogram.observe(seconds)
+
+def increment(name: str, amount: float = 1.0, **labels: str) -> None:
+    key: Labels = tuple(sorted(labels.items()))
+
+    with lock:
+        series: dict[Labels, float] = counters.setdefault(name, {})
+        series[key] = series.get(key, 0.0) + amount
+
+def registerGauge(name: str, callback: Callable[[], float]) -> None:
+    gauges[name] = callback
+
+def getProcessUptime() -> float:
+    # Seconds since the process started, read from /proc on Linux and counted from this module's import elsewhere
+    try:
+        with open('/proc/self/stat') as file: startTicks: int = int(file.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as file: systemUptime: float = float(file.read().split()[0])
+        return systemUptime - startTicks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.perf_counter() - IMPORT_CLOCK
+
+def recordStartupPhase(name: str, seconds: float) -> None:
+    # Startup phases are logged even with metrics disabled, so restart to ready latency can be followed in the logs
+    startupPhases[name] = seconds
+    print(f'Startup: {name} took {seconds * 1000:.0f}ms')
+
+@contextlib.contextmanager
+def timeStartupPhase(name: str):
+    start: float = time.perf_counter()
+    try: yield
+    finally: recordStartupPhase(name, time.perf_counter() - start)
+
+def timeBackendCall(function: Callable, *args, **kwargs):
+    functionName: str = getattr(function, '__name__', repr(function))
+
+    start: float = time.perf_counter()
+    try:
+        return function(*args, **kwargs)
+    except Exception:
+        increment('budget_bot_backend_errors_total', function=functionName)
+        raise
+    finally:
+        observe('budget_bot_backend_seconds', time.perf_counter() - start, function=functionName)
+
+def captureStacks(commandName: str) -> None:
+    frames = sys._current_frames()
+    threadNames: dict[int, str] = {thread.ident: thread.name for thread in threading.enumerate()}
+
+    stacks: list[str] = [f'Slow interaction /{commandName} still running after {SLOW_INTERACTION_SECONDS:.1f}s']
+    for threadID, frame in frames.items():
+        stacks.append(f'--- Thread {threadNames.get(threadID, threadID)} ---\n{"".join(traceback.format_stack(frame))}')
+
+    slowInteractionStacks.append('\n'.join(stacks))
+    print(slowInteractionStacks[-1], file=sys.stderr)
+
+def recordBalanceDrift(userID: str, functionName: str, drift: float) -> None:
+    # Counted for the stats report and logged to stderr like the slow interaction stacks, instead of the bot's stdout
+    increment('budget_bot_balance_drift_total', function=functionName)
+
+    balanceDrifts.append(f'Balances for {userID} moved ${drift:+.2f} out of step with their ledger in {functionName}')
+    print(balanceDrifts[-1], file=sys.stderr)
+
+def instrumentCommand(commandName: str) -> Callable:
+    def decorator(function: Callable) -> Callable:
+        # Disabled metrics hand back the handler untouched, so there is no per-call cost at all
+        if not METRICS_ENABLED: return function
+
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            profiler: Optional[asyncio.TimerHandle] = None
+            if PROFILE_SLOW_INTERACTIONS:
+                profiler = asyncio.get_running_loop().call_later(SLOW_INTERACTION_SECONDS, captureStacks, commandName)
+
+            start: float = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            except Exception:
+                increment('budget_bot_command_errors_total', command=commandName)
+                raise
+            finally:
+                observe('budget_bot_command_seconds', time.perf_counter() - start, command=commandName)
+                if profiler is not None: profiler.cancel()
+
+        return wrapper
+
+    return decorator
+
+def formatLabels(labels: Labels, extra: Labels = ()) -> str:
+    allLabels: Labels = labels + extra
+    if not allLabels: return ''
+
+    return '{' + ','.join(f'{name}="{value}"' for name, value in allLabels) + '}'
+
+def renderPrometheus() -> str:
+    lines: list[str] = []
+
+    with lock:
+        for name, series in histograms.items():
+            lines.append(f'# TYPE {name} histogram')
+
+            for labels, histogram in series.items():
+                cumulative: int = 0
+                for bound, bucketCount in zip(histogram.buckets, histogram.bucketCounts):
+                    cumulative += bucketCount
+                    lines.append(f'{name}_bucket{formatLabels(labels, (("le", repr(bound)),))} {cumulative}')
+
+                lines.append(f'{name}_bucket{formatLabels(labels, (("le", "+Inf"),))} {histogram.count}')
+                lines.append(f'{name}_sum{formatLabels(labels)} {histogram.sum}')
+                lines.append(f'{name}_count{formatLabels(labels)} {histogram.count}')
+
+        for name, series in counters.items():
+            lines.append(f'# TYPE {name} counter')
+            lines.extend(f'{name}{formatLabels(labels)} {value}' for labels, value in series.items())
+
+    for name, callback in gauges.items():
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {callback()}')
+
+    if startupPhases:
+        lines.append('# TYPE budget_bot_startup_seconds gauge')
+        lines.extend(f'budget_bot_startup_seconds{formatLabels((("phase", name),))} {seconds}' for name, seconds in list(startupPhases.items()))
+
+    return '\n'.join(lines) + '\n'
+
+def getStatsReport() -> str:
+    if not METRICS_ENABLED:
+        return 'Metrics are disabled, set `METRICS_ENABLED=1` to collect them.'
+
+    report: str = (
+        '### Bot Stats\n'
+        '────────────────────────────────────\n')
+
+    with lock:
+        errors: dict[Labels, float] = counters.get('budget_bot_command_errors_total', {})
+
+        for labels, histogram in sorted(histograms.get('budget_bot_command_seconds', {}).items()):
+            commandName: str = dict(labels)['command']
+            report += (f'- **/{commandName} →** {histogram.count} calls, {int(errors.get(labels, 0))} errors, '
+                       f'mean `{histogram.sum / histogram.count * 1000:.1f}ms`, p99 ≤ `{histogram.quantile(0.99) * 1000:.0f}ms`\n')
+
+        report += '────────────────────────────────────\n'
+
+        for labels, histogram in sorted(histograms.get('budget_bot_backend_seconds', {}).items()):
+            report += f'- **{dict(labels)["function"]} →** {histogram.count} calls, mean `{histogram.sum / histogram.count * 1000:.2f}ms`\n'
+
+        for labels, histogram in sorted(histograms.get('budget_bot_persistence_flush_seconds', {}).items()):
+            report += f'- **Flush ({", ".join(value for _, value in labels)}) →** {histogram.count} flushes, mean `{histogram.sum / histogram.count * 1000:.2f}ms`\n'
+
+        for labels, count in sorted(counters.get('budget_bot_balance_drift_total', {}).items()):
+            report += f'- **Balance drift in {dict(labels)["function"]} →** {int(count)} mutations\n'
+
+    for name, callback in gauges.items():
+        report += f'- **{name} →** {callback():g}\n'
+
+    if startupPhases:
+        report += '────────────────────────────────────\n'
+        report += ''.join(f'- **Startup {name} →** `{seconds * 1000:.0f}ms`\n' for name, seconds in list(startupPhases.items()))
+
+    report += '────────────────────────────────────\n'
+    return report
+
+async def handleMetricsRequest(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        requestLine: bytes = await reader.readline()
+
+        # Drain the request headers, every path answers with the metrics page
+        while (await reader.readline()).strip(): pass
+
+        if requestLine.startswith(b'GET'):
+            body: bytes = renderPrometheus().encode()
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+        else:
+            writer.write(b'HTTP/1.1 405 Method Not Allowed\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+
+        await writer.drain()
+    finally:
+        writer.close()
+
+async def startMetricsServer() -> Optional[asyncio.AbstractServer]:
+    if not METRICS_ENABLED: return None
+    return await asyncio.start_server(handleMetricsRequest, METRICS_HOST, METRICS_PORT)
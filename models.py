@@ -0,0 +1,541 @@
+from dataclasses import dataclass, field
+from datetime import datetime, date, timedelta
+from typing import Iterable, Iterator, Optional, Union
+from typing import Final
+from array import array
+import bisect
+import re
+from enum import Enum
+
+class BudgetType(Enum):
+    DINING_DOLLARS = 'diningDollars'
+    TIGER_BUCKS = 'tigerBucks'
+    USD = 'USD'
+
+    def getPrettyString(self) -> str:
+        return BUDGET_TYPE_NAMES[self]
+
+    def __str__(self) -> str:
+        return self.value
+
+    def __repr__(self) -> str:
+        return self.value
+
+BUDGET_TYPES: Final[tuple[BudgetType, ...]] = tuple(BudgetType)
+BUDGET_TYPE_CODES: Final[dict[BudgetType, int]] = {budgetType: code for code, budgetType in enumerate(BUDGET_TYPES)}
+BUDGET_TYPE_NAMES: Final[dict[BudgetType, str]] = {BudgetType.DINING_DOLLARS: 'Dining Dollars', BudgetType.TIGER_BUCKS: 'Tiger Bucks', BudgetType.USD: 'USD'}
+UNKNOWN_BUDGET_TYPE_CODE: Final[int] = -1
+CENTS_PER_DOLLAR: Final[int] = 100
+LEDGER_EPOCH: Final[datetime] = datetime(1970, 1, 1)
+ONE_MICROSECOND: Final[timedelta] = timedelta(microseconds=1)
+ONE_DAY: Final[timedelta] = timedelta(days=1)
+DEFAULT_TIME_ZONE: Final[str] = 'America/New_York'
+GROUP_ID_PREFIX: Final[str] = 'group:'
+SEARCH_TOKEN_PATTERN: Final[re.Pattern] = re.compile(r'\w+')
+
+# Money is kept as whole cents so balances never pick up float rounding error, dollars only appear at the edges
+def toCents(amount: float) -> int:
+    return round(amount * CENTS_PER_DOLLAR)
+
+def fromCents(cents: int) -> float:
+    return cents / CENTS_PER_DOLLAR
+
+class Ledger:
+    # Columnar ledger: one array per field instead of a tuple, float, str and datetime object per transaction,
+    # descriptions are stored once in a table and referenced by index. Reads still hand out (amount, description, date) tuples.
+    # Amounts are stored in cents, and a running total per budget type code is kept with the unknown type in the last slot
+    def __init__(self, transactions: Iterable[tuple[float, str, datetime]] = (), budgetTypes: Optional[Iterable[Optional[BudgetType]]] = None) -> None:
+        self.amounts: array = array('q')
+        self.totals: list[int] = [0] * (len(BUDGET_TYPES) + 1)
+        self.timestamps: array = array('q')
+        self.budgetTypeCodes: array = array('b')
+        self.descriptionIndexes: array = array('i')
+        self.descriptions: list[str] = []
+        self.descriptionLookup: dict[str, int] = {}
+
+        budgetTypeIterator: Optional[Iterator[Optional[BudgetType]]] = iter(budgetTypes) if budgetTypes is not None else None
+        for transaction in transactions:
+            self.append(transaction, next(budgetTypeIterator) if budgetTypeIterator is not None else None)
+
+    def append(self, transaction: tuple[float, str, datetime], budgetType: Optional[BudgetType] = None) -> None:
+        amount, description, timestamp = transaction
+
+        self.appendColumns(toCents(amount), (timestamp - LEDGER_EPOCH) // ONE_MICROSECOND,
+                           BUDGET_TYPE_CODES[budgetType] if budgetType is not None else UNKNOWN_BUDGET_TYPE_CODE,
+                           self.getDescriptionIndex(description))
+
+    def appendColumns(self, amount: int, timestamp: int, budgetTypeCode: int, descriptionIndex: int) -> None:
+        self.amounts.append(amount)
+        self.timestamps.append(timestamp)
+        self.budgetTypeCodes.append(budgetTypeCode)
+        self.descriptionIndexes.append(descriptionIndex)
+        self.totals[budgetTypeCode] += amount
+
+    def extendColumns(self, amounts: array, timestamps: array, budgetTypeCodes: array, descriptionIndexes: array) -> None:
+        # Appends whole columns at once, the description indexes must already point into this ledger's table
+        self.amounts.extend(amounts)
+        self.timestamps.extend(timestamps)
+        self.budgetTypeCodes.extend(budgetTypeCodes)
+        self.descriptionIndexes.extend(descriptionIndexes)
+
+        for amount, code in zip(amounts, budgetTypeCodes):
+            self.totals[code] += amount
+
+    def getDescriptionIndex(self, description: str) -> int:
+        descriptionIndex: Optional[int] = self.descriptionLookup.get(description)
+        if descriptionIndex is None:
+            descriptionIndex = len(self.descriptions)
+            self.descriptions.append(description)
+            self.descriptionLookup[description] = descriptionIndex
+
+        return descriptionIndex
+
+    def appendRow(self, other: 'Ledger', index: int) -> None:
+        self.appendColumns(other.amounts[index], other.timestamps[index], other.budgetTypeCodes[index],
+                           self.getDescriptionIndex(other.descriptions[other.descriptionIndexes[index]]))
+
+    def sortedByTime(self) -> 'Ledger':
+        # Stable, so transactions sharing a timestamp keep the order they were added in
+        order: list[int] = sorted(range(len(self)), key=self.timestamps.__getitem__)
+        if all(index == position for position, index in enumerate(order)): return self
+
+        ledger: Ledger = Ledger()
+        for index in order:
+            ledger.appendRow(self, index)
+
+        return ledger
+
+    def merge(self, other: 'Ledger') -> None:
+        # Merges a time ordered ledger into this one, existing transactions go first when timestamps tie
+        if not other: return
+
+        if not self or other.timestamps[0] >= self.timestamps[-1]:
+            for index in range(len(other)):
+                self.appendRow(other, index)
+            return
+
+        amounts: array = array('q')
+        timestamps: array = array('q')
+        budgetTypeCodes: array = array('b')
+        descriptionIndexes: array = array('i')
+
+        i: int = 0
+        j: int = 0
+        while i < len(self) or j < len(other):
+            if j == len(other) or (i < len(self) and self.timestamps[i] <= other.timestamps[j]):
+                amounts.append(self.amounts[i])
+                timestamps.append(self.timestamps[i])
+                budgetTypeCodes.append(self.budgetTypeCodes[i])
+                descriptionIndexes.append(self.descriptionIndexes[i])
+                i += 1
+            else:
+                amounts.append(other.amounts[j])
+                timestamps.append(other.timestamps[j])
+                budgetTypeCodes.append(other.budgetTypeCodes[j])
+                descriptionIndexes.append(self.getDescriptionIndex(other.descriptions[other.descriptionIndexes[j]]))
+                j += 1
+
+        self.amounts, self.timestamps, self.budgetTypeCodes, self.descriptionIndexes = amounts, timestamps, budgetTypeCodes, descriptionIndexes
+        self.totals = [total + otherTotal for total, otherTotal in zip(self.totals, other.totals)]
+
+    def getTransaction(self, index: int) -> tuple[float, str, datetime]:
+        return (fromCents(self.amounts[index]),
+                self.descriptions[self.descriptionIndexes[index]],
+                LEDGER_EPOCH + timedelta(microseconds=self.timestamps[index]))
+
+    def indexRange(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> tuple[int, int]:
+        # Transactions are appended in time order, so the timestamp column is sorted and can be bisected, end is exclusive
+        low: int = bisect.bisect_left(self.timestamps, (start - LEDGER_EPOCH) // ONE_MICROSECOND) if start is not None else 0
+        high: int = bisect.bisect_left(self.timestamps, (end - LEDGER_EPOCH) // ONE_MICROSECOND, low) if end is not None else len(self)
+        return low, high
+
+    def getBudgetType(self, index: int) -> Optional[BudgetType]:
+        code: int = self.budgetTypeCodes[index]
+        return BUDGET_TYPES[code] if code != UNKNOWN_BUDGET_TYPE_CODE else None
+
+    def getTotal(self, budgetType: Optional[BudgetType]) -> int:
+        return self.totals[BUDGET_TYPE_CODES[budgetType] if budgetType is not None else UNKNOWN_BUDGET_TYPE_CODE]
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[tuple[float, str, datetime], list[tuple[float, str, datetime]]]:
+        if isinstance(index, slice):
+            return [self.getTransaction(i) for i in range(*index.indices(len(self)))]
+
+        if index < 0: index += len(self)
+        if not 0 <= index < len(self): raise IndexError('ledger index out of range')
+
+        return self.getTransaction(index)
+
+    def __iter__(self) -> Iterator[tuple[float, str, datetime]]:
+        for i in range(len(self)):
+            yield self.getTransaction(i)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Ledger): return list(self) == list(other) and self.budgetTypeCodes == other.budgetTypeCodes
+        if isinstance(other, list): return list(self) == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f'Ledger({list(self)!r})'
+
+    def __getstate__(self) -> dict:
+        state: dict = self.__dict__.copy()
+        del state['descriptionLookup']
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.descriptionLookup = {description: i for i, description in enumerate(self.descriptions)}
+
+        # Older pickles hold float dollar amounts and no running totals
+        if self.amounts.typecode == 'd':
+            self.amounts = array('q', map(toCents, self.amounts))
+
+        if 'totals' not in state:
+            self.totals = [0] * (len(BUDGET_TYPES) + 1)
+            for amount, code in zip(self.amounts, self.budgetTypeCodes):
+                self.totals[code] += amount
+
+class BreakSchedule:
+    # Breaks kept sorted by start with no two overlapping or touching, so the break ends are sorted too
+    def __init__(self, breaks: Iterable[tuple[datetime, datetime]] = ()) -> None:
+        self.intervals: list[tuple[datetime, datetime]] = []
+        self.version: int = 0
+
+        for breakStart, breakEnd in breaks:
+            self.add(breakStart, breakEnd)
+
+    def add(self, breakStart: datetime, breakEnd: datetime) -> tuple[datetime, datetime]:
+        index: int = bisect.bisect_left(self.intervals, (breakStart,))
+
+        if index > 0 and self.intervals[index - 1][1].date() + ONE_DAY >= breakStart.date():
+            index -= 1
+
+        end: int = index
+        while end < len(self.intervals) and self.intervals[end][0].date() <= breakEnd.date() + ONE_DAY:
+            breakStart = min(breakStart, self.intervals[end][0])
+            breakEnd = max(breakEnd, self.intervals[end][1])
+            end += 1
+
+        self.intervals[index:end] = [(breakStart, breakEnd)]
+        self.version += 1
+        return breakStart, breakEnd
+
+    def pop(self, index: int) -> tuple[datetime, datetime]:
+        removedBreak: tuple[datetime, datetime] = self.intervals.pop(index)
+        self.version += 1
+        return removedBreak
+
+    def upcoming(self, day: date) -> list[tuple[datetime, datetime]]:
+        # Breaks that have not fully ended before the given day
+        return self.intervals[bisect.bisect_left(self.intervals, day, key=lambda brk: brk[1].date()):]
+
+    def __len__(self) -> int:
+        return len(self.intervals)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[tuple[datetime, datetime], list[tuple[datetime, datetime]]]:
+        return self.intervals[index]
+
+    def __iter__(self) -> Iterator[tuple[datetime, datetime]]:
+        return iter(self.intervals)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, BreakSchedule): return self.intervals == other.intervals
+        if isinstance(other, list): return self.intervals == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f'BreakSchedule({self.intervals!r})'
+
+@dataclass
+class DaySummary:
+    firstOffset: int
+    count: int = 0
+    spent: int = 0
+    added: int = 0
+    spentByType: dict[Optional[BudgetType], int] = field(default_factory=dict)
+    addedByType: dict[Optional[BudgetType], int] = field(default_factory=dict)
+
+class DailyRollup:
+    def __init__(self) -> None:
+        self.days: dict[date, DaySummary] = {}
+
+    def record(self, offset: int, amount: int, timestamp: datetime, budgetType: Optional[BudgetType]) -> None:
+        day: date = timestamp.date()
+        summary: Optional[DaySummary] = self.days.get(day)
+
+        if summary is None:
+            summary = DaySummary(firstOffset=offset)
+            self.days[day] = summary
+
+        summary.count += 1
+
+        if amount < 0:
+            summary.spent += -amount
+            summary.spentByType[budgetType] = summary.spentByType.get(budgetType, 0) - amount
+        else:
+            summary.added += amount
+            summary.addedByType[budgetType] = summary.addedByType.get(budgetType, 0) + amount
+
+    def getDay(self, day: date) -> Optional[DaySummary]:
+        return self.days.get(day)
+
+    @classmethod
+    def fromLedger(cls, ledger: Ledger) -> 'DailyRollup':
+        # Transactions saved before budget types were recorded roll up under a None budget type
+        rollup: DailyRollup = cls()
+
+        for offset, (_, _, timestamp) in enumerate(ledger):
+            rollup.record(offset, ledger.amounts[offset], timestamp, ledger.getBudgetType(offset))
+
+        return rollup
+
+def createBalances(amounts: Optional[dict[BudgetType, float]] = None) -> list[int]:
+    # Balances are vectors of cents indexed by budget type code
+    balances: list[int] = [0] * len(BUDGET_TYPES)
+
+    for budgetType, amount in (amounts or {}).items():
+        balances[BUDGET_TYPE_CODES[budgetType]] = toCents(amount)
+
+    return balances
+
+class BalanceAttribute:
+    # Exposes one slot of a balance vector as a dollar attribute, the stores save and restore balances by these names
+    def __init__(self, vectorName: str, budgetType: BudgetType) -> None:
+        self.vectorName: str = vectorName
+        self.code: int = BUDGET_TYPE_CODES[budgetType]
+
+    def __get__(self, instance: Optional['UserData'], owner: Optional[type] = None) -> Union[float, 'BalanceAttribute']:
+        if instance is None: return self
+        return fromCents(getattr(instance, self.vectorName)[self.code])
+
+    def __set__(self, instance: 'UserData', amount: float) -> None:
+        getattr(instance, self.vectorName)[self.code] = toCents(amount)
+
+BALANCE_ATTRIBUTES: Final[tuple[str, ...]] = ('startingDiningDollars', 'startingTigerBucks', 'startingUSD', 'diningDollars', 'tigerBucks', 'USD')
+
+def tokenize(text: str) -> list[str]:
+    return SEARCH_TOKEN_PATTERN.findall(text.casefold())
+
+class SearchIndex:
+    # Inverted index over a ledger's descriptions. The ledger already stores each description once, so tokens map to
+    # description indexes and every description keeps the rows that use it in ledger order. The vocabulary is kept
+    # sorted so a search term matches every token it is a prefix of
+    def __init__(self) -> None:
+        self.tokens: list[str] = []
+        self.tokenDescriptions: dict[str, list[int]] = {}
+        self.descriptionRows: list[Optional[array]] = []
+
+    def add(self, row: int, descriptionIndex: int, description: str) -> None:
+        if descriptionIndex >= len(self.descriptionRows):
+            self.descriptionRows.extend([None] * (descriptionIndex + 1 - len(self.descriptionRows)))
+
+        rows: Optional[array] = self.descriptionRows[descriptionIndex]
+        if rows is None:
+            rows = self.descriptionRows[descriptionIndex] = array('i')
+
+            for token in set(tokenize(description)):
+                descriptionIndexes: Optional[list[int]] = self.tokenDescriptions.get(token)
+                if descriptionIndexes is None:
+                    descriptionIndexes = self.tokenDescriptions[token] = []
+                    bisect.insort(self.tokens, token)
+
+                descriptionIndexes.append(descriptionIndex)
+
+        rows.append(row)
+
+    def matchDescriptions(self, term: str) -> set[int]:
+        matched: set[int] = set()
+
+        for i in range(bisect.bisect_left(self.tokens, term), len(self.tokens)):
+            if not self.tokens[i].startswith(term): break
+            matched.update(self.tokenDescriptions[self.tokens[i]])
+
+        return matched
+
+    def search(self, ledger: Ledger, terms: list[str], low: int, high: int, minAmount: Optional[int] = None, maxAmount: Optional[int] = None) -> list[int]:
+        # Rows in [low, high) whose description matches every term and whose amount, either sign, is within the bounds
+        descriptionIndexes: Optional[set[int]] = None
+
+        for term in terms:
+            matched: set[int] = self.matchDescriptions(term)
+            descriptionIndexes = matched if descriptionIndexes is None else descriptionIndexes & matched
+            if not descriptionIndexes: return []
+
+        rows: list[int] = []
+        for descriptionIndex in descriptionIndexes:
+            descriptionRows: array = self.descriptionRows[descriptionIndex]
+
+            for row in descriptionRows[bisect.bisect_left(descriptionRows, low):bisect.bisect_left(descriptionRows, high)]:
+                amount: int = abs(ledger.amounts[row])
+                if (minAmount is None or amount >= minAmount) and (maxAmount is None or amount <= maxAmount): rows.append(row)
+
+        rows.sort()
+        return rows
+
+    @classmethod
+    def fromLedger(cls, ledger: Ledger) -> 'SearchIndex':
+        index: SearchIndex = cls()
+
+        for row, descriptionIndex in enumerate(ledger.descriptionIndexes):
+            index.add(row, descriptionIndex, ledger.descriptions[descriptionIndex])
+
+        return index
+
+@dataclass
+class UserData:
+    startingBalances: list[int] = field(default_factory=createBalances)
+    balances: list[int] = field(default_factory=createBalances)
+
+    startingDiningDollars = BalanceAttribute('startingBalances', BudgetType.DINING_DOLLARS)
+    startingTigerBucks = BalanceAttribute('startingBalances', BudgetType.TIGER_BUCKS)
+    startingUSD = BalanceAttribute('startingBalances', BudgetType.USD)
+
+    diningDollars = BalanceAttribute('balances', BudgetType.DINING_DOLLARS)
+    tigerBucks = BalanceAttribute('balances', BudgetType.TIGER_BUCKS)
+    USD = BalanceAttribute('balances', BudgetType.USD)
+
+    budgetDate: Optional[datetime] = None
+    dailyBudget: float = 0.0
+
+    digestTime: Optional[str] = None
+    digestTimeZone: str = DEFAULT_TIME_ZONE
+    digestLastSent: Optional[datetime] = None
+
+    ledger: Ledger = field(default_factory=Ledger)
+    breaks: BreakSchedule = field(default_factory=BreakSchedule)
+
+    dailyRollup: Optional[DailyRollup] = None
+    searchIndex: Optional[SearchIndex] = None
+
+    def getDailyRollup(self) -> DailyRollup:
+        if self.dailyRollup is None:
+            self.dailyRollup = DailyRollup.fromLedger(self.ledger)
+
+        return self.dailyRollup
+
+    def getSearchIndex(self) -> SearchIndex:
+        # Built the first time the user searches, then kept up to date and saved along with the record
+        if self.searchIndex is None:
+            self.searchIndex = SearchIndex.fromLedger(self.ledger)
+
+        return self.searchIndex
+
+    def appendTransaction(self, transaction: tuple[float, str, datetime], budgetType: Optional[BudgetType]) -> None:
+        rollup: DailyRollup = self.getDailyRollup()
+        self.ledger.append(transaction, budgetType)
+        rollup.record(len(self.ledger) - 1, self.ledger.amounts[-1], transaction[2], budgetType)
+
+        if self.searchIndex is not None:
+            self.searchIndex.add(len(self.ledger) - 1, self.ledger.descriptionIndexes[-1], transaction[1])
+
+    def getBalance(self, budgetType: BudgetType) -> float:
+        return fromCents(self.balances[BUDGET_TYPE_CODES[budgetType]])
+
+    def changeBalance(self, budgetType: BudgetType, amount: int) -> None:
+        self.balances[BUDGET_TYPE_CODES[budgetType]] += amount
+
+    def setBalance(self, budgetType: BudgetType, amount: int) -> None:
+        self.balances[BUDGET_TYPE_CODES[budgetType]] = amount
+
+    def getBalanceOffset(self) -> int:
+        # How far the balances are from the starting balances plus every transaction, summed over all budget types so
+        # transactions saved without one still count. Only setting a balance directly should change it
+        return sum(self.balances) - sum(self.startingBalances) - sum(self.ledger.totals)
+
+    def __getstate__(self) -> dict:
+        # The rollup is derived from the ledger and rebuilt the first time it is needed
+        state: dict = self.__dict__.copy()
+        state['dailyRollup'] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        # Older pickles hold plain lists for the ledger and breaks, and float dollar balances
+        if 'balances' not in state:
+            state = state.copy()
+            state['startingBalances'] = [toCents(state.pop(f'starting{name[0].upper()}{name[1:]}', 0.0)) for name in map(str, BUDGET_TYPES)]
+            state['balances'] = [toCents(state.pop(name, 0.0)) for name in map(str, BUDGET_TYPES)]
+            state['dailyRollup'] = None
+
+        self.__dict__.update(state)
+
+        if not isinstance(self.ledger, Ledger):
+            self.ledger = Ledger(self.ledger)
+
+        if not isinstance(self.breaks, BreakSchedule):
+            self.breaks = BreakSchedule(self.breaks)
+
+    def mergeTransactions(self, transactions: Ledger) -> None:
+        # Merged transactions can land anywhere in the ledger, which shifts the offsets the rollup and search index point at
+        self.ledger.merge(transactions)
+        self.dailyRollup = None
+        self.searchIndex = None
+
+    def getSummary(self) -> 'UserSummary':
+        return UserSummary(self.diningDollars, self.tigerBucks, self.USD, self.dailyBudget, self.budgetDate,
+                           self.digestTime, self.digestTimeZone, self.digestLastSent)
+
+@dataclass
+class MemberContribution:
+    spent: int = 0
+    added: int = 0
+    count: int = 0
+    active: bool = True
+
+    def record(self, amount: int) -> None:
+        if amount < 0: self.spent -= amount
+        else: self.added += amount
+
+        self.count += 1
+
+@dataclass
+class GroupData(UserData):
+    # A budget several users spend against, stored like any user's record under its group ID. Each member's share is
+    # kept up to date as transactions are recorded, and members who leave keep their past contributions.
+    # Only the owner's invitees can join, an invite is used up by joining
+    name: str = ''
+    members: dict[str, MemberContribution] = field(default_factory=dict)
+    ownerID: str = ''
+    invites: set[str] = field(default_factory=set)
+
+    def __setstate__(self, state: dict) -> None:
+        # Groups saved before joining needed an invite have no invites
+        super().__setstate__(state)
+        self.__dict__.setdefault('invites', set())
+
+    def setMember(self, memberID: str, active: bool) -> None:
+        member: Optional[MemberContribution] = self.members.get(memberID)
+        if member is None: self.members[memberID] = MemberContribution(active=active)
+        else: member.active = active
+
+    def isMember(self, memberID: str) -> bool:
+        member: Optional[MemberContribution] = self.members.get(memberID)
+        return member is not None and member.active
+
+    def canJoin(self, memberID: str) -> bool:
+        return memberID == self.ownerID or memberID in self.invites
+
+    def recordContribution(self, memberID: str, amount: int) -> None:
+        self.members[memberID].record(amount)
+
+def getGroupID(guildID: str, name: str) -> str:
+    # Group names are unique within a server and not case sensitive
+    return f'{GROUP_ID_PREFIX}{guildID}:{name.strip().lower()}'
+
+def isGroupID(recordID: str) -> bool:
+    return recordID.startswith(GROUP_ID_PREFIX)
+
+@dataclass
+class UserSummary:
+    # The part of a user's record that stays resident while the full record is paged out
+    diningDollars: float = 0.0
+    tigerBucks: float = 0.0
+    USD: float = 0.0
+    dailyBudget: float = 0.0
+    budgetDate: Optional[datetime] = None
+
+    digestTime: Optional[str] = None
+    digestTimeZone: str = DEFAULT_TIME_ZONE
+    digestLastSent: Optional[datetime] = None
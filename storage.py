@@ -0,0 +1,1100 @@
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from collections import Counter
+from models import BreakSchedule, BudgetType, DailyRollup, GroupData, Ledger, MemberContribution, UserData, UserSummary, BALANCE_ATTRIBUTES, CENTS_PER_DOLLAR, DEFAULT_TIME_ZONE, fromCents, isGroupID, toCents
+from datetime import datetime
+from typing import Any, Callable, ContextManager, Iterable, Iterator, Optional
+from typing import Final
+import contextlib
+import threading
+import sqlite3
+import metrics
+import pickle
+import struct
+import zlib
+import time
+import os
+
+JOURNAL_FLUSH_INTERVAL: Final[float] = 0.05
+JOURNAL_MIN_COMPACT_BYTES: Final[int] = 1 << 20
+JOURNAL_RECORD_HEADER: Final[struct.Struct] = struct.Struct('<II')
+SNAPSHOT_MAGIC: Final[bytes] = b'BBSNAP02'
+SQLITE_BUSY_TIMEOUT_MS: Final[int] = 5000
+
+# fsync acknowledges a mutation once its batch is on disk, write once the OS has it (survives the process crashing but
+# not the machine) and async straight away, with the batch following within the commit interval
+PERSIST_DURABILITY_MODES: Final[tuple[str, ...]] = ('fsync', 'write', 'async')
+PERSIST_DURABILITY: Final[str] = os.getenv('PERSIST_DURABILITY', 'fsync')
+PERSIST_COMMIT_INTERVAL: Final[float] = float(os.getenv('PERSIST_COMMIT_INTERVAL_MS', '10')) / 1000
+PERSIST_COMMIT_MAX_MUTATIONS: Final[int] = int(os.getenv('PERSIST_COMMIT_MAX_MUTATIONS', '256'))
+
+pendingCommits: threading.local = threading.local()
+
+def takePendingCommit() -> Optional[Future]:
+    # The commit the calling thread's last mutation is waiting on, if the durability mode waits at all
+    future: Optional[Future] = getattr(pendingCommits, 'future', None)
+    pendingCommits.future = None
+    return future
+
+def checkDurability(durability: str) -> str:
+    if durability not in PERSIST_DURABILITY_MODES:
+        raise ValueError(f'Unknown durability mode "{durability}", expected one of {", ".join(PERSIST_DURABILITY_MODES)}')
+
+    return durability
+
+class GroupCommit:
+    # Mutations are committed in batches by one background thread. A batch closes every interval, or as soon as
+    # maxMutations are waiting, and every mutation in it shares one future that resolves once the batch is committed
+    def __init__(self, name: str, commit: Callable[[list[tuple]], None],
+                 interval: float = PERSIST_COMMIT_INTERVAL, maxMutations: int = PERSIST_COMMIT_MAX_MUTATIONS) -> None:
+        self.name: str = name
+        self.commit: Callable[[list[tuple]], None] = commit
+        self.interval: float = interval
+        self.maxMutations: int = maxMutations
+
+        self.lock: threading.Lock = threading.Lock()
+        self.commitLock: threading.Lock = threading.Lock()
+        self.operations: list[tuple] = []
+        self.mutations: int = 0
+        self.future: Future = Future()
+
+        self.wakeup: threading.Event = threading.Event()
+        self.closed: bool = False
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.commitLoop, name=self.name, daemon=True)
+        self.thread.start()
+
+    def add(self, operations: Iterable[tuple] = ()) -> Future:
+        with self.lock:
+            self.operations.extend(operations)
+            self.mutations += 1
+            if self.mutations >= self.maxMutations: self.wakeup.set()
+
+            return self.future
+
+    def flush(self) -> None:
+        with self.commitLock:
+            with self.lock:
+                if not self.mutations and not self.operations: return
+
+                operations, mutations, future = self.operations, self.mutations, self.future
+                self.operations, self.mutations, self.future = [], 0, Future()
+
+            try:
+                self.commit(operations)
+            except Exception as error:
+                # The changes are already applied in memory, so they go back in front of the next batch to be retried
+                print(f'Could not commit a batch of {mutations} mutation(s): {error}')
+                with self.lock:
+                    self.operations[:0] = operations
+                    self.mutations += mutations
+
+                future.set_exception(error)
+                return
+
+            future.set_result(None)
+
+            if metrics.METRICS_ENABLED:
+                metrics.increment('budget_bot_persistence_batches_total', store=self.name)
+                metrics.increment('budget_bot_persistence_batched_mutations_total', mutations, store=self.name)
+
+    def commitLoop(self) -> None:
+        while not self.closed:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def close(self) -> None:
+        self.closed = True
+        self.wakeup.set()
+
+        if self.thread is not None:
+            self.thread.join()
+
+        self.flush()
+
+def coalesceOperations(operations: list[tuple]) -> list[tuple]:
+    # Only the last write to a field in a batch needs to reach the store. Field writes do not depend on the ledger or
+    # break operations around them, a setup replaces the whole record so writes before it are left alone
+    latest: dict[tuple[str, str], int] = {}
+    coalesced: list[Optional[tuple]] = []
+
+    for operation in operations:
+        kind, userID, *args = operation
+
+        if kind == 'set':
+            index: Optional[int] = latest.get((userID, args[0]))
+            if index is not None: coalesced[index] = None
+            latest[(userID, args[0])] = len(coalesced)
+        elif kind == 'setup':
+            for key in [key for key in latest if key[0] == userID]: del latest[key]
+
+        coalesced.append(operation)
+
+    return [operation for operation in coalesced if operation is not None]
+
+@dataclass
+class JournalSnapshot:
+    sequence: int = 0
+    userData: dict[str, Any] = field(default_factory=dict)
+    userBlobs: dict[str, bytes] = field(default_factory=dict)
+    userPages: dict[str, tuple[int, int]] = field(default_factory=dict)
+    summaries: dict[str, UserSummary] = field(default_factory=dict)
+
+    def __setstate__(self, state: dict) -> None:
+        # Snapshots written before records could be paged out only hold full records
+        self.__dict__.update(userBlobs={}, userPages={}, summaries={})
+        self.__dict__.update(state)
+
+class TransactionJournal:
+    def __init__(self, snapshotPath: str, journalPath: str, flushInterval: float = JOURNAL_FLUSH_INTERVAL) -> None:
+        self.snapshotPath: str = snapshotPath
+        self.journalPath: str = journalPath
+        self.rotatedJournalPath: str = f'{journalPath}.old'
+        self.flushInterval: float = flushInterval
+
+        self.lock: threading.RLock = threading.RLock()
+        self.sequence: int = 0
+        self.snapshotBytes: int = 0
+        self.journalBytes: int = 0
+        self.dirty: bool = False
+
+        self.file = None
+        self.pendingSnapshot: Optional[tuple[JournalSnapshot, Optional[Callable], Optional[Callable]]] = None
+        self.compacting: bool = False
+        self.compactionDone: threading.Event = threading.Event()
+        self.compactionDone.set()
+
+        self.wakeup: threading.Event = threading.Event()
+        self.closed: bool = False
+        self.flusher: Optional[threading.Thread] = None
+
+    def load(self) -> tuple[JournalSnapshot, Iterator[tuple]]:
+        snapshot: JournalSnapshot = self.readSnapshot()
+        self.sequence = snapshot.sequence
+
+        def operations() -> Iterator[tuple]:
+            for path in (self.rotatedJournalPath, self.journalPath):
+                for sequence, ops in self.readJournal(path):
+                    if sequence <= snapshot.sequence: continue
+                    self.sequence = max(self.sequence, sequence)
+                    yield from ops
+
+        return snapshot, operations()
+
+    def readSnapshot(self) -> JournalSnapshot:
+        if not os.path.exists(self.snapshotPath): return JournalSnapshot()
+
+        self.snapshotBytes = os.path.getsize(self.snapshotPath)
+
+        with open(self.snapshotPath, 'rb') as file:
+            # The header is followed by every user's pickled record, only the header is read up front
+            if file.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC:
+                length, checksum = JOURNAL_RECORD_HEADER.unpack(file.read(JOURNAL_RECORD_HEADER.size))
+                header: bytes = file.read(length)
+                if zlib.crc32(header) != checksum: raise ValueError(f'{self.snapshotPath} has a corrupt header')
+
+                snapshot: JournalSnapshot = pickle.loads(header)
+                start: int = file.tell()
+                snapshot.userPages = {userID: (start + offset, size) for userID, (offset, size) in snapshot.userPages.items()}
+                return snapshot
+
+            file.seek(0)
+            snapshot = pickle.load(file)
+
+        # Saves written before the journal existed are a bare userData dict
+        if isinstance(snapshot, JournalSnapshot): return snapshot
+        return JournalSnapshot(sequence=0, userData=snapshot)
+
+    def readPage(self, page: tuple[int, int]) -> bytes:
+        # Called with the lock held, so the snapshot is not replaced while the page is read
+        offset, length = page
+        with open(self.snapshotPath, 'rb') as file:
+            file.seek(offset)
+            return file.read(length)
+
+    def readJournal(self, path: str) -> Iterator[tuple[int, tuple]]:
+        if not os.path.exists(path): return
+
+        with open(path, 'rb') as file:
+            while True:
+                header: bytes = file.read(JOURNAL_RECORD_HEADER.size)
+                if len(header) < JOURNAL_RECORD_HEADER.size: return
+
+                length, checksum = JOURNAL_RECORD_HEADER.unpack(header)
+                payload: bytes = file.read(length)
+
+                # A torn or corrupt tail means the process died mid-write, everything before it is intact
+                if len(payload) < length or zlib.crc32(payload) != checksum: return
+
+                yield pickle.loads(payload)
+
+    def open(self) -> None:
+        with self.lock:
+            if self.file is not None: return
+
+            self.file = open(self.journalPath, 'ab')
+            self.journalBytes = self.file.tell()
+
+        self.flusher = threading.Thread(target=self.flushLoop, name='journal-flusher', daemon=True)
+        self.flusher.start()
+
+    def record(self, *ops: tuple) -> None:
+        with self.lock:
+            self.sequence += 1
+            payload: bytes = pickle.dumps((self.sequence, ops), protocol=pickle.HIGHEST_PROTOCOL)
+
+            self.file.write(JOURNAL_RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+            self.file.write(payload)
+
+            self.journalBytes += JOURNAL_RECORD_HEADER.size + len(payload)
+            self.dirty = True
+
+    def shouldCompact(self) -> bool:
+        return not self.compacting and self.journalBytes >= max(JOURNAL_MIN_COMPACT_BYTES, self.snapshotBytes)
+
+    def compact(self, createSnapshot: Callable[[int], JournalSnapshot], wait: bool = False,
+                snapshotWritten: Optional[Callable[[JournalSnapshot, dict[str, tuple[int, int]]], None]] = None,
+                completeSnapshot: Optional[Callable[[JournalSnapshot], None]] = None) -> None:
+        # The snapshot is taken on the caller's thread so it is consistent with the journal sequence, records it leaves
+        # to be pickled are filled in by completeSnapshot on the thread that writes it
+        with self.lock:
+            if self.file is None: return
+
+            if self.compacting:
+                if not wait: return
+                self.lock.release()
+                try: self.compactionDone.wait()
+                finally: self.lock.acquire()
+
+            snapshot: JournalSnapshot = createSnapshot(self.sequence)
+
+            self.syncLocked()
+            self.file.close()
+            self.rotateJournal()
+            self.file = open(self.journalPath, 'ab')
+            self.journalBytes = 0
+
+            self.compacting = True
+            self.compactionDone.clear()
+            self.pendingSnapshot = (snapshot, completeSnapshot, snapshotWritten)
+
+        if wait: self.writePendingSnapshot()
+        else: self.wakeup.set()
+
+    def snapshotHeader(self, snapshot: JournalSnapshot) -> bytes:
+        # Records are laid out after the header, those still in the current snapshot file are copied over when it is written
+        pages: dict[str, tuple[int, int]] = {}
+        offset: int = 0
+        for userID in self.snapshotUserIDs(snapshot):
+            userBlob: Optional[bytes] = snapshot.userBlobs.get(userID)
+            length: int = len(userBlob) if userBlob is not None else snapshot.userPages[userID][1]
+            pages[userID] = (offset, length)
+            offset += length
+
+        return pickle.dumps(JournalSnapshot(snapshot.sequence, userPages=pages, summaries=snapshot.summaries), protocol=pickle.HIGHEST_PROTOCOL)
+
+    def snapshotUserIDs(self, snapshot: JournalSnapshot) -> list[str]:
+        return list(snapshot.userBlobs) + [userID for userID in snapshot.userPages if userID not in snapshot.userBlobs]
+
+    def rotateJournal(self) -> None:
+        if not os.path.exists(self.rotatedJournalPath):
+            os.replace(self.journalPath, self.rotatedJournalPath)
+            return
+
+        # A rotated journal left behind by a crash mid-compaction is not covered by any snapshot yet, so keep it
+        with open(self.journalPath, 'rb') as source, open(self.rotatedJournalPath, 'ab') as destination:
+            while chunk := source.read(1 << 16):
+                destination.write(chunk)
+
+            destination.flush()
+            os.fsync(destination.fileno())
+
+        os.remove(self.journalPath)
+
+    def writePendingSnapshot(self) -> None:
+        with self.lock:
+            pending: Optional[tuple[JournalSnapshot, Optional[Callable], Optional[Callable]]] = self.pendingSnapshot
+            self.pendingSnapshot = None
+
+        if pending is None: return
+
+        snapshot, completeSnapshot, snapshotWritten = pending
+        temporaryPath: str = f'{self.snapshotPath}.tmp'
+        start: float = time.perf_counter()
+        pages: dict[str, tuple[int, int]] = {}
+
+        if completeSnapshot is not None: completeSnapshot(snapshot)
+        header: bytes = self.snapshotHeader(snapshot)
+
+        # Nothing replaces the current snapshot while this one is pending, so its pages can be read without the lock
+        with open(temporaryPath, 'wb') as file, contextlib.ExitStack() as stack:
+            previous = stack.enter_context(open(self.snapshotPath, 'rb')) if snapshot.userPages else None
+
+            file.write(SNAPSHOT_MAGIC)
+            file.write(JOURNAL_RECORD_HEADER.pack(len(header), zlib.crc32(header)))
+            file.write(header)
+
+            for userID in self.snapshotUserIDs(snapshot):
+                userBlob: Optional[bytes] = snapshot.userBlobs.get(userID)
+                if userBlob is None:
+                    offset, length = snapshot.userPages[userID]
+                    previous.seek(offset)
+                    userBlob = previous.read(length)
+
+                pages[userID] = (file.tell(), len(userBlob))
+                file.write(userBlob)
+
+            snapshotBytes: int = file.tell()
+            file.flush()
+            os.fsync(file.fileno())
+
+        # Pages of the old snapshot are read under the lock, so they must not be swapped for the new ones mid read
+        with self.lock:
+            os.replace(temporaryPath, self.snapshotPath)
+            if snapshotWritten is not None: snapshotWritten(snapshot, pages)
+
+        if os.path.exists(self.rotatedJournalPath):
+            os.remove(self.rotatedJournalPath)
+
+        if metrics.METRICS_ENABLED:
+            metrics.observe('budget_bot_persistence_flush_seconds', time.perf_counter() - start, store='journal', kind='snapshot')
+
+        with self.lock:
+            self.snapshotBytes = snapshotBytes
+            self.compacting = False
+            self.compactionDone.set()
+
+    def syncLocked(self) -> None:
+        if not self.dirty: return
+
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.dirty = False
+
+    def sync(self, fsync: bool = True) -> None:
+        # Only the flush to the OS holds the lock, the fsync itself runs on a duplicate descriptor so writers are not stalled
+        with self.lock:
+            if self.file is None or not self.dirty: return
+
+            self.file.flush()
+            if not fsync: return
+
+            sequence: int = self.sequence
+            descriptor: int = os.dup(self.file.fileno())
+
+        start: float = time.perf_counter()
+        try: os.fsync(descriptor)
+        finally: os.close(descriptor)
+
+        # Records written while the fsync ran may not be covered by it, and a failed fsync leaves the journal dirty to be retried
+        with self.lock:
+            if self.sequence == sequence: self.dirty = False
+
+        if metrics.METRICS_ENABLED:
+            metrics.observe('budget_bot_persistence_flush_seconds', time.perf_counter() - start, store='journal', kind='fsync')
+
+    def flushLoop(self) -> None:
+        while not self.closed:
+            self.wakeup.wait(self.flushInterval)
+            self.wakeup.clear()
+
+            # A failed sync leaves the journal dirty, so the next pass retries it
+            try: self.sync()
+            except OSError as error: print(f'Could not sync the journal: {error}')
+
+            self.writePendingSnapshot()
+
+    def close(self) -> None:
+        self.closed = True
+        self.wakeup.set()
+
+        if self.flusher is not None:
+            self.flusher.join()
+
+        self.writePendingSnapshot()
+
+        with self.lock:
+            if self.file is None: return
+
+            self.syncLocked()
+            self.file.close()
+            self.file = None
+
+def applyOperation(userData: dict[str, UserData], operation: tuple) -> None:
+    kind, userID, *args = operation
+
+    if kind == 'setup': userData[userID] = args[0]
+    elif kind == 'ledger': userData[userID].appendTransaction(args[0], args[1] if len(args) > 1 else None)
+    elif kind == 'importLedger': userData[userID].mergeTransactions(args[0])
+    elif kind == 'set': setattr(userData[userID], args[0], args[1])
+    elif kind == 'addBreak': userData[userID].breaks.add(*args[0])
+    elif kind == 'removeBreak': userData[userID].breaks.pop(args[0])
+    elif kind == 'member': userData[userID].members[args[0]] = args[1]
+    elif kind == 'invite':
+        if args[1]: userData[userID].invites.add(args[0])
+        else: userData[userID].invites.discard(args[0])
+
+class UserDataStore:
+    shared: bool = False
+
+    def open(self) -> dict[str, UserData]:
+        raise NotImplementedError
+
+    def loadUser(self, userID: str) -> Optional[UserData]:
+        raise NotImplementedError
+
+    def loadSummary(self, userID: str) -> Optional[UserSummary]:
+        return None
+
+    def loadSummaries(self) -> dict[str, UserSummary]:
+        return {}
+
+    def evictUser(self, userID: str) -> bool:
+        return False
+
+    def validateCachedUser(self, userID: str) -> None:
+        pass
+
+    def record(self, *operations: tuple) -> None:
+        raise NotImplementedError
+
+    def mutationLock(self, userID: str) -> ContextManager:
+        return contextlib.nullcontext()
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+class JournalStore(UserDataStore):
+    def __init__(self, snapshotPath: str, journalPath: str, durability: str = PERSIST_DURABILITY) -> None:
+        self.journal: TransactionJournal = TransactionJournal(snapshotPath, journalPath)
+        self.userData: LazyUserData = LazyUserData(self)
+        self.durability: str = checkDurability(durability)
+        self.groupCommit: Optional[GroupCommit] = None
+
+        # Paged out users are read back from their offset in the snapshot file, only those that changed since the
+        # last snapshot was written are held as pickled bytes, until the next snapshot gives them a page
+        self.userPages: dict[str, tuple[int, int]] = {}
+        self.userBlobs: dict[str, bytes] = {}
+
+        # Resident users' records as last pickled, dropped once the user changes, so a snapshot only pickles changed users
+        self.snapshotBlobs: dict[str, bytes] = {}
+        self.dirtyUsers: set[str] = set()
+
+        # Changed users the pending snapshot still has to pickle, whoever gets to a user first pickles it under snapshotLock
+        self.snapshotLock: threading.Lock = threading.Lock()
+        self.snapshotUsers: dict[str, UserData] = {}
+        self.snapshotResidents: dict[str, UserData] = {}
+        self.pendingSnapshot: Optional[JournalSnapshot] = None
+
+    def readState(self) -> None:
+        snapshot, operations = self.journal.load()
+        self.snapshotBlobs = {}
+        self.dirtyUsers = set()
+
+        # Records stay in the snapshot file until a user is first used, only their summaries are unpacked up front
+        self.userPages = dict(snapshot.userPages)
+        self.userBlobs = dict(snapshot.userBlobs)
+        self.userData = LazyUserData(self, dict(snapshot.summaries))
+        dict.update(self.userData, snapshot.userData)
+
+        for operation in operations:
+            applyOperation(self.userData, operation)
+            self.dirtyUsers.add(operation[1])
+
+    def load(self) -> dict[str, UserData]:
+        self.readState()
+        return {userID: self.userData[userID] for userID in self.userData.getUserIDs()}
+
+    def open(self) -> dict[str, UserData]:
+        self.readState()
+        self.journal.open()
+
+        # Records are appended to the journal as they happen, the group commit batches the flushes and fsyncs behind them
+        if self.durability != 'async':
+            self.groupCommit = GroupCommit('journal-commit', self.commitJournal)
+            self.groupCommit.start()
+
+        return self.userData
+
+    def commitJournal(self, operations: list[tuple]) -> None:
+        self.journal.sync(fsync=self.durability == 'fsync')
+
+    def loadUser(self, userID: str) -> Optional[UserData]:
+        with self.journal.lock:
+            # Another thread may have unpacked the record while this one waited
+            if dict.__contains__(self.userData, userID): return dict.__getitem__(self.userData, userID)
+
+            # A record that was not written to the snapshot yet is newer than the user's page
+            userBlob: Optional[bytes] = self.userBlobs.pop(userID, None)
+            if userBlob is not None: self.userPages.pop(userID, None)
+            elif userID in self.userPages: userBlob = self.journal.readPage(self.userPages[userID])
+            else: return None
+
+            self.snapshotBlobs[userID] = userBlob
+            return pickle.loads(userBlob)
+
+    def evictUser(self, userID: str) -> bool:
+        # Holding the journal lock means no mutation of this user is half applied while it is pickled
+        with self.journal.lock:
+            data: Optional[UserData] = self.userData.evict(userID)
+            if data is None: return False
+
+            userBlob: Optional[bytes] = self.snapshotBlobs.pop(userID, None)
+            dirty: bool = userID in self.dirtyUsers
+            self.dirtyUsers.discard(userID)
+
+            # An unchanged user's page still holds its record, so nothing needs to stay in memory
+            if not dirty and userID in self.userPages: return True
+
+            if userBlob is None or dirty: userBlob = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+            self.userBlobs[userID] = userBlob
+            return True
+
+    def createSnapshot(self, sequence: int) -> JournalSnapshot:
+        for userID in self.dirtyUsers: self.snapshotBlobs.pop(userID, None)
+        self.dirtyUsers.clear()
+
+        # Only the changed users are collected here, they are pickled by completeSnapshot on the thread that writes the snapshot
+        userBlobs: dict[str, bytes] = dict(self.userBlobs)
+        snapshotUsers: dict[str, UserData] = {}
+        for userID, data in dict.items(self.userData):
+            userBlob: Optional[bytes] = self.snapshotBlobs.get(userID)
+            if userBlob is None: snapshotUsers[userID] = data
+            else: userBlobs[userID] = userBlob
+
+            # Until the new snapshot is written an evicted resident user has no page that is known to be current
+            self.userPages.pop(userID, None)
+
+        userPages: dict[str, tuple[int, int]] = {userID: page for userID, page in self.userPages.items() if userID not in userBlobs}
+        summaries: dict[str, UserSummary] = {userID: self.userData.getSummary(userID) for userID in self.userData.getUserIDs()}
+
+        self.pendingSnapshot = JournalSnapshot(sequence, userBlobs=userBlobs, userPages=userPages, summaries=summaries)
+        self.snapshotUsers = snapshotUsers
+        self.snapshotResidents = dict(snapshotUsers)
+        return self.pendingSnapshot
+
+    def pickleSnapshotUser(self, userID: str) -> None:
+        # Called with snapshotLock held, the user is only dropped from snapshotUsers once its record is in the snapshot
+        data: Optional[UserData] = self.snapshotUsers.get(userID)
+        if data is None: return
+
+        self.pendingSnapshot.userBlobs[userID] = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        del self.snapshotUsers[userID]
+
+    def completeSnapshot(self, snapshot: JournalSnapshot) -> None:
+        # Each user is pickled on its own so a mutation waiting on one of them is not held up by the rest
+        for userID in list(self.snapshotUsers):
+            with self.snapshotLock: self.pickleSnapshotUser(userID)
+
+    def snapshotWritten(self, snapshot: JournalSnapshot, pages: dict[str, tuple[int, int]]) -> None:
+        # Called by the journal with its lock held, once the pages point into the new snapshot file
+        self.userPages.update(pages)
+
+        # Records that changed again after the snapshot was taken are newer than their page, so they stay in memory
+        for userID, userBlob in snapshot.userBlobs.items():
+            if self.userBlobs.get(userID) is userBlob: del self.userBlobs[userID]
+
+        # Users still resident and unchanged since they were pickled keep their record for the next snapshot
+        for userID, data in self.snapshotResidents.items():
+            if userID not in self.dirtyUsers and dict.get(self.userData, userID) is data: self.snapshotBlobs[userID] = snapshot.userBlobs[userID]
+
+        self.snapshotResidents = {}
+        self.pendingSnapshot = None
+
+    def compact(self, wait: bool = False) -> None:
+        self.journal.compact(self.createSnapshot, wait, self.snapshotWritten, self.completeSnapshot)
+
+    def record(self, *operations: tuple) -> None:
+        with self.journal.lock:
+            self.journal.record(*operations)
+            self.dirtyUsers.update(operation[1] for operation in operations)
+
+        if self.groupCommit is not None: pendingCommits.future = self.groupCommit.add()
+
+        if self.journal.shouldCompact():
+            self.compact()
+
+    @contextlib.contextmanager
+    def lockUser(self, userID: str) -> Iterator[None]:
+        with self.journal.lock:
+            # A user the pending snapshot has not pickled yet is pickled before it changes, so the snapshot still matches its sequence
+            if self.snapshotUsers:
+                with self.snapshotLock: self.pickleSnapshotUser(userID)
+
+            yield
+
+    def mutationLock(self, userID: str) -> ContextManager:
+        # Mutations and their journal records must not interleave with a compaction snapshot
+        return self.lockUser(userID)
+
+    def close(self) -> None:
+        if self.groupCommit is not None: self.groupCommit.close()
+
+        self.compact(wait=True)
+        self.journal.close()
+
+class LazyUserData(dict):
+    # Full records are loaded from the store on first use and can be paged out again once idle,
+    # a summary of every known user stays resident so budget and balance checks never need the full record
+    def __init__(self, store: UserDataStore, summaries: Optional[dict[str, UserSummary]] = None) -> None:
+        super().__init__()
+        self.store: UserDataStore = store
+        self.summaries: dict[str, UserSummary] = summaries if summaries is not None else {}
+        self.lastAccess: dict[str, float] = {}
+
+    def __getitem__(self, userID: str) -> UserData:
+        if self.store.shared: self.store.validateCachedUser(userID)
+        self.lastAccess[userID] = time.monotonic()
+        return super().__getitem__(userID)
+
+    def __setitem__(self, userID: str, data: UserData) -> None:
+        super().__setitem__(userID, data)
+        self.lastAccess[userID] = time.monotonic()
+
+    def __missing__(self, userID: str) -> UserData:
+        data: Optional[UserData] = self.store.loadUser(userID)
+        if data is None: raise KeyError(userID)
+
+        self[userID] = data
+        return data
+
+    def __contains__(self, userID: object) -> bool:
+        return dict.__contains__(self, userID) or self.getSummary(userID) is not None
+
+    def getSummary(self, userID: str) -> Optional[UserSummary]:
+        if self.store.shared: self.store.validateCachedUser(userID)
+
+        data: Optional[UserData] = dict.get(self, userID)
+        if data is not None: return data.getSummary()
+
+        # Other processes change users behind this one's back, so shared stores read the summary fresh
+        if self.store.shared: return self.store.loadSummary(userID)
+        return self.summaries.get(userID)
+
+    def getSummaries(self) -> dict[str, UserSummary]:
+        if self.store.shared: return self.store.loadSummaries()
+
+        summaries: dict[str, UserSummary] = dict(self.summaries)
+        summaries.update((userID, data.getSummary()) for userID, data in list(dict.items(self)))
+        return summaries
+
+    def getUserIDs(self) -> set[str]:
+        return set(dict.keys(self)) | set(self.summaries)
+
+    def evict(self, userID: str) -> Optional[UserData]:
+        # Called by the store with its lock held
+        data: Optional[UserData] = dict.pop(self, userID, None)
+        self.lastAccess.pop(userID, None)
+
+        if data is not None: self.summaries[userID] = data.getSummary()
+        return data
+
+    def evictIdle(self, idleSeconds: float) -> list[str]:
+        cutoff: float = time.monotonic() - idleSeconds
+        return [userID for userID, lastAccess in list(self.lastAccess.items()) if lastAccess <= cutoff and self.store.evictUser(userID)]
+
+class SQLiteStore(UserDataStore):
+    USER_FIELDS: Final[tuple[str, ...]] = (
+        'startingDiningDollars', 'startingTigerBucks', 'startingUSD',
+        'diningDollars', 'tigerBucks', 'USD',
+        'budgetDate', 'dailyBudget',
+        'digestTime', 'digestTimeZone', 'digestLastSent')
+
+    SUMMARY_FIELDS: Final[tuple[str, ...]] = (
+        'diningDollars', 'tigerBucks', 'USD', 'dailyBudget', 'budgetDate',
+        'digestTime', 'digestTimeZone', 'digestLastSent')
+
+    DATETIME_FIELDS: Final[tuple[str, ...]] = ('budgetDate', 'digestLastSent')
+
+    # Columns added to the users table after it was first created, with their definitions
+    USER_COLUMN_MIGRATIONS: Final[dict[str, str]] = {
+        'version': 'INTEGER NOT NULL DEFAULT 0',
+        'digestTime': 'TEXT',
+        'digestTimeZone': f"TEXT NOT NULL DEFAULT '{DEFAULT_TIME_ZONE}'",
+        'digestLastSent': 'REAL'}
+
+    # Money is stored as whole cents like it is held in memory, dollars only appear on the way in and out. The daily
+    # budget is the remaining balance spread over the days left, a fraction of a cent, so it stays REAL dollars
+    CENT_FIELDS: Final[tuple[str, ...]] = BALANCE_ATTRIBUTES
+
+    # Tables whose money columns held REAL dollars before they were stored in cents, with those columns
+    CENT_MIGRATIONS: Final[dict[str, tuple[str, ...]]] = {'users': CENT_FIELDS, 'ledger': ('amount',)}
+
+    USERS_TABLE: Final[str] = (
+        'CREATE TABLE IF NOT EXISTS {table} ('
+        '    userID TEXT PRIMARY KEY,'
+        '    startingDiningDollars INTEGER NOT NULL, startingTigerBucks INTEGER NOT NULL, startingUSD INTEGER NOT NULL,'
+        '    diningDollars INTEGER NOT NULL, tigerBucks INTEGER NOT NULL, USD INTEGER NOT NULL,'
+        '    budgetDate REAL, dailyBudget REAL NOT NULL, version INTEGER NOT NULL DEFAULT 0,'
+        f"    digestTime TEXT, digestTimeZone TEXT NOT NULL DEFAULT '{DEFAULT_TIME_ZONE}', digestLastSent REAL);")
+
+    LEDGER_TABLE: Final[str] = (
+        'CREATE TABLE IF NOT EXISTS {table} ('
+        '    id INTEGER PRIMARY KEY, userID TEXT NOT NULL, amount INTEGER NOT NULL, description TEXT NOT NULL, timestamp REAL NOT NULL, budgetType TEXT);')
+
+    TABLES: Final[dict[str, str]] = {'users': USERS_TABLE, 'ledger': LEDGER_TABLE}
+
+    SCHEMA: Final[str] = (
+        USERS_TABLE.format(table='users') +
+        LEDGER_TABLE.format(table='ledger') +
+        'CREATE INDEX IF NOT EXISTS ledgerUserTimestamp ON ledger (userID, timestamp);'
+        'CREATE TABLE IF NOT EXISTS breaks ('
+        '    id INTEGER PRIMARY KEY, userID TEXT NOT NULL, start REAL NOT NULL, end REAL NOT NULL);'
+        'CREATE INDEX IF NOT EXISTS breaksUserStart ON breaks (userID, start);'
+        'CREATE TABLE IF NOT EXISTS groups ('
+        "    groupID TEXT PRIMARY KEY, name TEXT NOT NULL, ownerID TEXT NOT NULL DEFAULT '');"
+        'CREATE TABLE IF NOT EXISTS groupInvites ('
+        '    groupID TEXT NOT NULL, memberID TEXT NOT NULL, PRIMARY KEY (groupID, memberID));'
+        'CREATE TABLE IF NOT EXISTS groupMembers ('
+        '    groupID TEXT NOT NULL, memberID TEXT NOT NULL, spent INTEGER NOT NULL DEFAULT 0, added INTEGER NOT NULL DEFAULT 0,'
+        '    count INTEGER NOT NULL DEFAULT 0, active INTEGER NOT NULL DEFAULT 1, PRIMARY KEY (groupID, memberID));')
+
+    def __init__(self, path: str, migrateFrom: Optional[JournalStore] = None, shared: bool = False, durability: str = PERSIST_DURABILITY) -> None:
+        self.path: str = path
+        self.migrateFrom: Optional[JournalStore] = migrateFrom
+        self.shared: bool = shared
+        self.durability: str = checkDurability(durability)
+        self.groupCommit: Optional[GroupCommit] = None
+        self.pendingWrites: Counter[str] = Counter()
+        self.versions: dict[str, int] = {}
+        self.local: threading.local = threading.local()
+        self.connections: list[sqlite3.Connection] = []
+        self.connectionsLock: threading.Lock = threading.Lock()
+        self.lock: threading.RLock = threading.RLock()
+        self.userData: LazyUserData = LazyUserData(self)
+
+    def connection(self) -> sqlite3.Connection:
+        connection: Optional[sqlite3.Connection] = getattr(self.local, 'connection', None)
+        if connection is not None: return connection
+
+        # One connection per thread, the sqlite3 module keeps each connection's prepared statements cached
+        connection = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # In WAL mode NORMAL only syncs at checkpoints, FULL syncs every commit
+        connection.execute(f'PRAGMA synchronous={"FULL" if self.durability == "fsync" else "NORMAL"}')
+
+        self.local.connection = connection
+        with self.connectionsLock: self.connections.append(connection)
+
+        return connection
+
+    def open(self) -> dict[str, UserData]:
+        connection: sqlite3.Connection = self.connection()
+        connection.executescript(self.SCHEMA)
+
+        # Processes the launcher starts together open the database at the same time. Each check is made again under the
+        # write lock, so the migrations and the first import only ever run once
+        isEmpty: bool = connection.execute('SELECT 1 FROM users LIMIT 1').fetchone() is None
+        migratedUsers: Optional[dict[str, UserData]] = self.migrateFrom.load() if isEmpty and self.migrateFrom is not None else None
+
+        connection.execute('BEGIN IMMEDIATE')
+
+        with connection:
+            self.migrateColumns(connection)
+
+            if any(self.hasDollarColumns(connection, table) for table in self.CENT_MIGRATIONS):
+                self.migrateToCents(connection)
+
+            # Databases written while the daily budget was stored in cents get it back in dollars
+            if self.getColumnTypes(connection, 'users')['dailyBudget'] == 'INTEGER':
+                self.rebuildTable(connection, 'users', {'dailyBudget': f'CAST(dailyBudget AS REAL) / {CENTS_PER_DOLLAR}'})
+
+            if migratedUsers is not None and connection.execute('SELECT 1 FROM users LIMIT 1').fetchone() is None:
+                self.importUsers(migratedUsers)
+
+        # Rebuilt tables lose their indexes
+        connection.executescript(self.SCHEMA)
+
+        # Shared stores read summaries fresh on every check, there is no point holding them
+        if not self.shared: self.userData.summaries = self.loadSummaries()
+
+        # A shared store's mutations commit inside the transaction that locks the user across processes, everywhere else
+        # memory holds the latest copy and writes are batched behind it
+        if not self.shared:
+            self.groupCommit = GroupCommit('sqlite-commit', self.writeBatch)
+            self.groupCommit.start()
+
+        return self.userData
+
+    def getColumnTypes(self, connection: sqlite3.Connection, table: str) -> dict[str, str]:
+        return {row[1]: row[2] for row in connection.execute(f'PRAGMA table_info({table})')}
+
+    def hasDollarColumns(self, connection: sqlite3.Connection, table: str) -> bool:
+        return self.getColumnTypes(connection, table)[self.CENT_MIGRATIONS[table][0]] == 'REAL'
+
+    def migrateColumns(self, connection: sqlite3.Connection) -> None:
+        ledgerColumns: set[str] = {row[1] for row in connection.execute('PRAGMA table_info(ledger)')}
+        if 'budgetType' not in ledgerColumns:
+            connection.execute('ALTER TABLE ledger ADD COLUMN budgetType TEXT')
+
+        groupColumns: set[str] = {row[1] for row in connection.execute('PRAGMA table_info(groups)')}
+        if 'ownerID' not in groupColumns:
+            connection.execute("ALTER TABLE groups ADD COLUMN ownerID TEXT NOT NULL DEFAULT ''")
+
+        userColumns: set[str] = {row[1] for row in connection.execute('PRAGMA table_info(users)')}
+        for column, definition in self.USER_COLUMN_MIGRATIONS.items():
+            if column not in userColumns: connection.execute(f'ALTER TABLE users ADD COLUMN {column} {definition}')
+
+    def migrateToCents(self, connection: sqlite3.Connection) -> None:
+        # Runs inside the open transaction, after the column migrations so every column is copied over
+        for table, columns in self.CENT_MIGRATIONS.items():
+            if not self.hasDollarColumns(connection, table): continue
+
+            self.rebuildTable(connection, table, {name: f'CAST(ROUND({name} * {CENTS_PER_DOLLAR}) AS INTEGER)' for name in columns})
+
+    def rebuildTable(self, connection: sqlite3.Connection, table: str, conversions: dict[str, str]) -> None:
+        # SQLite cannot change a column's type in place, so the table is rebuilt from the current schema with the values converted
+        names: list[str] = list(self.getColumnTypes(connection, table))
+        values: str = ', '.join(conversions.get(name, name) for name in names)
+
+        connection.execute(self.TABLES[table].format(table=f'{table}Rebuilt'))
+        connection.execute(f'INSERT INTO {table}Rebuilt ({", ".join(names)}) SELECT {values} FROM {table}')
+        connection.execute(f'DROP TABLE {table}')
+        connection.execute(f'ALTER TABLE {table}Rebuilt RENAME TO {table}')
+
+    def importUsers(self, userData: dict[str, UserData]) -> None:
+        connection: sqlite3.Connection = self.connection()
+
+        # While the store opens the import runs inside its migration transaction
+        transaction: ContextManager = contextlib.nullcontext() if connection.in_transaction else connection
+        with transaction:
+            for userID, data in userData.items():
+                self.writeUser(connection, userID, data)
+                connection.executemany('INSERT INTO ledger (userID, amount, description, timestamp, budgetType) VALUES (?, ?, ?, ?, ?)',
+                                       ((userID, data.ledger.amounts[i], description, date.timestamp(), str(data.ledger.getBudgetType(i)) if data.ledger.getBudgetType(i) is not None else None)
+                                        for i, (_, description, date) in enumerate(data.ledger)))
+                connection.executemany('INSERT INTO breaks (userID, start, end) VALUES (?, ?, ?)',
+                                       ((userID, start.timestamp(), end.timestamp()) for start, end in data.breaks))
+                if isinstance(data, GroupData): self.writeGroup(connection, userID, data)
+
+    def writeGroup(self, connection: sqlite3.Connection, groupID: str, data: GroupData) -> None:
+        connection.execute('INSERT OR REPLACE INTO groups (groupID, name, ownerID) VALUES (?, ?, ?)', (groupID, data.name, data.ownerID))
+        connection.execute('DELETE FROM groupMembers WHERE groupID = ?', (groupID,))
+        connection.executemany('INSERT INTO groupMembers (groupID, memberID, spent, added, count, active) VALUES (?, ?, ?, ?, ?, ?)',
+                               ((groupID, memberID, member.spent, member.added, member.count, member.active) for memberID, member in data.members.items()))
+        connection.execute('DELETE FROM groupInvites WHERE groupID = ?', (groupID,))
+        connection.executemany('INSERT INTO groupInvites (groupID, memberID) VALUES (?, ?)', ((groupID, memberID) for memberID in data.invites))
+
+    def writeUser(self, connection: sqlite3.Connection, userID: str, data: UserData) -> None:
+        values: list = [toCents(getattr(data, name)) if name in self.CENT_FIELDS else getattr(data, name) for name in self.USER_FIELDS]
+        for name in self.DATETIME_FIELDS:
+            value: Optional[datetime] = getattr(data, name)
+            values[self.USER_FIELDS.index(name)] = value.timestamp() if value is not None else None
+
+        connection.execute(f'INSERT OR REPLACE INTO users (userID, {", ".join(self.USER_FIELDS)}, version) '
+                           f'VALUES (?{", ?" * len(self.USER_FIELDS)}, COALESCE((SELECT version FROM users WHERE userID = ?), 0))', (userID, *values, userID))
+
+    def loadUser(self, userID: str) -> Optional[UserData]:
+        connection: sqlite3.Connection = self.connection()
+
+        # The user's rows are read from one snapshot, so another process's write cannot land between the queries
+        with self.readTransaction(connection):
+            row: Optional[tuple] = connection.execute(f'SELECT {", ".join(self.USER_FIELDS)}, version FROM users WHERE userID = ?', (userID,)).fetchone()
+            if row is None: return None
+
+            *values, self.versions[userID] = row
+            fields: dict[str, Any] = self.readStoredFields(dict(zip(self.USER_FIELDS, values)))
+
+            # Balances go through the attributes that fill in the cent vectors
+            balances: dict[str, float] = {name: fields.pop(name) for name in BALANCE_ATTRIBUTES}
+            groupRow: Optional[tuple] = connection.execute('SELECT name, ownerID FROM groups WHERE groupID = ?', (userID,)).fetchone() if isGroupID(userID) else None
+
+            data: UserData = UserData(**fields) if groupRow is None else GroupData(
+                **fields, name=groupRow[0], ownerID=groupRow[1], members=self.loadMembers(connection, userID), invites=self.loadInvites(connection, userID))
+            for name, amount in balances.items(): setattr(data, name, amount)
+
+            rows: list[tuple] = connection.execute(
+                'SELECT amount, description, timestamp, budgetType FROM ledger WHERE userID = ? ORDER BY timestamp, id', (userID,)).fetchall()
+
+            data.ledger = Ledger(((fromCents(amount), description, datetime.fromtimestamp(timestamp)) for amount, description, timestamp, _ in rows),
+                                 (BudgetType(budgetType) if budgetType is not None else None for *_, budgetType in rows))
+            data.dailyRollup = DailyRollup.fromLedger(data.ledger)
+            data.breaks = self.loadBreaks(connection, userID)
+
+            return data
+
+    @contextlib.contextmanager
+    def readTransaction(self, connection: sqlite3.Connection) -> Iterator[None]:
+        # Inside a shared mutation the surrounding transaction already reads a single snapshot
+        if connection.in_transaction:
+            yield
+            return
+
+        connection.execute('BEGIN')
+        try: yield
+        finally: connection.commit()
+
+    def readStoredFields(self, fields: dict[str, Any]) -> dict[str, Any]:
+        for name in self.DATETIME_FIELDS:
+            if fields.get(name) is not None: fields[name] = datetime.fromtimestamp(fields[name])
+
+        for name in self.CENT_FIELDS:
+            if name in fields: fields[name] = fromCents(fields[name])
+
+        return fields
+
+    def createSummary(self, row: tuple) -> UserSummary:
+        return UserSummary(**self.readStoredFields(dict(zip(self.SUMMARY_FIELDS, row))))
+
+    def loadSummaries(self) -> dict[str, UserSummary]:
+        return {userID: self.createSummary(row) for userID, *row in self.connection().execute(f'SELECT userID, {", ".join(self.SUMMARY_FIELDS)} FROM users')}
+
+    def loadSummary(self, userID: str) -> Optional[UserSummary]:
+        row: Optional[tuple] = self.connection().execute(f'SELECT {", ".join(self.SUMMARY_FIELDS)} FROM users WHERE userID = ?', (userID,)).fetchone()
+        return self.createSummary(row) if row is not None else None
+
+    def evictUser(self, userID: str) -> bool:
+        with self.lock:
+            # Records created in this process or changed since the last batch are newer in memory than on disk
+            if userID not in self.versions or self.pendingWrites[userID] > 0: return False
+
+            del self.versions[userID]
+            return self.userData.evict(userID) is not None
+
+    def loadBreaks(self, connection: sqlite3.Connection, userID: str) -> BreakSchedule:
+        return BreakSchedule((datetime.fromtimestamp(start), datetime.fromtimestamp(end)) for start, end in connection.execute(
+            'SELECT start, end FROM breaks WHERE userID = ? ORDER BY start', (userID,)))
+
+    def loadMembers(self, connection: sqlite3.Connection, groupID: str) -> dict[str, MemberContribution]:
+        return {memberID: MemberContribution(spent, added, count, bool(active)) for memberID, spent, added, count, active in connection.execute(
+            'SELECT memberID, spent, added, count, active FROM groupMembers WHERE groupID = ?', (groupID,))}
+
+    def loadInvites(self, connection: sqlite3.Connection, groupID: str) -> set[str]:
+        return {memberID for memberID, in connection.execute('SELECT memberID FROM groupInvites WHERE groupID = ?', (groupID,))}
+
+    def validateCachedUser(self, userID: str) -> None:
+        # Another process may have written this user since it was cached, a changed version means it has to be reloaded
+        # Records created in this process but not written yet have no version and are left alone
+        with self.lock:
+            version: Optional[int] = self.versions.get(userID)
+            if version is None or not dict.__contains__(self.userData, userID): return
+
+            row: Optional[tuple] = self.connection().execute('SELECT version FROM users WHERE userID = ?', (userID,)).fetchone()
+            if row is None or row[0] != version:
+                dict.pop(self.userData, userID, None)
+                self.versions.pop(userID, None)
+
+    @contextlib.contextmanager
+    def sharedMutation(self, userID: str) -> Iterator[None]:
+        depth: int = getattr(self.local, 'mutationDepth', 0)
+        self.local.mutationDepth = depth + 1
+
+        if depth > 0:
+            try: yield
+            finally: self.local.mutationDepth = depth
+            return
+
+        # The write lock is taken before the user is read, so concurrent processes apply their changes to a user one after another
+        connection: sqlite3.Connection = self.connection()
+
+        with self.lock:
+            connection.execute('BEGIN IMMEDIATE')
+
+            try:
+                self.validateCachedUser(userID)
+                yield
+            except BaseException:
+                connection.rollback()
+                dict.pop(self.userData, userID, None)
+                self.versions.pop(userID, None)
+                raise
+            else:
+                connection.commit()
+            finally:
+                self.local.mutationDepth = 0
+
+    def mutationLock(self, userID: str) -> ContextManager:
+        # The local lock keeps idle eviction from paging a record out from under a mutation
+        return self.sharedMutation(userID) if self.shared else self.lock
+
+    def record(self, *operations: tuple) -> None:
+        if self.groupCommit is None:
+            self.writeBatch(list(operations))
+            return
+
+        with self.lock:
+            self.pendingWrites.update(operation[1] for operation in operations)
+            future: Future = self.groupCommit.add(operations)
+
+        if self.durability != 'async': pendingCommits.future = future
+
+    def writeBatch(self, operations: list[tuple]) -> None:
+        connection: sqlite3.Connection = self.connection()
+        start: float = time.perf_counter()
+
+        # Inside a shared mutation the surrounding transaction commits these writes
+        transaction: ContextManager = contextlib.nullcontext() if connection.in_transaction else connection
+        with transaction:
+            for operation in coalesceOperations(operations):
+                self.applyOperation(connection, operation)
+
+            for userID in {operation[1] for operation in operations}:
+                connection.execute('UPDATE users SET version = version + 1 WHERE userID = ?', (userID,))
+                row: Optional[tuple] = connection.execute('SELECT version FROM users WHERE userID = ?', (userID,)).fetchone()
+                if row is not None: self.versions[userID] = row[0]
+
+        if self.groupCommit is not None:
+            with self.lock:
+                for operation in operations:
+                    self.pendingWrites[operation[1]] -= 1
+                    if self.pendingWrites[operation[1]] <= 0: del self.pendingWrites[operation[1]]
+
+        if metrics.METRICS_ENABLED:
+            metrics.observe('budget_bot_persistence_flush_seconds', time.perf_counter() - start, store='sqlite', kind='commit')
+
+    def applyOperation(self, connection: sqlite3.Connection, operation: tuple) -> None:
+        kind, userID, *args = operation
+
+        if kind == 'setup':
+            connection.execute('DELETE FROM ledger WHERE userID = ?', (userID,))
+            connection.execute('DELETE FROM breaks WHERE userID = ?', (userID,))
+            self.writeUser(connection, userID, args[0])
+            if isinstance(args[0], GroupData): self.writeGroup(connection, userID, args[0])
+        elif kind == 'ledger':
+            amount, description, date = args[0]
+            budgetType: Optional[BudgetType] = args[1] if len(args) > 1 else None
+            connection.execute('INSERT INTO ledger (userID, amount, description, timestamp, budgetType) VALUES (?, ?, ?, ?, ?)',
+                               (userID, toCents(amount), description, date.timestamp(), str(budgetType) if budgetType is not None else None))
+        elif kind == 'importLedger':
+            transactions: Ledger = args[0]
+            connection.executemany('INSERT INTO ledger (userID, amount, description, timestamp, budgetType) VALUES (?, ?, ?, ?, ?)',
+                                   ((userID, transactions.amounts[i], description, date.timestamp(), str(transactions.getBudgetType(i)) if transactions.getBudgetType(i) is not None else None)
+                                    for i, (_, description, date) in enumerate(transactions)))
+        elif kind == 'set':
+            name, value = args
+            if name not in self.USER_FIELDS: raise ValueError(f'Unknown user field "{name}"')
+            if isinstance(value, datetime): value = value.timestamp()
+            if name in self.CENT_FIELDS: value = toCents(value)
+            connection.execute(f'UPDATE users SET {name} = ? WHERE userID = ?', (value, userID))
+        elif kind == 'addBreak':
+            # Adding a break can merge several stored ones, a user only has a handful so their rows are rewritten
+            breaks: BreakSchedule = self.loadBreaks(connection, userID)
+            breaks.add(*args[0])
+
+            connection.execute('DELETE FROM breaks WHERE userID = ?', (userID,))
+            connection.executemany('INSERT INTO breaks (userID, start, end) VALUES (?, ?, ?)',
+                                   ((userID, start.timestamp(), end.timestamp()) for start, end in breaks))
+        elif kind == 'removeBreak':
+            connection.execute('DELETE FROM breaks WHERE id = (SELECT id FROM breaks WHERE userID = ? ORDER BY start LIMIT 1 OFFSET ?)', (userID, args[0]))
+        elif kind == 'member':
+            memberID, member = args
+            connection.execute('INSERT OR REPLACE INTO groupMembers (groupID, memberID, spent, added, count, active) VALUES (?, ?, ?, ?, ?, ?)',
+                               (userID, memberID, member.spent, member.added, member.count, member.active))
+        elif kind == 'invite':
+            memberID, invited = args
+            if invited: connection.execute('INSERT OR IGNORE INTO groupInvites (groupID, memberID) VALUES (?, ?)', (userID, memberID))
+            else: connection.execute('DELETE FROM groupInvites WHERE groupID = ? AND memberID = ?', (userID, memberID))
+
+    def close(self) -> None:
+        if self.groupCommit is not None: self.groupCommit.close()
+
+        with self.connectionsLock:
+            for connection in self.connections:
+                connection.close()
+
+            self.connections.clear()
+
+        self.local = threading.local()
@@ -0,0 +1,127 @@
+from storage import JournalStore
+from models import BudgetType, Ledger
+from cache import RenderCache
+from datetime import datetime, timedelta
+from unittest import mock
+import tempfile
+import unittest
+import backend
+import re
+import os
+
+class BackendTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        store: JournalStore = JournalStore(os.path.join(directory.name, 'user_data.pkl'), os.path.join(directory.name, 'user_data.journal'), durability='async')
+        userData = store.open()
+        self.addCleanup(store.close)
+
+        for name, value in (('store', store), ('userData', userData), ('renderCache', RenderCache()), ('userVersions', {}), ('daysInBudgetCache', {})):
+            patcher = mock.patch.object(backend, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+class TransactionHistoryPagesTest(BackendTestCase):
+    ROW_PATTERN: re.Pattern = re.compile(r'\*(row \d+)\*')
+
+    def setUp(self) -> None:
+        super().setUp()
+        backend.setupBudget('u', 0.0, 0.0, 1000.0, datetime.now() + timedelta(days=30))
+
+        for i in range(60):
+            backend.userData['u'].appendTransaction((-1.0, f'row {i:02}', datetime(2024, 1, 1) + timedelta(days=i // 3, hours=i % 3)), BudgetType.USD)
+
+    def getRows(self, page: str) -> list[str]:
+        return self.ROW_PATTERN.findall(page)
+
+    def testPagesFitLimitAndCoverEveryRow(self) -> None:
+        pages: list[tuple[str, bool]] = list(backend.iterUserTransactionHistoryPages('u', pageLimit=400))
+
+        self.assertGreater(len(pages), 1)
+        self.assertTrue(all(len(page) <= 400 for page, _ in pages))
+        self.assertEqual([hasMorePages for _, hasMorePages in pages], [True] * (len(pages) - 1) + [False])
+        self.assertEqual([row for page, _ in pages for row in self.getRows(page)], [f'row {i:02}' for i in range(60)])
+
+    def testSearchRangeIncludesItsLastDay(self) -> None:
+        pages: list[tuple[str, bool]] = list(backend.iterUserTransactionHistoryPages('u', datetime(2024, 1, 2), datetime(2024, 1, 3)))
+        self.assertEqual(self.getRows(pages[0][0]), [f'row {i:02}' for i in range(3, 9)])
+
+    def testEmptySearchRange(self) -> None:
+        pages: list[tuple[str, bool]] = list(backend.iterUserTransactionHistoryPages('u', datetime(2025, 1, 1), datetime(2025, 1, 2)))
+        self.assertEqual(len(pages), 1)
+        self.assertIn('No transactions found for the specified date range.', pages[0][0])
+
+    def testImportWhilePagingNeitherRepeatsNorSkipsRows(self) -> None:
+        pages = backend.iterUserTransactionHistoryPages('u', pageLimit=400)
+        rows: list[str] = self.getRows(next(pages)[0])
+
+        # Rows merged in ahead of the page being shown shift every index after it
+        backend.importTransactions('u', Ledger([(-1.0, f'early {i}', datetime(2023, 12, 1, i)) for i in range(5)], [BudgetType.USD] * 5))
+
+        rows.extend(row for page, _ in pages for row in self.getRows(page))
+        self.assertEqual(rows, [f'row {i:02}' for i in range(60)])
+
+class BudgetReportCacheTest(BackendTestCase):
+    def testMutationInvalidatesCachedReport(self) -> None:
+        backend.setupBudget('u', 0.0, 0.0, 100.0, datetime.now() + timedelta(days=30))
+        self.assertIn('**USD →** $100.00', backend.getUserBudgetReport('u'))
+
+        backend.spend('u', 2.5, 'coffee', BudgetType.USD)
+        report: str = backend.getUserBudgetReport('u')
+
+        self.assertIn('**USD →** $97.50', report)
+        self.assertIn('"*coffee*"', report)
+
+class GroupInviteTest(BackendTestCase):
+    GROUP_ID: str = 'group:1:club'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.assertTrue(backend.setupGroupBudget(self.GROUP_ID, 'club', 'owner', 0.0, 0.0, 100.0, datetime.now() + timedelta(days=30)))
+
+    def testJoiningNeedsAnInvite(self) -> None:
+        self.assertFalse(backend.joinGroup(self.GROUP_ID, 'member'))
+        self.assertFalse(backend.isGroupMember(self.GROUP_ID, 'member'))
+
+        backend.setGroupInvite(self.GROUP_ID, 'member', True)
+        self.assertTrue(backend.joinGroup(self.GROUP_ID, 'member'))
+        self.assertTrue(backend.isGroupMember(self.GROUP_ID, 'member'))
+
+    def testInviteIsUsedUpByJoining(self) -> None:
+        backend.setGroupInvite(self.GROUP_ID, 'member', True)
+        backend.joinGroup(self.GROUP_ID, 'member')
+        backend.setGroupMember(self.GROUP_ID, 'member', False)
+
+        self.assertEqual(backend.userData[self.GROUP_ID].invites, set())
+        self.assertFalse(backend.joinGroup(self.GROUP_ID, 'member'))
+
+    def testWithdrawnInvite(self) -> None:
+        backend.setGroupInvite(self.GROUP_ID, 'member', True)
+        backend.setGroupInvite(self.GROUP_ID, 'member', False)
+        self.assertFalse(backend.joinGroup(self.GROUP_ID, 'member'))
+
+    def testOwnerCanRejoin(self) -> None:
+        backend.setGroupMember(self.GROUP_ID, 'owner', False)
+        self.assertTrue(backend.joinGroup(self.GROUP_ID, 'owner'))
+        self.assertTrue(backend.isGroupOwner(self.GROUP_ID, 'owner'))
+
+    def testExistingGroupIsNotReplaced(self) -> None:
+        self.assertFalse(backend.setupGroupBudget(self.GROUP_ID, 'club', 'someone', 0.0, 0.0, 5.0, datetime.now() + timedelta(days=30)))
+        self.assertEqual(backend.userData[self.GROUP_ID].ownerID, 'owner')
+
+    def testReportFitsInOneMessage(self) -> None:
+        for i in range(60):
+            memberID: str = str(10 ** 18 + i)
+            backend.setGroupInvite(self.GROUP_ID, memberID, True)
+            backend.joinGroup(self.GROUP_ID, memberID)
+            backend.recordGroupTransaction(self.GROUP_ID, memberID, 1.0, 'x' * (300 if i % 7 == 0 else 20), BudgetType.USD, True)
+
+        report: str = backend.getGroupBudgetReport(self.GROUP_ID)
+        self.assertLessEqual(len(report), backend.DISCORD_MESSAGE_LIMIT)
+        self.assertIn('earlier*', report)
+        self.assertIn('more*', report)
+
+if __name__ == '__main__':
+    unittest.main()
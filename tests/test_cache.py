@@ -0,0 +1,59 @@
+from cache import RenderCache, getTextSize
+from models import UserData
+import unittest
+
+class RenderCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cache: RenderCache = RenderCache()
+        self.data: UserData = UserData()
+        self.renders: list[str] = []
+
+    def render(self, text: str):
+        def render() -> str:
+            self.renders.append(text)
+            return text
+
+        return render
+
+    def formatLine(self, index: int) -> str:
+        self.renders.append(f'line {index}')
+        return f'line {index}\n'
+
+    def testFragmentIsReusedUntilVersionChanges(self) -> None:
+        self.assertEqual(self.cache.getFragment('a', self.data, 1, 'report', self.render('first')), 'first')
+        self.assertEqual(self.cache.getFragment('a', self.data, 1, 'report', self.render('second')), 'first')
+        self.assertEqual(self.cache.getFragment('a', self.data, 2, 'report', self.render('third')), 'third')
+        self.assertEqual(self.renders, ['first', 'third'])
+
+    def testLinesSurviveVersionChangeButNotReplacedRecord(self) -> None:
+        self.cache.getLines('a', self.data, 'history', 0, 3, self.formatLine)
+        self.cache.getFragment('a', self.data, 2, 'report', self.render('report'))
+        self.assertEqual(self.cache.getLines('a', self.data, 'history', 1, 4, self.formatLine), ['line 1\n', 'line 2\n', 'line 3\n'])
+        self.assertEqual(self.renders, ['line 0', 'line 1', 'line 2', 'report', 'line 3'])
+
+        # A record loaded again or set up from scratch is a different object, its rows may not line up with the old ones
+        self.cache.getLines('a', UserData(), 'history', 0, 1, self.formatLine)
+        self.assertEqual(self.renders[-1], 'line 0')
+
+    def testInvalidateDropsUserAndItsSize(self) -> None:
+        self.cache.getFragment('a', self.data, 1, 'report', self.render('report'))
+        self.cache.getLines('a', self.data, 'history', 0, 2, self.formatLine)
+        self.assertGreater(self.cache.size, 0)
+
+        self.cache.invalidate('a')
+        self.assertEqual(self.cache.size, 0)
+        self.assertEqual(self.cache.getFragment('a', self.data, 1, 'report', self.render('again')), 'again')
+
+    def testLeastRecentlyUsedUsersAreEvicted(self) -> None:
+        self.cache = RenderCache(maxBytes=2 * getTextSize('x' * 100))
+        users: dict[str, UserData] = {userID: UserData() for userID in 'abc'}
+
+        for userID in 'ab': self.cache.getFragment(userID, users[userID], 1, 'report', self.render('x' * 100))
+        self.cache.getFragment('a', users['a'], 1, 'report', self.render('unused'))
+        self.cache.getFragment('c', users['c'], 1, 'report', self.render('x' * 100))
+
+        self.assertEqual(list(self.cache.users), ['a', 'c'])
+        self.assertLessEqual(self.cache.size, self.cache.maxBytes)
+
+if __name__ == '__main__':
+    unittest.main()
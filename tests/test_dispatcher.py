@@ -0,0 +1,22 @@
+from dispatcher import DISCORD_MESSAGE_LIMIT, splitMessage
+import unittest
+
+class SplitMessageTest(unittest.TestCase):
+    def testShortMessageIsOnePart(self) -> None:
+        self.assertEqual(splitMessage('### Bot Stats\n- a\n'), ['### Bot Stats\n- a\n'])
+
+    def testLongReportSplitsBetweenLines(self) -> None:
+        report: str = ''.join(f'- **/command{i} →** 10 calls, 0 errors, mean `1.0ms`, p99 ≤ `5ms`\n' for i in range(60))
+        parts: list[str] = splitMessage(report)
+
+        self.assertGreater(len(parts), 1)
+        self.assertTrue(all(len(part) <= DISCORD_MESSAGE_LIMIT for part in parts))
+        self.assertTrue(all(part.endswith('\n') for part in parts))
+        self.assertEqual(''.join(parts), report)
+
+    def testOverlongLineIsCut(self) -> None:
+        parts: list[str] = splitMessage('x' * 25 + '\nend\n', limit=10)
+        self.assertEqual(parts, ['x' * 10, 'x' * 10, 'x' * 5 + '\nend\n'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+from importer import ColumnMapping, ImportFileError, readImportFile
+from models import BudgetType, UserData
+from datetime import datetime, timedelta
+import tempfile
+import unittest
+import gzip
+import csv
+import os
+
+MAPPING: ColumnMapping = ColumnMapping(defaultBudgetType=BudgetType.USD)
+
+class ReadImportFileTest(unittest.TestCase):
+    def writeFile(self, suffix: str, content: bytes) -> str:
+        file = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+        file.write(content)
+        file.close()
+        self.addCleanup(os.remove, file.name)
+        return file.name
+
+    def testReadsCSV(self) -> None:
+        path: str = self.writeFile('.csv', b'Date,Description,Amount\n2024-01-02,Coffee,-2.50\n')
+        transactions = readImportFile(path, 'export.csv', MAPPING)
+        self.assertEqual(len(transactions), 1)
+
+    def testTruncatedGzip(self) -> None:
+        content: bytes = gzip.compress(b'Date,Description,Amount\n' + b'2024-01-02,Coffee,-2.50\n' * 1000)
+        path: str = self.writeFile('.csv.gz', content[:len(content) // 2])
+
+        with self.assertRaisesRegex(ImportFileError, 'could not be read'):
+            readImportFile(path, 'export.csv.gz', MAPPING)
+
+    def testNotGzip(self) -> None:
+        path: str = self.writeFile('.csv.gz', b'Date,Description,Amount\n')
+
+        with self.assertRaisesRegex(ImportFileError, 'could not be read'):
+            readImportFile(path, 'export.csv.gz', MAPPING)
+
+    def testOversizedField(self) -> None:
+        path: str = self.writeFile('.csv', b'Date,Description,Amount\n2024-01-02,"' + b'x' * (csv.field_size_limit() + 1) + b'",-2.50\n')
+
+        with self.assertRaisesRegex(ImportFileError, 'not valid CSV'):
+            readImportFile(path, 'export.csv', MAPPING)
+
+    def testNotUTF8(self) -> None:
+        path: str = self.writeFile('.csv', 'Date,Description,Amount\n2024-01-02,Café,-2.50\n'.encode('latin-1'))
+
+        with self.assertRaisesRegex(ImportFileError, 'not UTF-8'):
+            readImportFile(path, 'export.csv', MAPPING)
+
+    def testFutureDatedRowIsRejected(self) -> None:
+        path: str = self.writeFile('.csv', b'Date,Description,Amount\n2024-01-02,Coffee,-2.50\n2030-01-01,Rent,-900\n')
+
+        with self.assertRaisesRegex(ImportFileError, r'Row 3: .*in the future'):
+            readImportFile(path, 'export.csv', MAPPING)
+
+    def testLedgerStaysSortedAfterImportAndSpend(self) -> None:
+        yesterday: datetime = datetime.now() - timedelta(days=1)
+        path: str = self.writeFile('.csv', f'Date,Description,Amount\n{yesterday.strftime("%Y-%m-%d %H:%M")},Coffee,-2.50\n'.encode())
+
+        data: UserData = UserData()
+        data.mergeTransactions(readImportFile(path, 'export.csv', MAPPING))
+        data.appendTransaction((-1.0, 'Tea', datetime.now()), BudgetType.USD)
+
+        self.assertEqual(list(data.ledger.timestamps), sorted(data.ledger.timestamps))
+        today: datetime = datetime.combine(datetime.now().date(), datetime.min.time())
+        self.assertEqual([description for _, description, _ in data.ledger[slice(*data.ledger.indexRange(today))]], ['Tea'])
+
+if __name__ == '__main__':
+    unittest.main()
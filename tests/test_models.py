@@ -0,0 +1,137 @@
+from models import BreakSchedule, BudgetType, Ledger, SearchIndex, UserData
+from datetime import datetime, date
+import unittest
+
+class BreakScheduleTest(unittest.TestCase):
+    def testOverlappingBreaksAreMerged(self) -> None:
+        breaks: BreakSchedule = BreakSchedule([(datetime(2024, 3, 1), datetime(2024, 3, 5))])
+        merged: tuple[datetime, datetime] = breaks.add(datetime(2024, 3, 4), datetime(2024, 3, 10))
+
+        self.assertEqual(merged, (datetime(2024, 3, 1), datetime(2024, 3, 10)))
+        self.assertEqual(breaks, [(datetime(2024, 3, 1), datetime(2024, 3, 10))])
+
+    def testBreaksOnConsecutiveDaysAreMerged(self) -> None:
+        breaks: BreakSchedule = BreakSchedule([(datetime(2024, 3, 1), datetime(2024, 3, 5)), (datetime(2024, 3, 6), datetime(2024, 3, 8))])
+        self.assertEqual(breaks, [(datetime(2024, 3, 1), datetime(2024, 3, 8))])
+
+    def testBreakSpanningSeveralIsMergedIntoOne(self) -> None:
+        breaks: BreakSchedule = BreakSchedule([(datetime(2024, 3, 1), datetime(2024, 3, 2)),
+                                               (datetime(2024, 3, 10), datetime(2024, 3, 12)),
+                                               (datetime(2024, 3, 20), datetime(2024, 3, 22))])
+        breaks.add(datetime(2024, 2, 28), datetime(2024, 3, 11))
+
+        self.assertEqual(breaks, [(datetime(2024, 2, 28), datetime(2024, 3, 12)), (datetime(2024, 3, 20), datetime(2024, 3, 22))])
+
+    def testSeparateBreaksStaySortedByStart(self) -> None:
+        breaks: BreakSchedule = BreakSchedule([(datetime(2024, 4, 1), datetime(2024, 4, 3)), (datetime(2024, 3, 1), datetime(2024, 3, 3))])
+        self.assertEqual(breaks, [(datetime(2024, 3, 1), datetime(2024, 3, 3)), (datetime(2024, 4, 1), datetime(2024, 4, 3))])
+
+    def testUpcomingIncludesBreakInProgress(self) -> None:
+        breaks: BreakSchedule = BreakSchedule([(datetime(2024, 3, 1), datetime(2024, 3, 3)), (datetime(2024, 3, 10), datetime(2024, 3, 12))])
+
+        self.assertEqual(breaks.upcoming(date(2024, 3, 3)), list(breaks))
+        self.assertEqual(breaks.upcoming(date(2024, 3, 4)), [(datetime(2024, 3, 10), datetime(2024, 3, 12))])
+        self.assertEqual(breaks.upcoming(date(2024, 3, 13)), [])
+
+    def testPopChangesVersion(self) -> None:
+        breaks: BreakSchedule = BreakSchedule([(datetime(2024, 3, 1), datetime(2024, 3, 3))])
+        version: int = breaks.version
+
+        self.assertEqual(breaks.pop(0), (datetime(2024, 3, 1), datetime(2024, 3, 3)))
+        self.assertEqual(len(breaks), 0)
+        self.assertNotEqual(breaks.version, version)
+
+class LedgerIndexRangeTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.ledger: Ledger = Ledger([(-1.0, f'row {i}', datetime(2024, 1, 1 + i // 2, 12 * (i % 2))) for i in range(6)])
+
+    def testStartIsInclusiveAndEndExclusive(self) -> None:
+        self.assertEqual(self.ledger.indexRange(datetime(2024, 1, 2), datetime(2024, 1, 3)), (2, 4))
+        self.assertEqual(self.ledger.indexRange(datetime(2024, 1, 2, 12), datetime(2024, 1, 2, 12)), (3, 3))
+
+    def testOpenEndedRanges(self) -> None:
+        self.assertEqual(self.ledger.indexRange(), (0, 6))
+        self.assertEqual(self.ledger.indexRange(datetime(2024, 1, 3)), (4, 6))
+        self.assertEqual(self.ledger.indexRange(end=datetime(2024, 1, 2)), (0, 2))
+
+    def testRangesOutsideTheLedgerAreEmpty(self) -> None:
+        self.assertEqual(self.ledger.indexRange(datetime(2023, 1, 1), datetime(2023, 12, 31)), (0, 0))
+        self.assertEqual(self.ledger.indexRange(datetime(2025, 1, 1), datetime(2025, 2, 1)), (6, 6))
+        self.assertEqual(Ledger().indexRange(datetime(2024, 1, 1), datetime(2024, 1, 2)), (0, 0))
+
+class LedgerMergeTest(unittest.TestCase):
+    def getDescriptions(self, ledger: Ledger) -> list[str]:
+        return [description for _, description, _ in ledger]
+
+    def testMergeInterleavesByTime(self) -> None:
+        ledger: Ledger = Ledger([(-1.0, 'a', datetime(2024, 1, 1)), (-2.0, 'c', datetime(2024, 1, 3))], [BudgetType.USD] * 2)
+        ledger.merge(Ledger([(-4.0, 'b', datetime(2024, 1, 2)), (-8.0, 'd', datetime(2024, 1, 3))], [BudgetType.USD] * 2))
+
+        # Existing transactions go first when timestamps tie
+        self.assertEqual(self.getDescriptions(ledger), ['a', 'b', 'c', 'd'])
+        self.assertEqual(list(ledger.amounts), [-100, -400, -200, -800])
+        self.assertEqual(ledger.getTotal(BudgetType.USD), -1500)
+
+    def testMergeAfterLastTransactionAppends(self) -> None:
+        ledger: Ledger = Ledger([(-1.0, 'a', datetime(2024, 1, 1))], [BudgetType.USD])
+        ledger.merge(Ledger([(-2.0, 'a', datetime(2024, 1, 2))], [BudgetType.TIGER_BUCKS]))
+
+        self.assertEqual(self.getDescriptions(ledger), ['a', 'a'])
+        self.assertEqual(ledger.descriptions, ['a'])
+        self.assertEqual((ledger.getTotal(BudgetType.USD), ledger.getTotal(BudgetType.TIGER_BUCKS)), (-100, -200))
+
+    def testSortedByTimeIsStable(self) -> None:
+        ledger: Ledger = Ledger([(-1.0, 'late', datetime(2024, 1, 3)), (-1.0, 'first', datetime(2024, 1, 1)), (-1.0, 'second', datetime(2024, 1, 1))])
+
+        self.assertEqual(self.getDescriptions(ledger.sortedByTime()), ['first', 'second', 'late'])
+        sortedLedger: Ledger = ledger.sortedByTime()
+        self.assertIs(sortedLedger.sortedByTime(), sortedLedger)
+
+    def testUnsortedImportKeepsLedgerSorted(self) -> None:
+        # Statements often list the newest transaction first
+        data: UserData = UserData()
+        for day in (1, 4):
+            data.appendTransaction((-1.0, f'spent {day}', datetime(2024, 1, day)), BudgetType.USD)
+        data.getDailyRollup()
+
+        imported: Ledger = Ledger([(-1.0, f'imported {day}', datetime(2024, 1, day, 12)) for day in (5, 3, 2)], [BudgetType.USD] * 3)
+        data.mergeTransactions(imported.sortedByTime())
+
+        self.assertEqual(list(data.ledger.timestamps), sorted(data.ledger.timestamps))
+        self.assertEqual(self.getDescriptions(data.ledger), ['spent 1', 'imported 2', 'imported 3', 'spent 4', 'imported 5'])
+        self.assertEqual(data.getDailyRollup().getDay(date(2024, 1, 3)).firstOffset, 2)
+        self.assertEqual(data.ledger.indexRange(datetime(2024, 1, 2), datetime(2024, 1, 4)), (1, 3))
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.ledger: Ledger = Ledger([(-4.5, 'Starbucks Coffee', datetime(2024, 1, 1)),
+                                      (-12.0, 'Wegmans groceries', datetime(2024, 1, 2)),
+                                      (-3.25, 'starbucks coffee', datetime(2024, 1, 3)),
+                                      (20.0, 'Coffee refund', datetime(2024, 1, 4)),
+                                      (-5.0, 'Starbucks Coffee', datetime(2024, 1, 5))])
+        self.index: SearchIndex = SearchIndex.fromLedger(self.ledger)
+
+    def testTermsMatchTokenPrefixesIgnoringCase(self) -> None:
+        self.assertEqual(self.index.search(self.ledger, ['star'], 0, len(self.ledger)), [0, 2, 4])
+        self.assertEqual(self.index.search(self.ledger, ['coff'], 0, len(self.ledger)), [0, 2, 3, 4])
+        self.assertEqual(self.index.search(self.ledger, ['tea'], 0, len(self.ledger)), [])
+
+    def testEveryTermMustMatch(self) -> None:
+        self.assertEqual(self.index.search(self.ledger, ['coffee', 'refund'], 0, len(self.ledger)), [3])
+        self.assertEqual(self.index.search(self.ledger, ['coffee', 'wegmans'], 0, len(self.ledger)), [])
+
+    def testRowRangeAndAmountBounds(self) -> None:
+        self.assertEqual(self.index.search(self.ledger, ['coffee'], 1, 4), [2, 3])
+        # Amounts are compared without their sign
+        self.assertEqual(self.index.search(self.ledger, ['coffee'], 0, len(self.ledger), minAmount=450, maxAmount=2000), [0, 3, 4])
+
+    def testIndexFollowsAppendedTransactions(self) -> None:
+        data: UserData = UserData(ledger=self.ledger)
+        data.getSearchIndex()
+        data.appendTransaction((-2.0, 'Tim Hortons coffee', datetime(2024, 1, 6)), BudgetType.USD)
+
+        self.assertEqual(data.getSearchIndex().search(data.ledger, ['hort'], 0, len(data.ledger)), [5])
+        self.assertEqual(data.getSearchIndex().search(data.ledger, ['coffee'], 0, len(data.ledger)), [0, 2, 3, 4, 5])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+from storage import GroupCommit, JournalStore, SQLiteStore, TransactionJournal
+from unittest import mock
+from models import BudgetType, GroupData, UserData
+from datetime import datetime
+import tempfile
+import threading
+import unittest
+import sqlite3
+import os
+
+class JournalStorePagingTest(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.snapshotPath: str = os.path.join(directory.name, 'user_data.pkl')
+        self.journalPath: str = os.path.join(directory.name, 'user_data.journal')
+
+    def openStore(self) -> JournalStore:
+        store: JournalStore = JournalStore(self.snapshotPath, self.journalPath, durability='async')
+        store.open()
+        return store
+
+    def spend(self, store: JournalStore, userID: str, amount: float, description: str) -> None:
+        transaction: tuple[float, str, datetime] = (-amount, description, datetime(2024, 1, 2))
+        store.userData[userID].appendTransaction(transaction, BudgetType.USD)
+        store.record(('ledger', userID, transaction, BudgetType.USD))
+
+    def testEvictedUsersAreReadFromSnapshot(self) -> None:
+        store: JournalStore = self.openStore()
+        for userID in ('a', 'b'):
+            store.userData[userID] = UserData()
+            store.record(('setup', userID, UserData()))
+            self.spend(store, userID, 2.5, f'{userID} coffee')
+
+        store.compact(wait=True)
+        self.assertTrue(store.evictUser('a'))
+        self.assertNotIn('a', store.userBlobs)
+        self.assertEqual(store.userData['a'].ledger[0][1], 'a coffee')
+
+        # A user changed since the snapshot stays in memory only until the next snapshot is written
+        self.spend(store, 'b', 1.0, 'b tea')
+        self.assertTrue(store.evictUser('b'))
+        self.assertIn('b', store.userBlobs)
+
+        store.compact(wait=True)
+        self.assertEqual(store.userBlobs, {})
+        self.assertEqual(len(store.userData['b'].ledger), 2)
+        store.close()
+
+        store = self.openStore()
+        self.assertEqual(store.userBlobs, {})
+        self.assertEqual(set(store.userPages), {'a', 'b'})
+        self.assertEqual(store.userData['b'].ledger[1][1], 'b tea')
+        store.close()
+
+    def testUserChangedBeforeSnapshotIsWritten(self) -> None:
+        store: JournalStore = self.openStore()
+        store.userData['a'] = UserData()
+        store.record(('setup', 'a', UserData()))
+        self.spend(store, 'a', 2.5, 'coffee')
+
+        # The snapshot is taken but its records are not pickled until it is written
+        with mock.patch.object(store.journal, 'writePendingSnapshot'):
+            store.compact()
+            self.assertIn('a', store.snapshotUsers)
+
+            with store.mutationLock('a'): self.spend(store, 'a', 1.0, 'tea')
+            self.assertNotIn('a', store.snapshotUsers)
+
+        store.journal.writePendingSnapshot()
+        store.close()
+
+        store = self.openStore()
+        self.assertEqual([transaction[1] for transaction in store.userData['a'].ledger], ['coffee', 'tea'])
+        store.close()
+
+class JournalSyncTest(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        self.journal: TransactionJournal = TransactionJournal(os.path.join(directory.name, 'user_data.pkl'), os.path.join(directory.name, 'user_data.journal'))
+        self.journal.file = open(self.journal.journalPath, 'ab')
+        self.addCleanup(self.journal.file.close)
+
+    def testFailedFsyncLeavesJournalDirty(self) -> None:
+        self.journal.record(('set', 'a', 'dailyBudget', 1.0))
+
+        with mock.patch('os.fsync', side_effect=OSError('disk full')), self.assertRaises(OSError):
+            self.journal.sync()
+
+        self.assertTrue(self.journal.dirty)
+        self.journal.sync()
+        self.assertFalse(self.journal.dirty)
+
+    def testFailedBatchIsRetried(self) -> None:
+        groupCommit: GroupCommit = GroupCommit('journal-commit', lambda operations: self.journal.sync())
+        self.journal.record(('set', 'a', 'dailyBudget', 1.0))
+        failed = groupCommit.add()
+
+        with mock.patch('os.fsync', side_effect=OSError('disk full')):
+            groupCommit.flush()
+
+        self.assertIsInstance(failed.exception(), OSError)
+        self.assertEqual(groupCommit.mutations, 1)
+
+        retried = groupCommit.future
+        groupCommit.flush()
+        self.assertIsNone(retried.result())
+        self.assertFalse(self.journal.dirty)
+
+class SQLiteStoreCentsTest(unittest.TestCase):
+    # The tables as they were when money was stored as REAL dollars
+    DOLLAR_SCHEMA: str = (
+        'CREATE TABLE users ('
+        '    userID TEXT PRIMARY KEY,'
+        '    startingDiningDollars REAL NOT NULL, startingTigerBucks REAL NOT NULL, startingUSD REAL NOT NULL,'
+        '    diningDollars REAL NOT NULL, tigerBucks REAL NOT NULL, USD REAL NOT NULL,'
+        '    budgetDate REAL, dailyBudget REAL NOT NULL);'
+        'CREATE TABLE ledger ('
+        '    id INTEGER PRIMARY KEY, userID TEXT NOT NULL, amount REAL NOT NULL, description TEXT NOT NULL, timestamp REAL NOT NULL);')
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path: str = os.path.join(directory.name, 'user_data.db')
+
+    def testDollarColumnsAreConvertedToCents(self) -> None:
+        connection: sqlite3.Connection = sqlite3.connect(self.path)
+        connection.executescript(self.DOLLAR_SCHEMA)
+        connection.execute('INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', ('a', 100.0, 0.0, 20.1, 97.45, 0.0, 20.1, None, 3.33))
+        connection.execute('INSERT INTO ledger VALUES (?, ?, ?, ?, ?)', (1, 'a', -2.55, 'coffee', datetime(2024, 1, 2).timestamp()))
+        connection.commit()
+        connection.close()
+
+        store: SQLiteStore = SQLiteStore(self.path, durability='async')
+        store.open()
+        self.addCleanup(store.close)
+
+        connection = store.connection()
+        self.assertEqual(connection.execute('SELECT diningDollars, USD, dailyBudget FROM users').fetchone(), (9745, 2010, 3.33))
+        self.assertEqual(connection.execute('SELECT typeof(amount), amount FROM ledger').fetchone(), ('integer', -255))
+        self.assertIsNotNone(connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'ledgerUserTimestamp'").fetchone())
+
+        data: UserData = store.userData['a']
+        self.assertEqual((data.diningDollars, data.dailyBudget, data.ledger[0][0]), (97.45, 3.33, -2.55))
+        self.assertEqual(data.getBalanceOffset(), 0)
+
+    def testCentDailyBudgetIsConvertedToDollars(self) -> None:
+        store: SQLiteStore = SQLiteStore(self.path, durability='async')
+        connection: sqlite3.Connection = sqlite3.connect(self.path)
+        connection.executescript(store.SCHEMA.replace('dailyBudget REAL', 'dailyBudget INTEGER'))
+        connection.execute('INSERT INTO users (userID, startingDiningDollars, startingTigerBucks, startingUSD, diningDollars, tigerBucks, USD, dailyBudget) '
+                           'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', ('a', 10000, 0, 2010, 9745, 0, 2010, 333))
+        connection.commit()
+        connection.close()
+
+        store.open()
+        self.addCleanup(store.close)
+
+        connection = store.connection()
+        self.assertEqual(connection.execute('SELECT typeof(dailyBudget), dailyBudget, diningDollars FROM users').fetchone(), ('real', 3.33, 9745))
+        self.assertEqual(store.userData['a'].dailyBudget, 3.33)
+
+class SQLiteStoreGroupTest(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path: str = os.path.join(directory.name, 'user_data.db')
+
+    def testInvitesAreSavedAndWithdrawn(self) -> None:
+        store: SQLiteStore = SQLiteStore(self.path, durability='async')
+        store.open()
+        store.record(('setup', 'group:1:club', GroupData(name='club', ownerID='owner')),
+                     ('invite', 'group:1:club', 'a', True), ('invite', 'group:1:club', 'b', True), ('invite', 'group:1:club', 'a', False))
+        store.close()
+
+        store = SQLiteStore(self.path, durability='async')
+        store.open()
+        self.addCleanup(store.close)
+
+        data: GroupData = store.userData['group:1:club']
+        self.assertEqual((data.ownerID, data.invites), ('owner', {'b'}))
+
+class SQLiteStoreOpenTest(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory: str = directory.name
+
+    def testConcurrentOpensImportOnce(self) -> None:
+        journal: JournalStore = JournalStore(os.path.join(self.directory, 'user_data.pkl'), os.path.join(self.directory, 'user_data.journal'), durability='async')
+        journal.open()
+        journal.userData['a'] = UserData()
+        journal.record(('setup', 'a', UserData()))
+        for i in range(50):
+            transaction: tuple[float, str, datetime] = (-1.0, f'row {i}', datetime(2024, 1, 2))
+            journal.userData['a'].appendTransaction(transaction, BudgetType.USD)
+            journal.record(('ledger', 'a', transaction, BudgetType.USD))
+        journal.close()
+
+        path: str = os.path.join(self.directory, 'user_data.db')
+        stores: list[SQLiteStore] = [SQLiteStore(path, migrateFrom=JournalStore(journal.journal.snapshotPath, journal.journal.journalPath), shared=True)
+                                     for _ in range(8)]
+        errors: list[Exception] = []
+
+        def openStore(store: SQLiteStore) -> None:
+            try:
+                store.open()
+            except Exception as error:
+                errors.append(error)
+
+        threads: list[threading.Thread] = [threading.Thread(target=openStore, args=(store,)) for store in stores]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(stores[0].connection().execute('SELECT COUNT(*) FROM ledger').fetchone(), (50,))
+        for store in stores: store.close()
+
+if __name__ == '__main__':
+    unittest.main()
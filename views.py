@@ -0,0 +1,94 @@
+from models import BudgetType
+from datetime import datetime
+from typing import Iterator
+import dispatcher
+import discord
+import backend
+
+class BudgetTypeSelector(discord.ui.Select):
+    def __init__(self, userID: str, amount: float, description: str, spending: bool = True) -> None:
+        options: list = [
+            discord.SelectOption(label='Dining Dollars', value=str(BudgetType.DINING_DOLLARS)),
+            discord.SelectOption(label='Tiger Bucks', value=str(BudgetType.TIGER_BUCKS)),
+            discord.SelectOption(label='USD', value=str(BudgetType.USD))]
+        
+        super().__init__(placeholder='Select which type of money you spent...', options=options, min_values=1, max_values=1)
+
+        self.userID: str = userID
+        self.amount: float = amount
+        self.description: str = description
+        self.spending: bool = spending
+
+    async def callback(self, interaction: discord.Interaction) -> None:
+        budgetType: BudgetType = BudgetType(self.values[0])
+
+        if self.spending:
+            await dispatcher.runForInteraction(interaction, self.userID, backend.spend, self.userID, self.amount, self.description, budgetType)
+            await dispatcher.respond(interaction, f'Spent **${self.amount:.2f}** on "*{self.description}*" using `{budgetType.getPrettyString()}`.', ephemeral=True)
+        else:
+            await dispatcher.runForInteraction(interaction, self.userID, backend.add, self.userID, self.amount, self.description, budgetType)
+            await dispatcher.respond(interaction, f'Added **${self.amount:.2f}** to your `{budgetType.getPrettyString()}` budget for "*{self.description}*".', ephemeral=True)
+
+class BudgetTypeSelectorView(discord.ui.View):
+    def __init__(self, userID: str, amount: float, description: str, spending: bool = True) -> None:
+        super().__init__(timeout=60.0)
+        self.add_item(BudgetTypeSelector(userID, amount, description, spending))
+
+class TransactionHistoryPaginatorView(discord.ui.View):
+    def __init__(self, userID: str, pages: Iterator[tuple[str, bool]], firstPage: str, hasMorePages: bool) -> None:
+        super().__init__(timeout=300.0)
+
+        self.userID: str = userID
+        self.pageIterator: Iterator[tuple[str, bool]] = pages
+        self.pages: list[str] = [firstPage]
+        self.hasMorePages: bool = hasMorePages
+        self.pageIndex: int = 0
+
+        self.updateButtons()
+
+    def getContent(self) -> str:
+        isLastPage: bool = not self.hasMorePages and self.pageIndex + 1 == len(self.pages)
+        return f'{self.pages[self.pageIndex]}-# Page {self.pageIndex + 1}{" (last)" if isLastPage else ""}'
+
+    def updateButtons(self) -> None:
+        self.previousButton.disabled = self.pageIndex == 0
+        self.nextButton.disabled = self.pageIndex + 1 == len(self.pages) and not self.hasMorePages
+
+    @discord.ui.button(label='Previous', style=discord.ButtonStyle.secondary)
+    async def previousButton(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        self.pageIndex = max(0, self.pageIndex - 1)
+        self.updateButtons()
+        await interaction.response.edit_message(content=self.getContent(), view=self)
+
+    @discord.ui.button(label='Next', style=discord.ButtonStyle.secondary)
+    async def nextButton(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        # Pages past the furthest one viewed are only formatted when asked for
+        if self.pageIndex + 1 == len(self.pages) and self.hasMorePages:
+            page, self.hasMorePages = await dispatcher.runForUser(self.userID, next, self.pageIterator)
+            self.pages.append(page)
+
+        self.pageIndex = min(len(self.pages) - 1, self.pageIndex + 1)
+        self.updateButtons()
+        await interaction.response.edit_message(content=self.getContent(), view=self)
+
+class BreakRemovalSelector(discord.ui.Select):
+    def __init__(self, userID: str, breaks: list[tuple[datetime, datetime]]) -> None:
+        # The breaks are read by the command through the dispatcher, so building the options never touches user data on the event loop
+        options: list[tuple[datetime, datetime]] = []
+        for i, brk in enumerate(breaks):
+            breakStart, breakEnd = brk
+            options.append(discord.SelectOption(label=f'{breakStart.strftime('%B %d, %Y')} to {breakEnd.strftime('%B %d, %Y')}', value=i))
+        
+        super().__init__(placeholder='Select a break to remove...', options=options, min_values=1, max_values=1) # dont set max_value to more than 1, the backend's remove break uses .pop(index), popping one index shifts the rest
+
+        self.userID: str = userID
+
+    async def callback(self, interaction: discord.Interaction) -> None:
+        index: int = int(self.values[0])
+        removedBreak: tuple[datetime, datetime] = await dispatcher.runForInteraction(interaction, self.userID, backend.removeBreak, self.userID, index)
+        await dispatcher.respond(interaction, f'Removed break from `{removedBreak[0].strftime('%A, %B %d, %Y')}` to `{removedBreak[1].strftime('%A, %B %d, %Y')}`.', ephemeral=True)
+
+class BreakRemovalSelectorView(discord.ui.View):
+    def __init__(self, userID: str, breaks: list[tuple[datetime, datetime]]) -> None:
+        super().__init__(timeout=60.0)
+        self.add_item(BreakRemovalSelector(userID, breaks))